@@ -3,21 +3,56 @@ Dreamina 账户管理器
 管理多账户积分、自动选择可用账户
 """
 
-import json
 import os
+import json
+import time
+import uuid
+import random
+import asyncio
 import threading
-import requests
+import httpx
 from datetime import datetime, date, timezone, timedelta
 from typing import Optional, Dict, List
 
+from db_manager import get_db
+from event_bus import event_bus
+from http_clients import http_clients
+
 # UTC+8 时区（北京时间）
 UTC_PLUS_8 = timezone(timedelta(hours=8))
 
+# 账户积分保存在 data.db 的 accounts 表，accounts.json 只在首次迁移时导入
 ACCOUNTS_FILE = "accounts.json"
 MIN_CREDITS = 4  # 最低积分要求（1K图片需要4积分）
 
-# 文件锁，防止并发写入冲突
-_accounts_file_lock = threading.Lock()
+# 账户选择策略 -> (部分索引, 排序)，索引见 db_migrations，选择查询用 INDEXED BY 固定走对应索引
+#   most_credits: 可用积分最多的优先
+#   round_robin:  最久未被选中的优先，轮流使用
+#   least_loaded: 进行中请求最少的优先，相同时可用积分多的优先
+# 积分按可用积分（credits - reserved，扣除进行中请求的预留）计算
+SELECTION_POLICIES = {
+    "most_credits": ("idx_accounts_pick_available", "credits - reserved DESC, id"),
+    "round_robin": ("idx_accounts_pick_round_robin", "last_picked_ms, id"),
+    "least_loaded": ("idx_accounts_pick_least_loaded_available", "in_flight, credits - reserved DESC, id"),
+}
+ACCOUNT_POLICY = os.getenv("ADMIN_ACCOUNT_POLICY", "round_robin")
+
+# token 失效的账户暂停选择的时间（秒）
+ACCOUNT_COOLDOWN = int(os.getenv("ADMIN_ACCOUNT_COOLDOWN", "600"))
+
+# 积分预留租约的有效期（秒），需长于最长的生成时间（生成请求超时为 20 分钟）
+LEASE_TTL = int(os.getenv("ADMIN_LEASE_TTL", "1500"))
+
+# 积分查询 / 领取接口（jimeng-api）
+TOKEN_API_URL = "http://127.0.0.1:5100"
+
+# 批量刷新积分的并发请求数和单个请求的超时（秒，包含查询和领取）
+REFRESH_CONCURRENCY = int(os.getenv("ADMIN_REFRESH_CONCURRENCY", "8"))
+REFRESH_TIMEOUT = float(os.getenv("ADMIN_REFRESH_TIMEOUT", "45"))
+# 批量刷新时每次积分查询请求包含的 token 数（/token/points 支持逗号分隔的多个 token）
+POINTS_BATCH_SIZE = int(os.getenv("ADMIN_POINTS_BATCH_SIZE", "20"))
+# 每日重置后的积分刷新在这么多秒内随机错开
+DAILY_REFRESH_JITTER = float(os.getenv("ADMIN_DAILY_REFRESH_JITTER", "300"))
 
 # Dreamina API 配置
 DREAMINA_API = {
@@ -33,6 +68,19 @@ DREAMINA_API = {
     },
 }
 
+# 各地区 Dreamina 网页接口地址（未带地区前缀的 token 为国内账户）
+REGION_BASE_URLS = {
+    "us": "https://dreamina-api.us.capcut.com",
+    "hk": "https://mweb-api-sg.capcut.com",
+    "jp": "https://mweb-api-sg.capcut.com",
+    "sg": "https://mweb-api-sg.capcut.com",
+    "cn": "https://jimeng-api.jianying.com",
+}
+
+# .env 账户配置缓存（path 为 None 表示尚未加载）
+_env_lock = threading.Lock()
+_env_cache = {"path": None, "stamp": None, "accounts": {}}
+
 # 导入代理配置（自动判断本机或局域网）
 from proxy_config import PROXY_HOST
 
@@ -50,33 +98,116 @@ def get_proxy_dict():
     return None
 
 
+# 账户表字段（与 accounts.json 中每个账户的字段一致）
+ACCOUNT_COLUMNS = ("credits", "gift_credit", "purchase_credit", "vip_credit", "email", "region", "token", "last_update")
+
+
+def _upsert_account(conn, account_id: int, info: dict):
+    """写入或覆盖一个账户"""
+    values = [info.get(column) for column in ACCOUNT_COLUMNS]
+    for i in range(4):
+        values[i] = values[i] or 0
+    conn.execute(f"""
+        INSERT INTO accounts (id, {", ".join(ACCOUNT_COLUMNS)})
+        VALUES (?, {", ".join("?" * len(ACCOUNT_COLUMNS))})
+        ON CONFLICT (id) DO UPDATE SET
+            {", ".join(f"{column} = excluded.{column}" for column in ACCOUNT_COLUMNS)}
+    """, [account_id] + values)
+
+
+def _set_meta(conn, key: str, value: str):
+    conn.execute("""
+        INSERT INTO account_meta (key, value) VALUES (?, ?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value
+    """, (key, value))
+
+
+def import_accounts_json(conn, path: str = ACCOUNTS_FILE) -> int:
+    """
+    把 accounts.json 导入 accounts 表（迁移时执行一次，在调用方事务中）
+
+    Returns:
+        导入的账户数
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    accounts = data.get("accounts", {})
+    for account_id, info in accounts.items():
+        _upsert_account(conn, int(account_id), info)
+    if data.get("last_reset_date"):
+        _set_meta(conn, "last_reset_date", data["last_reset_date"])
+
+    print(f"[账户管理] 已从 {path} 导入 {len(accounts)} 个账户")
+    return len(accounts)
+
+
 def load_accounts() -> dict:
-    """加载账户数据（线程安全）"""
-    with _accounts_file_lock:
-        if not os.path.exists(ACCOUNTS_FILE):
-            return {"accounts": {}, "last_reset_date": ""}
-        
-        with open(ACCOUNTS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+    """以 accounts.json 的结构读取全部账户（兼容旧调用方）"""
+    with get_db() as conn:
+        rows = conn.execute(f"SELECT id, {', '.join(ACCOUNT_COLUMNS)} FROM accounts ORDER BY id").fetchall()
+        meta = conn.execute("SELECT value FROM account_meta WHERE key = 'last_reset_date'").fetchone()
+
+    return {
+        "accounts": {str(row["id"]): {column: row[column] for column in ACCOUNT_COLUMNS} for row in rows},
+        "last_reset_date": meta[0] if meta else "",
+    }
 
 
 def save_accounts(data: dict):
-    """保存账户数据（线程安全）"""
-    with _accounts_file_lock:
-        with open(ACCOUNTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    """按 accounts.json 的结构写入账户（逐行覆盖，兼容旧调用方）"""
+    with get_db() as conn:
+        for account_id, info in data.get("accounts", {}).items():
+            _upsert_account(conn, int(account_id), info)
+        if "last_reset_date" in data:
+            _set_meta(conn, "last_reset_date", data["last_reset_date"])
+
+
+def mark_new_day() -> Optional[str]:
+    """
+    把 last_reset_date 更新为 UTC+8 的今天
 
+    条件更新保证多进程下只有一个进程会成功
 
-def check_and_reset_daily(data: dict) -> dict:
-    """检查是否需要每日重置（基于 UTC+8 时区）"""
+    Returns:
+        本次完成更新时返回今天的日期，已是今天时返回 None
+    """
     today = datetime.now(UTC_PLUS_8).date().isoformat()
-    
-    if data.get("last_reset_date") != today:
-        print(f"[账户管理] 新的一天 ({today})，标记需要刷新积分")
-        data["last_reset_date"] = today
-        save_accounts(data)
-    
-    return data
+    with get_db() as conn:
+        row = conn.execute("SELECT value FROM account_meta WHERE key = 'last_reset_date'").fetchone()
+        if row is not None and row[0] == today:
+            return None
+        changed = conn.execute("""
+            INSERT INTO account_meta (key, value) VALUES ('last_reset_date', ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+            WHERE value IS NOT excluded.value
+        """, (today,)).rowcount
+    return today if changed else None
+
+
+async def daily_rollover(jitter: float = None, concurrency: int = None) -> Optional[dict]:
+    """
+    每日重置（UTC+8 零点由管理后台的定时任务调用，启动时补执行一次）
+
+    新的一天由本进程标记成功后，刷新所有账户积分（积分为 0 的会领取每日积分）；
+    各批请求在 jitter 秒内随机错开，避免零点同时打满 jimeng-api
+
+    Returns:
+        刷新汇总，今天已重置过时返回 None
+    """
+    today = await asyncio.to_thread(mark_new_day)
+    if today is None:
+        return None
+
+    jitter = DAILY_REFRESH_JITTER if jitter is None else jitter
+    print(f"[账户管理] 新的一天 ({today})，{jitter:g}s 内分批刷新积分")
+    summary = None
+    async for event in iter_refresh_all_credits(concurrency, jitter=jitter):
+        if event["event"] == "done":
+            summary = {key: value for key, value in event.items() if key != "results"}
+    return summary
 
 
 def parse_token(token: str) -> tuple:
@@ -88,27 +219,44 @@ def parse_token(token: str) -> tuple:
     return "cn", token
 
 
+def _parse_credits_item(item: dict, key: str) -> dict:
+    """解析 /token/points（key=points）或 /token/receive（key=credits）响应中单个 token 的一项"""
+    credits = item.get(key) or {}
+    return {
+        "gift_credit": credits.get("giftCredit", 0),
+        "purchase_credit": credits.get("purchaseCredit", 0),
+        "vip_credit": credits.get("vipCredit", 0),
+        "total": credits.get("totalCredit", 0),
+        "valid": True,
+    }
+
+
+def _parse_credits(data, key: str) -> dict:
+    """解析单 token 请求的响应"""
+    if isinstance(data, list) and len(data) > 0:
+        return _parse_credits_item(data[0], key)
+    return {"total": 0, "valid": False}
+
+
 def get_credits_from_api(token: str) -> dict:
-    """从 jimeng-api 获取账户积分"""
+    """
+    从 jimeng-api 获取账户积分
+
+    无法连接或超时时返回 unreachable=True（不能说明 token 失效）
+    """
     try:
-        resp = requests.post(
-            "http://127.0.0.1:5100/token/points",
+        resp = http_clients.get_sync(TOKEN_API_URL).post(
+            "/token/points",
             headers={"Authorization": f"Bearer {token}"},
             json={},
             timeout=30,
         )
         
         if resp.status_code == 200:
-            data = resp.json()
-            if isinstance(data, list) and len(data) > 0:
-                points = data[0].get("points", {})
-                return {
-                    "gift_credit": points.get("giftCredit", 0),
-                    "purchase_credit": points.get("purchaseCredit", 0),
-                    "vip_credit": points.get("vipCredit", 0),
-                    "total": points.get("totalCredit", 0),
-                    "valid": True,
-                }
+            return _parse_credits(resp.json(), "points")
+    except httpx.TransportError as e:
+        print(f"[API] 获取积分失败，无法连接 jimeng-api: {e}")
+        return {"total": 0, "valid": False, "unreachable": True}
     except Exception as e:
         print(f"[API] 获取积分失败: {e}")
     
@@ -118,44 +266,60 @@ def get_credits_from_api(token: str) -> dict:
 def receive_credits_from_api(token: str) -> dict:
     """从 jimeng-api 领取每日积分"""
     try:
-        resp = requests.post(
-            "http://127.0.0.1:5100/token/receive",
+        resp = http_clients.get_sync(TOKEN_API_URL).post(
+            "/token/receive",
             headers={"Authorization": f"Bearer {token}"},
             json={},
             timeout=60,
         )
         
         if resp.status_code == 200:
-            data = resp.json()
-            if isinstance(data, list) and len(data) > 0:
-                credits = data[0].get("credits", {})
-                return {
-                    "gift_credit": credits.get("giftCredit", 0),
-                    "purchase_credit": credits.get("purchaseCredit", 0),
-                    "vip_credit": credits.get("vipCredit", 0),
-                    "total": credits.get("totalCredit", 0),
-                    "valid": True,
-                }
+            return _parse_credits(resp.json(), "credits")
     except Exception as e:
         print(f"[API] 领取积分失败: {e}")
     
     return {"total": 0, "valid": False}
 
 
-def update_account_credits(account_id: int, token: str, email: str = None) -> int:
+def _publish_credits(account_id: int, credits: int, reason: str, change: int = None):
+    """推送账户积分变化（reason: refresh / usage / manual）"""
+    data = {"id": account_id, "credits": credits, "reason": reason}
+    if change is not None:
+        data["change"] = change
+    event_bus.publish("credits", data)
+
+
+def _apply_credits(conn, account_id: int, token: str, credits_info: dict, email: str = None):
+    """把查询到的积分写入账户并解除冷却（在调用方事务中）"""
+    region, _ = parse_token(token)
+    _upsert_account(conn, account_id, {
+        "credits": credits_info.get("total", 0),
+        "gift_credit": credits_info.get("gift_credit", 0),
+        "purchase_credit": credits_info.get("purchase_credit", 0),
+        "vip_credit": credits_info.get("vip_credit", 0),
+        "email": email,
+        "region": region,
+        "last_update": datetime.now().isoformat(),
+        "token": token[:25] + "..."
+    })
+    conn.execute("UPDATE accounts SET disabled_until_ms = 0 WHERE id = ?", (account_id,))
+
+
+def update_account_credits(account_id: int, token: str, email: str = None) -> Optional[int]:
     """
     更新账户积分
     
     Returns:
-        积分数量，如果 token 无效返回 -1
+        积分数量，如果 token 无效返回 -1（账户进入冷却），无法连接 jimeng-api 时返回 None（账户保持原状）
     """
-    data = load_accounts()
-    data = check_and_reset_daily(data)
-    
     credits_info = get_credits_from_api(token)
     
+    if credits_info.get("unreachable"):
+        print(f"[账户 {account_id}] 无法连接 jimeng-api，积分未更新")
+        return None
     if not credits_info.get("valid"):
         print(f"[账户 {account_id}] Token 无效或查询失败")
+        disable_account(account_id)
         return -1
     
     # 如果积分为 0，尝试领取每日积分
@@ -169,131 +333,536 @@ def update_account_credits(account_id: int, token: str, email: str = None) -> in
             print(f"[账户 {account_id}] 领取失败或无可领取积分")
     
     credits = credits_info.get("total", 0)
-    region, _ = parse_token(token)
     
     # 更新账户信息
-    data["accounts"][str(account_id)] = {
-        "credits": credits,
-        "gift_credit": credits_info.get("gift_credit", 0),
-        "purchase_credit": credits_info.get("purchase_credit", 0),
-        "vip_credit": credits_info.get("vip_credit", 0),
-        "email": email,
-        "region": region,
-        "last_update": datetime.now().isoformat(),
-        "token": token[:25] + "..."
-    }
-    save_accounts(data)
+    with get_db() as conn:
+        _apply_credits(conn, account_id, token, credits_info, email)
+    _publish_credits(account_id, credits, "refresh")
     print(f"[账户 {account_id}] 积分: {credits} (赠送:{credits_info.get('gift_credit', 0)}, 购买:{credits_info.get('purchase_credit', 0)}, VIP:{credits_info.get('vip_credit', 0)})")
     return credits
 
 
-def get_available_account(exclude: set = None, min_credits: int = None) -> Optional[int]:
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _pick_account(conn, exclude: set, min_credits: int, policy: str) -> Optional[int]:
+    """按策略选出可用积分（credits - reserved）满足要求的账户，不修改状态"""
+    if policy not in SELECTION_POLICIES:
+        raise ValueError(f"未知的账户选择策略: {policy}，可选 {', '.join(SELECTION_POLICIES)}")
+
+    index, order_by = SELECTION_POLICIES[policy]
+    # credits >= MIN_CREDITS 与部分索引的条件一致，必须保留
+    where = f"credits >= {MIN_CREDITS} AND credits - reserved >= ? AND disabled_until_ms <= ?"
+    params = [min_credits, _now_ms()]
+    if exclude:
+        where += f" AND id NOT IN ({', '.join('?' * len(exclude))})"
+        params += [int(acc_id) for acc_id in exclude]
+
+    row = conn.execute(f"""
+        SELECT id FROM accounts INDEXED BY {index}
+        WHERE {where}
+        ORDER BY {order_by}
+        LIMIT 1
+    """, params).fetchone()
+    return row[0] if row else None
+
+
+def get_available_account(exclude: set = None, min_credits: int = None, policy: str = None) -> Optional[int]:
     """
-    获取一个可用的账户
+    获取一个可用的账户（不预留积分，并发生成请使用 reserve_credits）
     
     Args:
         exclude: 要排除的账户ID集合
-        min_credits: 最低积分要求，默认使用 MIN_CREDITS
+        min_credits: 最低可用积分（credits - reserved）要求，默认使用 MIN_CREDITS；
+            积分低于 MIN_CREDITS 的账户始终不参与选择（与部分索引的条件一致）
+        policy: 选择策略（most_credits / round_robin / least_loaded），默认 ACCOUNT_POLICY
     """
-    data = load_accounts()
-    data = check_and_reset_daily(data)
-    exclude = exclude or set()
-    min_credits = min_credits or MIN_CREDITS
-
-    for account_id, info in data.get("accounts", {}).items():
-        acc_id = int(account_id)
-        if acc_id in exclude:
-            continue
-        credits = info.get("credits", 0)
-        if credits >= min_credits:
-            return acc_id
+    if min_credits is None:
+        min_credits = MIN_CREDITS
+
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        account_id = _pick_account(conn, exclude or set(), min_credits, policy or ACCOUNT_POLICY)
+        if account_id is not None:
+            conn.execute("UPDATE accounts SET last_picked_ms = ? WHERE id = ?", (_now_ms(), account_id))
+        return account_id
+
+
+# ============ 积分预留 ============
+
+def _release_rows(conn, leases) -> int:
+    """撤销一组租约的预留（在调用方事务中），leases 为 (account_id, amount) 序列"""
+    released = 0
+    for account_id, amount in leases:
+        conn.execute("""
+            UPDATE accounts
+            SET reserved = MAX(0, reserved - ?), in_flight = MAX(0, in_flight - 1)
+            WHERE id = ?
+        """, (amount, account_id))
+        released += 1
+    return released
+
+
+def expire_leases(conn=None) -> int:
+    """释放所有已超时的租约，返回释放数量"""
+    if conn is None:
+        with get_db() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return expire_leases(conn)
+
+    expired = conn.execute(
+        "DELETE FROM account_leases WHERE expires_ms <= ? RETURNING account_id, amount",
+        (_now_ms(),),
+    ).fetchall()
+    if expired:
+        print(f"[账户管理] {len(expired)} 个积分预留已超时释放")
+    return _release_rows(conn, expired)
+
+
+def reserve_credits(
+    amount: int,
+    exclude: set = None,
+    account_id: int = None,
+    policy: str = None,
+    ttl: int = None,
+    env_account: dict = None,
+) -> Optional[dict]:
+    """
+    选择账户并原子地预留积分
 
-    return None
+    同一事务内完成选择、预留和记录租约，多进程并发时不会把同一份积分分给两个请求。
+    生成结束后调用 commit_lease 扣除实际消耗，或 release_lease 撤销；
+    进程崩溃等未结束的租约在 ttl 秒后由 expire_leases 自动释放
+
+    Args:
+        amount: 预计消耗的积分
+        exclude: 要排除的账户ID集合
+        account_id: 指定账户（不检查可用积分；.env 中有但账户表中还没有的账户会先写入账户表）
+        policy: 选择策略，默认 ACCOUNT_POLICY
+        ttl: 租约有效期（秒），默认 LEASE_TTL
+        env_account: 指定账户在 .env 中的配置（调用方已读取时传入），不传时在开启事务前读取
+
+    Returns:
+        租约 {"lease_id", "account_id", "amount", "expires_ms"}，没有可用账户或指定的账户不存在时返回 None
+    """
+    now = _now_ms()
+    expires_ms = now + (LEASE_TTL if ttl is None else ttl) * 1000
+    # .env 可能需要重新读取，不能放在持有写锁的事务中
+    if account_id is not None and env_account is None:
+        env_account = get_env_accounts().get(account_id)
+
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        expire_leases(conn)
+
+        if account_id is None:
+            min_credits = max(amount, MIN_CREDITS)
+            account_id = _pick_account(conn, exclude or set(), min_credits, policy or ACCOUNT_POLICY)
+            if account_id is None:
+                return None
+
+        reserve_sql = """
+            UPDATE accounts
+            SET reserved = reserved + ?, in_flight = in_flight + 1, last_picked_ms = ?
+            WHERE id = ?
+        """
+        updated = conn.execute(reserve_sql, (amount, now, account_id)).rowcount
+        if not updated:
+            # 指定的账户在 .env 中但还没有写入账户表（尚未刷新过积分），先补一条记录
+            if env_account is None:
+                return None
+            conn.execute(
+                "INSERT OR IGNORE INTO accounts (id, region, token) VALUES (?, ?, ?)",
+                (account_id, env_account["region"], env_account["token"][:25] + "..."),
+            )
+            conn.execute(reserve_sql, (amount, now, account_id))
+
+        lease_id = uuid.uuid4().hex
+        conn.execute("""
+            INSERT INTO account_leases (lease_id, account_id, amount, created_ms, expires_ms)
+            VALUES (?, ?, ?, ?, ?)
+        """, (lease_id, account_id, amount, now, expires_ms))
+
+    return {"lease_id": lease_id, "account_id": account_id, "amount": amount, "expires_ms": expires_ms}
+
+
+def commit_lease(lease: dict, actual_cost: int) -> bool:
+    """
+    结束租约并扣除实际消耗的积分
+
+    租约已超时释放时仍会扣除实际消耗（生成已经发生）
+
+    Returns:
+        租约是否仍然有效
+    """
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "DELETE FROM account_leases WHERE lease_id = ? RETURNING account_id, amount",
+            (lease["lease_id"],),
+        ).fetchone()
+        if row:
+            _release_rows(conn, [row])
+        remaining = None
+        if actual_cost:
+            remaining = conn.execute("""
+                UPDATE accounts SET credits = MAX(0, credits - ?), last_update = ?
+                WHERE id = ?
+                RETURNING credits
+            """, (actual_cost, datetime.now().isoformat(), lease["account_id"])).fetchone()
+    if remaining is not None:
+        _publish_credits(lease["account_id"], remaining[0], "usage", -actual_cost)
+    return row is not None
+
+
+def release_lease(lease: dict) -> bool:
+    """
+    撤销租约，不扣积分（已提交或已超时的租约不做任何事）
+
+    Returns:
+        是否撤销了有效租约
+    """
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "DELETE FROM account_leases WHERE lease_id = ? RETURNING account_id, amount",
+            (lease["lease_id"],),
+        ).fetchone()
+        if row:
+            _release_rows(conn, [row])
+    return row is not None
+
+
+def disable_account(account_id: int, seconds: int = None):
+    """账户异常（如 token 失效），在冷却期内不参与选择"""
+    seconds = ACCOUNT_COOLDOWN if seconds is None else seconds
+    with get_db() as conn:
+        conn.execute(
+            "UPDATE accounts SET disabled_until_ms = ? WHERE id = ?",
+            (_now_ms() + seconds * 1000, account_id),
+        )
 
 
 def deduct_credits(account_id: int, amount: int = 4):
     """扣除账户积分"""
-    data = load_accounts()
-    
-    account_key = str(account_id)
-    if account_key in data.get("accounts", {}):
-        current = data["accounts"][account_key].get("credits", 0)
-        data["accounts"][account_key]["credits"] = max(0, current - amount)
-        data["accounts"][account_key]["last_update"] = datetime.now().isoformat()
-        save_accounts(data)
-        print(f"[账户 {account_id}] 扣除 {amount} 积分，剩余: {data['accounts'][account_key]['credits']}")
+    with get_db() as conn:
+        row = conn.execute("""
+            UPDATE accounts
+            SET credits = MAX(0, credits - ?), last_update = ?
+            WHERE id = ?
+            RETURNING credits
+        """, (amount, datetime.now().isoformat(), account_id)).fetchone()
+    if row is None:
+        return
+    remaining = row[0]
+    _publish_credits(account_id, remaining, "usage", -amount)
+    print(f"[账户 {account_id}] 扣除 {amount} 积分，剩余: {remaining}")
 
 
 def set_account_credits(account_id: int, credits: int):
     """设置账户积分"""
-    data = load_accounts()
-    
-    account_key = str(account_id)
-    if account_key in data.get("accounts", {}):
-        data["accounts"][account_key]["credits"] = credits
-        data["accounts"][account_key]["last_update"] = datetime.now().isoformat()
-        save_accounts(data)
-        print(f"[账户 {account_id}] 积分设置为: {credits}")
+    with get_db() as conn:
+        updated = conn.execute(
+            "UPDATE accounts SET credits = ?, last_update = ? WHERE id = ?",
+            (credits, datetime.now().isoformat(), account_id),
+        ).rowcount
+    if not updated:
+        return
+    _publish_credits(account_id, credits, "manual")
+    print(f"[账户 {account_id}] 积分设置为: {credits}")
+
+
+def _account_from_row(row, now: int) -> dict:
+    if row["disabled_until_ms"] > now:
+        status = "disabled"
+    elif row["credits"] - row["reserved"] >= MIN_CREDITS:
+        status = "available"
+    else:
+        status = "low_credits"
+    return {
+        "id": row["id"],
+        "credits": row["credits"],
+        "gift_credit": row["gift_credit"],
+        "purchase_credit": row["purchase_credit"],
+        "vip_credit": row["vip_credit"],
+        "email": row["email"],
+        "region": row["region"] or "us",
+        "last_update": row["last_update"] or "",
+        "in_flight": row["in_flight"],
+        "reserved": row["reserved"],
+        "status": status,
+    }
+
+
+_ACCOUNT_SELECT = f"SELECT id, {', '.join(ACCOUNT_COLUMNS)}, in_flight, reserved, disabled_until_ms FROM accounts"
 
 
 def list_accounts() -> List[dict]:
     """列出所有账户状态"""
-    data = load_accounts()
-    data = check_and_reset_daily(data)
+    with get_db() as conn:
+        rows = conn.execute(f"{_ACCOUNT_SELECT} ORDER BY id").fetchall()
     
-    accounts = []
-    for account_id, info in data.get("accounts", {}).items():
-        accounts.append({
-            "id": int(account_id),
-            "credits": info.get("credits", 0),
-            "gift_credit": info.get("gift_credit", 0),
-            "purchase_credit": info.get("purchase_credit", 0),
-            "vip_credit": info.get("vip_credit", 0),
-            "email": info.get("email", ""),
-            "region": info.get("region", "us"),
-            "last_update": info.get("last_update", ""),
-            "status": "available" if info.get("credits", 0) >= MIN_CREDITS else "low_credits",
-        })
-    
-    return sorted(accounts, key=lambda x: x["id"])
+    now = _now_ms()
+    return [_account_from_row(row, now) for row in rows]
 
 
-def get_env_accounts() -> Dict[int, dict]:
-    """从 .env 获取所有账户配置"""
-    from dotenv import load_dotenv
-    load_dotenv(override=True)
-    
-    accounts = {}
-    # 扫描 1-100 范围内的账户
-    for i in range(1, 101):
-        token = os.getenv(f"JIMENG_TOKEN_{i}")
-        if token:
-            region, _ = parse_token(token)
-            accounts[i] = {"token": token, "region": region}
-    
+def get_account(account_id: int) -> Optional[dict]:
+    """单个账户状态（字段同 list_accounts），不存在时返回 None"""
+    with get_db() as conn:
+        row = conn.execute(f"{_ACCOUNT_SELECT} WHERE id = ?", (account_id,)).fetchone()
+    return _account_from_row(row, _now_ms()) if row else None
+
+
+def _env_file_stamp(path: str) -> Optional[tuple]:
+    """.env 文件的 (inode, mtime_ns, size)，文件不存在时为 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _env_account_record(token: str) -> dict:
+    """解析 token，预先计算账户的地区、sessionid 和 Dreamina 接口地址"""
+    region, sessionid = parse_token(token)
+    return {
+        "token": token,
+        "region": region,
+        "sessionid": sessionid,
+        "base_url": REGION_BASE_URLS.get(region, REGION_BASE_URLS["us"]),
+    }
+
+
+def reload_env_accounts() -> Dict[int, dict]:
+    """重新读取 .env 并重建账户配置缓存"""
+    from dotenv import find_dotenv, load_dotenv
+
+    with _env_lock:
+        path = find_dotenv()
+        stamp = _env_file_stamp(path) if path else None
+        if path:
+            load_dotenv(path, override=True)
+
+        accounts = {}
+        # 扫描 1-100 范围内的账户
+        for i in range(1, 101):
+            token = os.getenv(f"JIMENG_TOKEN_{i}")
+            if token:
+                accounts[i] = _env_account_record(token)
+
+        _env_cache.update(path=path, stamp=stamp, accounts=accounts)
+    print(f"[账户管理] 已加载 .env 账户配置: {len(accounts)} 个账户")
     return accounts
 
 
-def refresh_all_credits():
-    """刷新所有账户的积分"""
+def get_env_accounts() -> Dict[int, dict]:
+    """
+    从 .env 获取所有账户配置（只读，不要修改返回值）
+
+    结果缓存在内存中，.env 的 inode / mtime / 大小变化时自动重新读取；
+    文件被原子替换或编辑后无需重启，也可调用 reload_env_accounts 强制重新读取
+
+    Returns:
+        {账户ID: {"token", "region", "sessionid", "base_url"}}
+    """
+    path = _env_cache["path"]
+    if path is not None and _env_file_stamp(path) == _env_cache["stamp"]:
+        return _env_cache["accounts"]
+    return reload_env_accounts()
+
+
+async def _post_tokens(client, path: str, tokens: List[str], timeout: float) -> list:
+    """
+    一次请求查询多个 token（Authorization 为逗号分隔的 token 列表），按顺序返回每个 token 的响应项
+
+    jimeng-api 用 Promise.all 处理，其中任何一个 token 出错整个请求都会失败
+    """
+    resp = await client.post(
+        path,
+        headers={"Authorization": "Bearer " + ",".join(tokens)},
+        json={},
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    if not isinstance(data, list) or len(data) != len(tokens):
+        raise ValueError(f"批量响应数量不匹配: 请求 {len(tokens)} 个 token")
+    return data
+
+
+async def _fetch_credits_batch(client, tokens: List[str], timeout: float) -> List[dict]:
+    """批量查询一组 token 的积分，积分为 0 的再批量领取每日积分"""
+    items = await _post_tokens(client, "/token/points", tokens, timeout)
+    credits_infos = [_parse_credits_item(item, "points") for item in items]
+
+    empty = [i for i, credits_info in enumerate(credits_infos) if credits_info["total"] == 0]
+    if empty:
+        try:
+            received = await _post_tokens(client, "/token/receive", [tokens[i] for i in empty], timeout)
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"[API] 领取积分失败: {e}")
+        else:
+            for i, item in zip(empty, received):
+                receive_result = _parse_credits_item(item, "credits")
+                if receive_result["total"] > 0:
+                    receive_result["received"] = True
+                    credits_infos[i] = receive_result
+    return credits_infos
+
+
+def _apply_refresh_results(env_accounts: Dict[int, dict], results: List[dict]):
+    """
+    一次事务写入全部刷新结果：有效账户更新积分，失效账户进入冷却
+
+    jimeng-api 无法连接时不能说明 token 失效，这些账户保持原状
+    """
+    disabled_until = _now_ms() + ACCOUNT_COOLDOWN * 1000
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for result in results:
+            account_id = result["id"]
+            if result.get("unreachable"):
+                continue
+            if result["valid"]:
+                _apply_credits(conn, account_id, env_accounts[account_id]["token"], result["credits_info"])
+            else:
+                conn.execute(
+                    "UPDATE accounts SET disabled_until_ms = ? WHERE id = ?",
+                    (disabled_until, account_id),
+                )
+    for result in results:
+        if result["valid"] and not result.get("unreachable"):
+            _publish_credits(result["id"], result["credits"], "refresh")
+
+
+async def iter_refresh_all_credits(
+    concurrency: int = None,
+    timeout: float = None,
+    batch_size: int = None,
+    jitter: float = 0,
+    account_ids: list = None,
+):
+    """
+    刷新所有账户的积分，按完成顺序逐个产出进度
+
+    账户按 batch_size 个一组，每组一次多 token 请求；同时进行的请求不超过 concurrency 个，
+    每个请求受 timeout 秒限制。整组失败时（一个 token 出错会让整组失败）改为逐个查询，
+    只有出错的账户记为失效。jitter > 0 时每批在 [0, jitter) 秒内随机延后开始。全部完成（或调用方中途停止）后一次性写入数据库
+
+    account_ids 指定时只刷新其中在 .env 中配置了 token 的账户
+
+    Yields:
+        {"event": "progress", "done", "total", "id", "credits", "valid", "error", "unreachable"}，
+        最后为 {"event": "done", "total", "valid", "invalid", "unreachable", "requests", "elapsed", "results"}
+    """
+    concurrency = concurrency or REFRESH_CONCURRENCY
+    timeout = timeout or REFRESH_TIMEOUT
+    batch_size = batch_size or POINTS_BATCH_SIZE
     env_accounts = get_env_accounts()
-    
+    if account_ids is not None:
+        env_accounts = {account_id: env_accounts[account_id] for account_id in account_ids if account_id in env_accounts}
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    request_count = 0
+
+    async def fetch(client, tokens: List[str]) -> List[tuple]:
+        """返回每个 token 的 (积分信息, 错误, jimeng-api 是否无法连接)"""
+        nonlocal request_count
+        try:
+            # 每个请求（包括整组失败后的逐个查询）各占一个并发名额
+            async with semaphore:
+                request_count += 1
+                credits_infos = await asyncio.wait_for(_fetch_credits_batch(client, tokens, timeout), timeout)
+            return [(credits_info, None, False) for credits_info in credits_infos]
+        except asyncio.TimeoutError:
+            error = f"超时 ({timeout:g}s)"
+        except httpx.HTTPStatusError as e:
+            error = f"HTTP {e.response.status_code}"
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            # 服务不可用，逐个重试也没有意义
+            return [({"total": 0, "valid": False}, f"无法连接 jimeng-api: {e}", True)] * len(tokens)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        if len(tokens) == 1:
+            return [({"total": 0, "valid": False}, error, False)]
+        print(f"[账户管理] {len(tokens)} 个账户的批量查询失败（{error}），改为逐个查询")
+        outcomes = await asyncio.gather(*(fetch(client, [token]) for token in tokens))
+        return [outcome[0] for outcome in outcomes]
+
+    async def refresh_batch(client, batch: List[tuple]) -> List[dict]:
+        if jitter > 0:
+            await asyncio.sleep(random.uniform(0, jitter))
+        outcomes = await fetch(client, [token for _, token in batch])
+        results = []
+        for (account_id, _), (credits_info, error, unreachable) in zip(batch, outcomes):
+            valid = credits_info.get("valid", False)
+            results.append({
+                "id": account_id,
+                "credits": credits_info.get("total", 0) if valid else -1,
+                "valid": valid,
+                "error": error,
+                "unreachable": unreachable,
+                "credits_info": credits_info,
+            })
+        return results
+
+    accounts = [(account_id, config["token"]) for account_id, config in env_accounts.items()]
+    batches = [accounts[i:i + batch_size] for i in range(0, len(accounts), batch_size)]
+
     results = []
-    for account_id, config in env_accounts.items():
-        print(f"刷新账户 {account_id}...")
-        credits = update_account_credits(
-            account_id=account_id,
-            token=config["token"],
-        )
-        results.append({
-            "id": account_id,
-            "credits": credits,
-            "valid": credits >= 0,
-        })
-    
+    client = http_clients.get(TOKEN_API_URL)
+    pending = [asyncio.create_task(refresh_batch(client, batch)) for batch in batches]
+    try:
+        for future in asyncio.as_completed(pending):
+            for result in await future:
+                results.append(result)
+                yield {
+                    "event": "progress",
+                    "done": len(results),
+                    "total": len(accounts),
+                    **{key: result[key] for key in ("id", "credits", "valid", "error", "unreachable")},
+                }
+    finally:
+        # 调用方中途停止迭代（如客户端断开）时取消未完成的请求，已取得的结果仍然写入
+        for task in pending:
+            task.cancel()
+        if results:
+            await asyncio.shield(asyncio.to_thread(_apply_refresh_results, env_accounts, list(results)))
+
+    results.sort(key=lambda result: result["id"])
+    valid_count = sum(1 for result in results if result["valid"])
+    unreachable_count = sum(1 for result in results if result["unreachable"])
+    invalid_count = len(results) - valid_count - unreachable_count
+    elapsed = time.perf_counter() - start
+    print(f"[账户管理] 刷新 {len(results)} 个账户积分完成: 有效 {valid_count}，失效 {invalid_count}，"
+          f"无法连接 {unreachable_count}，积分查询请求 {request_count} 次，用时 {elapsed:.1f}s")
+    yield {
+        "event": "done",
+        "total": len(results),
+        "valid": valid_count,
+        "invalid": invalid_count,
+        "unreachable": unreachable_count,
+        "requests": request_count,
+        "elapsed": round(elapsed, 3),
+        "results": [{key: result[key] for key in ("id", "credits", "valid", "error")} for result in results],
+    }
+
+
+async def refresh_all_credits_async(concurrency: int = None, timeout: float = None) -> List[dict]:
+    """并发刷新所有账户的积分，返回 [{"id", "credits", "valid", "error"}]"""
+    results = []
+    async for event in iter_refresh_all_credits(concurrency, timeout):
+        if event["event"] == "done":
+            results = event["results"]
     return results
 
 
+def refresh_all_credits() -> List[dict]:
+    """刷新所有账户的积分（同步入口，供命令行使用）"""
+    return asyncio.run(refresh_all_credits_async())
+
+
 def print_accounts():
     """打印所有账户信息"""
     accounts = list_accounts()
@@ -330,9 +899,25 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Dreamina 账户管理器")
     parser.add_argument("--list", "-l", action="store_true", help="列出所有账户")
     parser.add_argument("--refresh", "-r", action="store_true", help="刷新所有账户积分")
+    parser.add_argument("--concurrency", type=int, default=None, help=f"刷新并发数（默认 {REFRESH_CONCURRENCY}）")
+    parser.add_argument("--import-json", metavar="PATH", help="从 accounts.json 重新导入账户（覆盖同 ID 账户）")
     args = parser.parse_args()
     
+    from db_migrations import run_migrations
+    with get_db() as conn:
+        run_migrations(conn)
+    
+    if args.import_json:
+        with get_db() as conn:
+            import_accounts_json(conn, args.import_json)
+    
     if args.refresh:
-        refresh_all_credits()
+        async def _refresh():
+            async for event in iter_refresh_all_credits(args.concurrency):
+                if event["event"] == "progress":
+                    state = event["credits"] if event["valid"] else (event["error"] or "无效")
+                    print(f"[{event['done']}/{event['total']}] 账户 {event['id']}: {state}")
+        
+        asyncio.run(_refresh())
     
     print_accounts()
@@ -7,35 +7,111 @@ import os
 import json
 import asyncio
 import sqlite3
-from datetime import datetime
-from fastapi import FastAPI, HTTPException
+import httpx
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 from dotenv import load_dotenv
 
 from account_manager import (
     list_accounts,
-    refresh_all_credits,
+    refresh_all_credits_async,
+    iter_refresh_all_credits,
     update_account_credits,
     get_env_accounts,
-    get_credits_from_api,
+    reload_env_accounts,
+    daily_rollover,
+    UTC_PLUS_8,
     parse_token,
-    get_available_account,
 )
+from data_export import EXPORT_FORMATS, export_filename, export_media_type, iter_export
+from db_manager import (
+    get_db,
+    init_pool,
+    close_pool,
+    get_async_db,
+    db_read,
+    db_write,
+    fetch_all,
+    fetch_one,
+    write_queue,
+)
+from db_migrations import run_migrations
+from metrics import loop_lag_monitor
+from http_clients import http_clients
+from scheduler import scheduler
+from credits_cache import credits_cache
+from concurrency_limiter import DEFAULT_PRIORITY, PRIORITIES, concurrency_limiter
+from event_bus import EVENT_TOPICS, event_bus, iter_sse
+from generation_jobs import JIMENG_API_URL, JOB_MAX_DURATION, job_queue
+from pagination import keyset_page, count_cache
+from task_stats import extend_stats_days, load_summary as load_task_stats_summary, load_range_summary, summary_delta
+from task_rollups import (
+    COMPACT_INTERVAL as ROLLUP_COMPACT_INTERVAL,
+    DIMENSIONS as ROLLUP_DIMENSIONS,
+    align_range,
+    compact_rollups,
+    query_timeseries,
+)
+from task_search import match_filter, search_tasks
+from timeutil import STATS_TZ, now_ms, parse_time_param
 
 load_dotenv()
 
+
+async def compact_rollups_job():
+    """压缩任务汇总小时桶"""
+    result = await db_write(compact_rollups)
+    if result["days_recomputed"] or result["late_deltas"]:
+        print(f"[汇总] 压缩完成: {result}")
+
+
+async def extend_stats_days_job():
+    """补齐按日计数的自然日边界"""
+    if await db_write(extend_stats_days):
+        print("[统计] 统计时区已变更，计数表已按新时区重建")
+
+
+# 定时任务：汇总压缩（启动时立即执行一次）、每日重置（启动时补上停机期间错过的一次）、按日计数的日期边界
+scheduler.every("rollup_compact", ROLLUP_COMPACT_INTERVAL, compact_rollups_job)
+scheduler.daily("daily_rollover", daily_rollover, tz=UTC_PLUS_8, run_at_start=True)
+scheduler.daily("stats_days", extend_stats_days_job, tz=STATS_TZ, run_at_start=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时建立连接池、异步访问层和 HTTP 客户端，关闭时释放"""
+    init_pool()
+    get_async_db()
+    write_queue.start()
+    loop_lag_monitor.start()
+    event_bus.bind()
+    event_bus.install_signal_hook()
+    http_clients.get(JIMENG_API_URL)
+    scheduler.start()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await scheduler.stop()
+    await credits_cache.stop()
+    await loop_lag_monitor.stop()
+    await http_clients.close()
+    event_bus.unbind()
+    # 关闭前把未提交的写入全部落盘
+    await write_queue.close()
+    close_pool()
+
+
 app = FastAPI(
     title="Dreamina 管理后台",
     description="Dreamina 账户管理、积分查询、任务记录",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
-# 数据库文件
-DB_FILE = "data.db"
-
 # Dreamina API 配置
 DREAMINA_API = {
     "us": {
@@ -50,55 +126,89 @@ from proxy_config import PROXY_HOST
 PROXY = f"{PROXY_HOST}:7897"
 
 
-def get_db():
-    """获取数据库连接"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
 def init_db():
-    """初始化数据库"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # 任务记录表
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id TEXT UNIQUE,
-            account_id INTEGER,
-            task_type TEXT,
-            prompt TEXT,
-            status TEXT DEFAULT 'pending',
-            result_url TEXT,
-            credits_used INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    # 积分记录表
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS credit_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            account_id INTEGER,
-            change_amount INTEGER,
-            change_type TEXT,
-            balance_after INTEGER,
-            description TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    conn.commit()
-    conn.close()
+    """初始化数据库（执行未应用的迁移）"""
+    with get_db() as conn:
+        run_migrations(conn)
 
 
 # 初始化数据库
 init_db()
 
 
+def time_range_clauses(from_: Optional[str], to: Optional[str]) -> tuple:
+    """把 from/to 查询参数解析为 created_ms 范围条件 [from, to)"""
+    try:
+        start = parse_time_param(from_)
+        end = parse_time_param(to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    clauses = []
+    params = []
+    if start is not None:
+        clauses.append("created_ms >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("created_ms < ?")
+        params.append(end)
+    return clauses, params
+
+
+def task_filters(
+    status: Optional[str],
+    task_type: Optional[str],
+    account_id: Optional[int],
+    from_: Optional[str],
+    to: Optional[str],
+) -> tuple:
+    """/api/tasks 与导出共用的筛选条件，返回 (where_sql, params)"""
+    where_clauses = []
+    params = []
+    
+    if status:
+        where_clauses.append("status = ?")
+        params.append(status)
+    if task_type:
+        where_clauses.append("task_type = ?")
+        params.append(task_type)
+    if account_id:
+        where_clauses.append("account_id = ?")
+        params.append(account_id)
+    
+    range_clauses, range_params = time_range_clauses(from_, to)
+    where_clauses += range_clauses
+    params += range_params
+    
+    where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+    return where_sql, params
+
+
+def credit_log_filters(account_id: Optional[int], from_: Optional[str], to: Optional[str]) -> tuple:
+    """/api/credit-logs 与导出共用的筛选条件，返回 (where_sql, params)"""
+    where_clauses = ["account_id = ?"] if account_id else []
+    params = [account_id] if account_id else []
+    
+    range_clauses, range_params = time_range_clauses(from_, to)
+    where_clauses += range_clauses
+    params += range_params
+    
+    where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+    return where_sql, params
+
+
+def export_response(table: str, where_sql: str, params: list, format: str, gzip: bool) -> StreamingResponse:
+    """流式导出响应（以附件形式下载）"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}，可选 {', '.join(EXPORT_FORMATS)}")
+    filename = export_filename(table, format, gzip)
+    return StreamingResponse(
+        iter_export(table, where_sql, params, format, gzip),
+        media_type=export_media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 # ============ 请求模型 ============
 
 class RefreshAccountRequest(BaseModel):
@@ -112,14 +222,21 @@ class TaskRecord(BaseModel):
     prompt: str
     status: str = "pending"
     credits_used: int = 0
+    model: Optional[str] = None
 
 
 # ============ 账户管理 API ============
 
 @app.get("/api/accounts", tags=["账户管理"])
-async def get_accounts():
-    """获取所有账户列表"""
-    accounts = list_accounts()
+async def get_accounts(max_age: Optional[float] = Query(None, ge=0)):
+    """
+    获取所有账户列表
+
+    积分来自缓存，每个账户带 age（距上次刷新的秒数）/ stale / refreshing / managed；
+    超过 max_age（默认 ADMIN_CREDITS_TTL）的账户立即返回旧值并在后台合并刷新；
+    .env 中没有 token 的账户 managed=false，积分无法刷新，不计入 stale_count
+    """
+    accounts = credits_cache.annotate(await asyncio.to_thread(list_accounts), max_age)
     
     total_credits = sum(acc["credits"] for acc in accounts)
     available_count = sum(1 for acc in accounts if acc["credits"] >= 4)
@@ -129,12 +246,21 @@ async def get_accounts():
         "total_credits": total_credits,
         "available_count": available_count,
         "total_count": len(accounts),
+        "stale_count": sum(1 for acc in accounts if acc["stale"]),
     }
 
 
 @app.post("/api/accounts/refresh", tags=["账户管理"])
-async def refresh_accounts(req: RefreshAccountRequest = None):
-    """刷新账户积分"""
+async def refresh_accounts(
+    req: RefreshAccountRequest = None,
+    stream: bool = False,
+    concurrency: Optional[int] = Query(None, ge=1, le=64),
+):
+    """
+    刷新账户积分
+
+    不指定账户时并发刷新全部账户；stream=true 时以 NDJSON 逐行返回每个账户的进度，最后一行为汇总
+    """
     if req and req.account_id:
         # 刷新单个账户
         env_accounts = get_env_accounts()
@@ -142,28 +268,72 @@ async def refresh_accounts(req: RefreshAccountRequest = None):
             raise HTTPException(status_code=404, detail=f"账户 {req.account_id} 不存在")
         
         token = env_accounts[req.account_id]["token"]
-        credits = update_account_credits(req.account_id, token)
+        credits = await asyncio.to_thread(update_account_credits, req.account_id, token)
+        if credits is None:
+            raise HTTPException(status_code=502, detail=f"账户 {req.account_id} 积分查询失败，无法连接 jimeng-api")
         
         return {"success": True, "account_id": req.account_id, "credits": credits}
+    elif stream:
+        async def events():
+            async for event in iter_refresh_all_credits(concurrency):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        
+        return StreamingResponse(events(), media_type="application/x-ndjson")
     else:
         # 刷新所有账户
-        results = await asyncio.to_thread(refresh_all_credits)
+        results = await refresh_all_credits_async(concurrency)
         return {"success": True, "results": results}
 
 
+@app.post("/api/accounts/reload-env", tags=["账户管理"])
+async def reload_env():
+    """重新读取 .env 中的账户配置（.env 修改后也会在下次访问时自动重新读取）"""
+    accounts = await asyncio.to_thread(reload_env_accounts)
+    return {
+        "success": True,
+        "accounts": [
+            {"id": account_id, "region": account["region"], "base_url": account["base_url"]}
+            for account_id, account in accounts.items()
+        ],
+    }
+
+
 @app.get("/api/accounts/{account_id}/credits", tags=["账户管理"])
-async def get_account_credits(account_id: int):
-    """获取账户实时积分"""
+async def get_account_credits(account_id: int, max_age: Optional[float] = Query(None, ge=0)):
+    """
+    获取账户积分
+
+    缓存未过期时直接返回，过期时返回旧值并在后台刷新（stale=true）；max_age=0 等待实时查询。
+    token 失效时 credits.valid=false；jimeng-api 无法连接且没有可用的缓存时返回 502
+    """
     env_accounts = get_env_accounts()
     if account_id not in env_accounts:
         raise HTTPException(status_code=404, detail=f"账户 {account_id} 不存在")
     
-    token = env_accounts[account_id]["token"]
-    credits_info = await asyncio.to_thread(get_credits_from_api, token)
+    account = await credits_cache.get(account_id, max_age)
+    unreachable = credits_cache.is_unreachable(account_id)
+    if (account is None and credits_cache.refresh_error(account_id) is None) or (unreachable and max_age == 0):
+        raise HTTPException(status_code=502, detail=f"账户 {account_id} 积分查询失败，无法连接 jimeng-api")
+    if account is None:
+        # 从未成功刷新过的账户 token 失效
+        account = {
+            "gift_credit": 0, "purchase_credit": 0, "vip_credit": 0, "credits": 0,
+            "refresh_error": credits_cache.refresh_error(account_id),
+            "age": None, "stale": False, "refreshing": False,
+        }
     
     return {
         "account_id": account_id,
-        "credits": credits_info,
+        "credits": {
+            "gift_credit": account["gift_credit"],
+            "purchase_credit": account["purchase_credit"],
+            "vip_credit": account["vip_credit"],
+            "total": account["credits"],
+            "valid": "refresh_error" not in account,
+        },
+        "age": account["age"],
+        "stale": account["stale"],
+        "refreshing": account["refreshing"],
     }
 
 
@@ -172,20 +342,15 @@ async def get_account_credits(account_id: int):
 @app.post("/api/tasks", tags=["任务管理"])
 async def create_task_record(task: TaskRecord):
     """创建任务记录"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute("""
-            INSERT INTO tasks (task_id, account_id, task_type, prompt, status, credits_used)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (task.task_id, task.account_id, task.task_type, task.prompt, task.status, task.credits_used))
-        conn.commit()
+        await write_queue.write("""
+            INSERT INTO tasks (task_id, account_id, task_type, prompt, status, credits_used, model, created_ms)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (task.task_id, task.account_id, task.task_type, task.prompt, task.status, task.credits_used, task.model, now_ms()))
+        event_bus.publish("stats", summary_delta(None, (task.status, task.task_type, task.account_id, task.credits_used)))
         return {"success": True, "task_id": task.task_id}
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail="任务ID已存在")
-    finally:
-        conn.close()
 
 
 @app.get("/api/tasks", tags=["任务管理"])
@@ -195,42 +360,84 @@ async def get_tasks(
     status: Optional[str] = None,
     task_type: Optional[str] = None,
     account_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    q: Optional[str] = None,
 ):
-    """获取任务列表"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
+    """
+    获取任务列表
+
+    - 传 page 时按页码分页（兼容旧版，返回精确 total）
+    - 传 cursor 时按游标分页，第一页传空字符串 cursor=；
+      返回 next_cursor/prev_cursor，with_total=true 时返回精确 total，否则返回缓存的 total_estimate
+    - from/to 按创建时间筛选 [from, to)，支持毫秒时间戳或 ISO 日期/时间（默认统计时区）
+    - 传 q 时按提示词全文搜索，结果按相关度排序并按页码分页，每项附带 snippet 高亮片段；
+      相关度排序只覆盖最新的 ADMIN_SEARCH_CANDIDATES 条命中，truncated=true 表示更早的命中不可分页访问；
+      with_total=true 时 total 为可分页访问的条数，total_matches 为全部命中数，否则只返回 has_more
+    """
     # 构建查询
-    where_clauses = []
-    params = []
+    where_sql, params = task_filters(status, task_type, account_id, from_, to)
     
-    if status:
-        where_clauses.append("status = ?")
-        params.append(status)
-    if task_type:
-        where_clauses.append("task_type = ?")
-        params.append(task_type)
-    if account_id:
-        where_clauses.append("account_id = ?")
-        params.append(account_id)
-    
-    where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+    if q is not None and q.strip():
+        try:
+            result = await db_read(search_tasks, q, where_sql, params, page, page_size, with_total)
+        except (ValueError, sqlite3.OperationalError) as e:
+            raise HTTPException(status_code=400, detail=f"搜索失败: {e}")
+        
+        response = {
+            "tasks": result["items"],
+            "page": page,
+            "page_size": page_size,
+            "has_more": result["has_more"],
+            "truncated": result["truncated"],
+        }
+        if with_total:
+            response["total"] = result["total"]
+            response["total_pages"] = (result["total"] + page_size - 1) // page_size
+            response["total_matches"] = result["matches"]
+        return response
     
-    # 获取总数
-    cursor.execute(f"SELECT COUNT(*) FROM tasks WHERE {where_sql}", params)
-    total = cursor.fetchone()[0]
+    if cursor is not None:
+        def _keyset_query(conn):
+            result = keyset_page(conn, "tasks", where_sql, params, cursor, page_size)
+            result["total"] = count_cache.get(conn, "tasks", where_sql, params, exact=with_total)
+            return result
+        
+        try:
+            result = await db_read(_keyset_query)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return {
+            "tasks": result["items"],
+            "total" if with_total else "total_estimate": result["total"],
+            "page_size": page_size,
+            "next_cursor": result["next_cursor"],
+            "prev_cursor": result["prev_cursor"],
+        }
     
-    # 获取分页数据
     offset = (page - 1) * page_size
-    cursor.execute(f"""
-        SELECT * FROM tasks 
-        WHERE {where_sql}
-        ORDER BY created_at DESC
-        LIMIT ? OFFSET ?
-    """, params + [page_size, offset])
     
-    tasks = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    def _query(conn):
+        cursor = conn.cursor()
+        
+        # 获取总数
+        cursor.execute(f"SELECT COUNT(*) FROM tasks WHERE {where_sql}", params)
+        total = cursor.fetchone()[0]
+        
+        # 获取分页数据
+        cursor.execute(f"""
+            SELECT * FROM tasks 
+            WHERE {where_sql}
+            ORDER BY created_ms DESC, id DESC
+            LIMIT ? OFFSET ?
+        """, params + [page_size, offset])
+        
+        return total, [dict(row) for row in cursor.fetchall()]
+    
+    total, tasks = await db_read(_query)
     
     return {
         "tasks": tasks,
@@ -241,87 +448,128 @@ async def get_tasks(
     }
 
 
+@app.get("/api/tasks/export", tags=["任务管理"])
+async def export_tasks(
+    format: str = "ndjson",
+    gzip: bool = False,
+    status: Optional[str] = None,
+    task_type: Optional[str] = None,
+    account_id: Optional[int] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    q: Optional[str] = None,
+):
+    """
+    流式导出任务（按创建时间倒序）
+
+    - format: ndjson / csv
+    - gzip=true 时输出 .gz 压缩文件
+    - 筛选参数同 /api/tasks，q 只作为筛选条件，不按相关度排序
+    """
+    where_sql, params = task_filters(status, task_type, account_id, from_, to)
+    if q is not None and q.strip():
+        match_sql, match_params = match_filter(q)
+        where_sql = f"{where_sql} AND {match_sql}"
+        params = params + match_params
+    return export_response("tasks", where_sql, params, format, gzip)
+
+
 @app.put("/api/tasks/{task_id}", tags=["任务管理"])
 async def update_task(task_id: str, status: str, result_url: Optional[str] = None):
     """更新任务状态"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
+    # 变化前的状态用于推送统计增量
+    before = await fetch_one(
+        "SELECT status, task_type, account_id, credits_used FROM tasks WHERE task_id = ?", (task_id,)
+    )
+    rowcount = await write_queue.write("""
         UPDATE tasks 
         SET status = ?, result_url = ?, updated_at = CURRENT_TIMESTAMP
         WHERE task_id = ?
     """, (status, result_url, task_id))
     
-    if cursor.rowcount == 0:
-        conn.close()
+    if rowcount == 0:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    conn.commit()
-    conn.close()
-    
+    if before is not None:
+        event_bus.publish("stats", summary_delta(tuple(before), (status, *tuple(before)[1:])))
     return {"success": True, "task_id": task_id, "status": status}
 
 
 @app.get("/api/tasks/stats", tags=["任务管理"])
-async def get_task_stats():
-    """获取任务统计"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # 总任务数
-    cursor.execute("SELECT COUNT(*) FROM tasks")
-    total = cursor.fetchone()[0]
-    
-    # 按状态统计
-    cursor.execute("""
-        SELECT status, COUNT(*) as count 
-        FROM tasks 
-        GROUP BY status
-    """)
-    status_stats = {row["status"]: row["count"] for row in cursor.fetchall()}
-    
-    # 按类型统计
-    cursor.execute("""
-        SELECT task_type, COUNT(*) as count 
-        FROM tasks 
-        GROUP BY task_type
-    """)
-    type_stats = {row["task_type"]: row["count"] for row in cursor.fetchall()}
-    
-    # 今日任务数
-    cursor.execute("""
-        SELECT COUNT(*) FROM tasks 
-        WHERE date(created_at) = date('now')
-    """)
-    today_count = cursor.fetchone()[0]
-    
-    # 总消耗积分
-    cursor.execute("SELECT SUM(credits_used) FROM tasks")
-    total_credits = cursor.fetchone()[0] or 0
-    
-    conn.close()
+async def get_task_stats(
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+):
+    """
+    获取任务统计
+
+    不带时间范围时读取触发器维护的计数表；带 from/to 时按 created_ms 索引范围聚合
+    """
+    try:
+        start = parse_time_param(from_)
+        end = parse_time_param(to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if start is None and end is None:
+        return await db_read(load_task_stats_summary)
+    return await db_read(load_range_summary, start, end)
+
+
+@app.get("/api/stats/timeseries", tags=["任务管理"])
+async def get_stats_timeseries(
+    granularity: str = "day",
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    account_id: Optional[int] = None,
+    model: Optional[str] = None,
+    task_type: Optional[str] = None,
+    group_by: Optional[str] = None,
+):
+    """
+    任务趋势时间序列（读取小时/日汇总表，与任务总量无关）
+
+    - granularity: hour（默认最近 48 小时）/ day（默认最近 90 天）
+    - group_by: account_id / model / task_type，按维度拆分序列
+    """
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity 只支持 hour / day")
+    if group_by is not None and group_by not in ROLLUP_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"group_by 只支持 {', '.join(ROLLUP_DIMENSIONS)}")
+    
+    try:
+        start = parse_time_param(from_)
+        end = parse_time_param(to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    end = end if end is not None else now_ms()
+    if start is None:
+        start = end - (48 * 3600 * 1000 if granularity == "hour" else 90 * 86400 * 1000)
+    start, end = align_range(granularity, start, end)
+    
+    filters = {"account_id": account_id, "model": model, "task_type": task_type}
+    series = await db_read(query_timeseries, granularity, start, end, filters, group_by)
     
     return {
-        "total": total,
-        "today": today_count,
-        "by_status": status_stats,
-        "by_type": type_stats,
-        "total_credits_used": total_credits,
+        "granularity": granularity,
+        "from": start,
+        "to": end,
+        "group_by": group_by,
+        "series": series,
     }
 
 
 # ============ 图片生成 API (代理到 jimeng-api) ============
 
-JIMENG_API_URL = "http://127.0.0.1:5100"
-
-
 class ImageGenerateRequest(BaseModel):
     prompt: str
     model: str = "jimeng-4.5"
     ratio: str = "1:1"
     resolution: str = "2k"
     account_id: Optional[int] = None
+    caller: Optional[str] = None
+    priority: str = DEFAULT_PRIORITY
 
 
 class VideoGenerateRequest(BaseModel):
@@ -330,166 +578,70 @@ class VideoGenerateRequest(BaseModel):
     ratio: str = "16:9"
     duration: int = 5
     account_id: Optional[int] = None
-
-
-@app.post("/api/generate/image", tags=["生成任务"])
-async def generate_image(req: ImageGenerateRequest):
-    """生成图片（代理到 jimeng-api）"""
-    import httpx
-    
-    # 选择账户
-    if req.account_id:
-        account_id = req.account_id
-    else:
-        account_id = get_available_account(min_credits=4)
-        if not account_id:
-            raise HTTPException(status_code=400, detail="没有可用账户（积分不足）")
-    
-    # 获取 token
-    env_accounts = get_env_accounts()
-    if account_id not in env_accounts:
-        raise HTTPException(status_code=404, detail=f"账户 {account_id} 不存在")
-    
-    token = env_accounts[account_id]["token"]
-    
-    # 调用 jimeng-api
-    async with httpx.AsyncClient(timeout=1200) as client:  # 20分钟超时
-        try:
-            resp = await client.post(
-                f"{JIMENG_API_URL}/v1/images/generations",
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": req.model,
-                    "prompt": req.prompt,
-                    "ratio": req.ratio,
-                    "resolution": req.resolution,
-                },
-            )
-            
-            result = resp.json()
-            
-            # 提取图片URL 和 history_id
-            image_urls = []
-            history_id = None
-            if "data" in result and isinstance(result["data"], list):
-                for item in result["data"]:
-                    if "url" in item:
-                        image_urls.append(item["url"])
-                    # 尝试提取 history_id
-                    if "history_id" in item:
-                        history_id = item["history_id"]
-            
-            # 如果没有从 data 中获取到 history_id，尝试从其他位置获取
-            if not history_id and "history_id" in result:
-                history_id = result["history_id"]
-            
-            # 使用 history_id 作为 task_id，如果没有则用本地生成的
-            task_id = history_id or f"img_{datetime.now().strftime('%Y%m%d%H%M%S')}_{account_id}"
-            result_url = image_urls[0] if image_urls else None
-            status = "completed" if resp.status_code == 200 and image_urls else "failed"
-            
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO tasks (task_id, account_id, task_type, prompt, status, result_url, credits_used)
-                VALUES (?, ?, 'image', ?, ?, ?, ?)
-            """, (task_id, account_id, req.prompt, status, result_url, 4 if status == "completed" else 0))
-            conn.commit()
-            conn.close()
-            
-            # 刷新积分
-            await asyncio.to_thread(update_account_credits, account_id, token)
-            
-            return {
-                "success": resp.status_code == 200 and len(image_urls) > 0,
-                "account_id": account_id,
-                "data": result,
-                "images": image_urls,
-            }
-            
-        except httpx.TimeoutException:
-            # 超时也记录任务
-            conn = get_db()
-            cursor = conn.cursor()
-            task_id = f"img_{datetime.now().strftime('%Y%m%d%H%M%S')}_{account_id}"
-            cursor.execute("""
-                INSERT INTO tasks (task_id, account_id, task_type, prompt, status, credits_used)
-                VALUES (?, ?, 'image', ?, 'timeout', 4)
-            """, (task_id, account_id, req.prompt))
-            conn.commit()
-            conn.close()
-            raise HTTPException(status_code=504, detail="生成超时，请稍后查询结果")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.post("/api/generate/video", tags=["生成任务"])
-async def generate_video(req: VideoGenerateRequest):
-    """生成视频（代理到 jimeng-api）"""
-    import httpx
-    
-    # 选择账户
-    if req.account_id:
-        account_id = req.account_id
-    else:
-        account_id = get_available_account(min_credits=20)
-        if not account_id:
-            raise HTTPException(status_code=400, detail="没有可用账户（积分不足）")
-    
-    # 获取 token
-    env_accounts = get_env_accounts()
-    if account_id not in env_accounts:
-        raise HTTPException(status_code=404, detail=f"账户 {account_id} 不存在")
-    
-    token = env_accounts[account_id]["token"]
-    
-    # 调用 jimeng-api
-    async with httpx.AsyncClient(timeout=1200) as client:
-        try:
-            resp = await client.post(
-                f"{JIMENG_API_URL}/v1/videos/generations",
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": req.model,
-                    "prompt": req.prompt,
-                    "ratio": req.ratio,
-                    "duration": req.duration,
-                },
-            )
-            
-            result = resp.json()
-            
-            # 记录任务
-            if resp.status_code == 200:
-                conn = get_db()
-                cursor = conn.cursor()
-                task_id = f"vid_{datetime.now().strftime('%Y%m%d%H%M%S')}_{account_id}"
-                cursor.execute("""
-                    INSERT INTO tasks (task_id, account_id, task_type, prompt, status, credits_used)
-                    VALUES (?, ?, 'video', ?, 'completed', 20)
-                """, (task_id, account_id, req.prompt))
-                conn.commit()
-                conn.close()
-                
-                # 刷新积分
-                await asyncio.to_thread(update_account_credits, account_id, token)
-            
-            return {
-                "success": resp.status_code == 200,
-                "account_id": account_id,
-                "data": result,
-            }
-            
-        except httpx.TimeoutException:
-            raise HTTPException(status_code=504, detail="生成超时，请稍后查询结果")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+    caller: Optional[str] = None
+    priority: str = DEFAULT_PRIORITY
+
+
+async def _submit_job(kind: str, params: dict, wait: bool):
+    if params["priority"] not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority 必须是 {', '.join(PRIORITIES)} 之一")
+    if params["account_id"] and params["account_id"] not in get_env_accounts():
+        raise HTTPException(status_code=404, detail=f"账户 {params['account_id']} 不存在")
+    job = await job_queue.submit(kind, params)
+    if not wait:
+        return JSONResponse(status_code=202, content=job)
+
+    # 兼容旧用法：等待任务结束后返回原同步接口的响应体 {success, account_id, data, images}，
+    # 错误与原同步接口一样以 HTTP 状态码返回
+    job = await job_queue.wait(job["job_id"], JOB_MAX_DURATION + 60)
+    if job["status"] in ("queued", "running"):
+        return JSONResponse(status_code=202, content=job)
+    if job["status"] == "timeout":
+        raise HTTPException(status_code=504, detail=job["error"])
+    result = job["result"]
+    if job["status"] == "failed" and (result is None or "status_code" in result):
+        # 没有拿到 jimeng-api 响应（如连接失败）时原接口返回 500
+        raise HTTPException(status_code=(result or {}).get("status_code", 500), detail=job["error"])
+    return JSONResponse(content=result)
+
+
+@app.post("/api/generate/image", tags=["生成任务"], status_code=202)
+async def generate_image(req: ImageGenerateRequest, wait: bool = False):
+    """
+    提交图片生成任务（代理到 jimeng-api），立即返回 job_id
+
+    通过 GET /api/jobs/{job_id} 查询结果；wait=true 时等待生成完成后按原同步接口的格式返回。
+    图片任务在独立的执行道中排队：priority 为 interactive / normal / bulk，高优先级先执行，
+    排队过久的任务逐级提升；同优先级时不同调用方（caller）按权重公平排队（ADMIN_LIMIT_WEIGHTS）
+    """
+    return await _submit_job("image", req.dict(), wait)
+
+
+@app.post("/api/generate/video", tags=["生成任务"], status_code=202)
+async def generate_video(req: VideoGenerateRequest, wait: bool = False):
+    """
+    提交视频生成任务（代理到 jimeng-api），立即返回 job_id
+
+    通过 GET /api/jobs/{job_id} 查询结果；wait=true 时等待生成完成后按原同步接口的格式返回。
+    视频任务在独立的执行道中排队，不占用图片任务的名额；priority / caller 的含义同图片生成
+    """
+    return await _submit_job("video", req.dict(), wait)
+
+
+@app.get("/api/jobs/{job_id}", tags=["生成任务"])
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=60)):
+    """
+    查询生成任务状态
+
+    attempts 为调用 jimeng-api 的次数，attempt_log 为每次调用的账户、结果和失败分类
+    （积分不足、登录失效、限流、临时错误会换账户重试）
+
+    - **wait**: 任务未结束时最多等待的秒数（长轮询），结束后立即返回
+    """
+    job = await job_queue.wait(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
 
 
 # ============ 积分记录 API ============
@@ -499,29 +651,57 @@ async def get_credit_logs(
     page: int = 1,
     page_size: int = 50,
     account_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
 ):
-    """获取积分变动记录"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    where_sql = "account_id = ?" if account_id else "1=1"
-    params = [account_id] if account_id else []
+    """
+    获取积分变动记录
+
+    分页和时间范围参数同 /api/tasks：page 为页码分页，cursor 为游标分页，from/to 为时间范围
+    """
+    where_sql, params = credit_log_filters(account_id, from_, to)
     
-    # 获取总数
-    cursor.execute(f"SELECT COUNT(*) FROM credit_logs WHERE {where_sql}", params)
-    total = cursor.fetchone()[0]
+    if cursor is not None:
+        def _keyset_query(conn):
+            result = keyset_page(conn, "credit_logs", where_sql, params, cursor, page_size)
+            result["total"] = count_cache.get(conn, "credit_logs", where_sql, params, exact=with_total)
+            return result
+        
+        try:
+            result = await db_read(_keyset_query)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return {
+            "logs": result["items"],
+            "total" if with_total else "total_estimate": result["total"],
+            "page_size": page_size,
+            "next_cursor": result["next_cursor"],
+            "prev_cursor": result["prev_cursor"],
+        }
     
-    # 获取分页数据
     offset = (page - 1) * page_size
-    cursor.execute(f"""
-        SELECT * FROM credit_logs 
-        WHERE {where_sql}
-        ORDER BY created_at DESC
-        LIMIT ? OFFSET ?
-    """, params + [page_size, offset])
     
-    logs = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    def _query(conn):
+        cursor = conn.cursor()
+        
+        # 获取总数
+        cursor.execute(f"SELECT COUNT(*) FROM credit_logs WHERE {where_sql}", params)
+        total = cursor.fetchone()[0]
+        
+        # 获取分页数据
+        cursor.execute(f"""
+            SELECT * FROM credit_logs 
+            WHERE {where_sql}
+            ORDER BY created_ms DESC, id DESC
+            LIMIT ? OFFSET ?
+        """, params + [page_size, offset])
+        
+        return total, [dict(row) for row in cursor.fetchall()]
+    
+    total, logs = await db_read(_query)
     
     return {
         "logs": logs,
@@ -531,6 +711,19 @@ async def get_credit_logs(
     }
 
 
+@app.get("/api/credit-logs/export", tags=["积分记录"])
+async def export_credit_logs(
+    format: str = "ndjson",
+    gzip: bool = False,
+    account_id: Optional[int] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+):
+    """流式导出积分变动记录，参数同 /api/tasks/export"""
+    where_sql, params = credit_log_filters(account_id, from_, to)
+    return export_response("credit_logs", where_sql, params, format, gzip)
+
+
 @app.post("/api/credit-logs", tags=["积分记录"])
 async def add_credit_log(
     account_id: int,
@@ -540,16 +733,10 @@ async def add_credit_log(
     description: str = "",
 ):
     """添加积分变动记录"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        INSERT INTO credit_logs (account_id, change_amount, change_type, balance_after, description)
-        VALUES (?, ?, ?, ?, ?)
-    """, (account_id, change_amount, change_type, balance_after, description))
-    
-    conn.commit()
-    conn.close()
+    await write_queue.write("""
+        INSERT INTO credit_logs (account_id, change_amount, change_type, balance_after, description, created_ms)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (account_id, change_amount, change_type, balance_after, description, now_ms()))
     
     return {"success": True}
 
@@ -565,30 +752,18 @@ async def get_dreamina_history(
     history_id: str = None,
 ):
     """查询 Dreamina 历史生成任务（输入任务ID直接查询）"""
-    import httpx
-    
     # 获取账户 token - 从 .env 获取
     env_accounts = get_env_accounts()
     if account_id not in env_accounts:
         raise HTTPException(status_code=404, detail=f"账户 {account_id} 不存在")
     
-    token = env_accounts[account_id]["token"]
-    if not token:
+    account = env_accounts[account_id]
+    if not account["token"]:
         raise HTTPException(status_code=400, detail="账户 token 为空")
     
-    # 解析 sessionid
-    if token.startswith("us-"):
-        sessionid = token[3:]
-        region = "US"
-        base_url = "https://dreamina-api.us.capcut.com"
-    elif token.startswith("cn-"):
-        sessionid = token[3:]
-        region = "CN"
-        base_url = "https://jimeng-api.jianying.com"
-    else:
-        sessionid = token
-        region = "US"
-        base_url = "https://dreamina-api.us.capcut.com"
+    sessionid = account["sessionid"]
+    base_url = account["base_url"]
+    region = account["region"].upper()
     
     headers = {
         "Accept": "application/json, text/plain, */*",
@@ -612,23 +787,19 @@ async def get_dreamina_history(
         history_ids = [history_id]
     else:
         # 从本地数据库获取任务ID列表
-        conn = get_db()
-        cursor = conn.cursor()
         task_type = "image" if scene == "image" else "video"
         offset = (page - 1) * page_size
         
-        cursor.execute("""
+        rows = await fetch_all("""
             SELECT task_id FROM tasks 
             WHERE account_id = ? AND task_type = ?
-            ORDER BY created_at DESC
+            ORDER BY created_ms DESC
             LIMIT ? OFFSET ?
         """, (account_id, task_type, page_size, offset))
-        rows = cursor.fetchall()
-        conn.close()
         
         # 提取数字ID
         for row in rows:
-            task_id = row[0]
+            task_id = row["task_id"]
             if task_id and task_id.isdigit():
                 history_ids.append(task_id)
     
@@ -657,57 +828,56 @@ async def get_dreamina_history(
     }
     
     try:
-        async with httpx.AsyncClient(
-            timeout=30, proxy=f"http://{PROXY}" if PROXY else None
-        ) as client:
-            resp = await client.post(
-                f"{base_url}/mweb/v1/get_history_by_ids",
-                headers=headers,
-                params=params,
-                json=data,
-            )
-
-            if resp.status_code == 200:
-                result = resp.json()
-                result_data = result.get("data", {})
-
-                # 格式化任务列表
-                tasks = []
-                for hid in history_ids:
-                    history_info = result_data.get(hid, {})
-                    if history_info:
-                        task_info = history_info.get("task", {})
-                        item_list = history_info.get("item_list", [])
-                        cover_url = ""
-                        title = "无标题"
-                        if item_list:
-                            cover_url = item_list[0].get("common_attr", {}).get("cover_url", "")
-                            title = item_list[0].get("common_attr", {}).get("description", "无标题")
-
-                        status = task_info.get("status", 0)
-                        status_map = {10: "已完成", 20: "处理中", 30: "失败", 42: "后处理", 45: "最终处理", 50: "已完成"}
-
-                        tasks.append({
-                            "id": hid,
-                            "title": title,
-                            "status": status,
-                            "status_text": status_map.get(status, f"未知({status})"),
-                            "cover_url": cover_url,
-                            "create_time": history_info.get("created_time", 0),
-                            "update_time": task_info.get("finish_time", 0),
-                            "image_count": len(item_list),
-                        })
-                
-                return {
-                    "success": True,
-                    "account_id": account_id,
-                    "tasks": tasks,
-                    "total": len(tasks),
-                    "page": page,
-                    "page_size": page_size,
-                }
-            else:
-                raise HTTPException(status_code=resp.status_code, detail=f"API 请求失败: {resp.text}")
+        client = http_clients.get(base_url, proxy=f"http://{PROXY}" if PROXY else None)
+        resp = await client.post(
+            "/mweb/v1/get_history_by_ids",
+            headers=headers,
+            params=params,
+            json=data,
+            timeout=30,
+        )
+
+        if resp.status_code == 200:
+            result = resp.json()
+            result_data = result.get("data", {})
+
+            # 格式化任务列表
+            tasks = []
+            for hid in history_ids:
+                history_info = result_data.get(hid, {})
+                if history_info:
+                    task_info = history_info.get("task", {})
+                    item_list = history_info.get("item_list", [])
+                    cover_url = ""
+                    title = "无标题"
+                    if item_list:
+                        cover_url = item_list[0].get("common_attr", {}).get("cover_url", "")
+                        title = item_list[0].get("common_attr", {}).get("description", "无标题")
+
+                    status = task_info.get("status", 0)
+                    status_map = {10: "已完成", 20: "处理中", 30: "失败", 42: "后处理", 45: "最终处理", 50: "已完成"}
+
+                    tasks.append({
+                        "id": hid,
+                        "title": title,
+                        "status": status,
+                        "status_text": status_map.get(status, f"未知({status})"),
+                        "cover_url": cover_url,
+                        "create_time": history_info.get("created_time", 0),
+                        "update_time": task_info.get("finish_time", 0),
+                        "image_count": len(item_list),
+                    })
+            
+            return {
+                "success": True,
+                "account_id": account_id,
+                "tasks": tasks,
+                "total": len(tasks),
+                "page": page,
+                "page_size": page_size,
+            }
+        else:
+            raise HTTPException(status_code=resp.status_code, detail=f"API 请求失败: {resp.text}")
                 
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="请求超时")
@@ -721,20 +891,14 @@ async def get_history_detail(
     account_id: int = 1,
 ):
     """查询单个历史任务详情"""
-    import httpx
-    
     # 获取账户 token - 从 .env 获取
     env_accounts = get_env_accounts()
     if account_id not in env_accounts:
         raise HTTPException(status_code=404, detail=f"账户 {account_id} 不存在")
     
-    token = env_accounts[account_id]["token"]
-    if token.startswith("us-"):
-        sessionid = token[3:]
-        base_url = "https://dreamina-api.us.capcut.com"
-    else:
-        sessionid = token
-        base_url = "https://dreamina-api.us.capcut.com"
+    account = env_accounts[account_id]
+    sessionid = account["sessionid"]
+    base_url = account["base_url"]
     
     headers = {
         "Accept": "application/json, text/plain, */*",
@@ -748,7 +912,7 @@ async def get_history_detail(
     params = {
         "aid": 513641,
         "device_platform": "web",
-        "region": "US",
+        "region": account["region"].upper(),
         "web_version": "7.5.0",
     }
     
@@ -765,45 +929,44 @@ async def get_history_detail(
     }
     
     try:
-        async with httpx.AsyncClient(
-            timeout=30, proxy=f"http://{PROXY}" if PROXY else None
-        ) as client:
-            resp = await client.post(
-                f"{base_url}/mweb/v1/get_history_by_ids",
-                headers=headers,
-                params=params,
-                json=data,
-            )
+        client = http_clients.get(base_url, proxy=f"http://{PROXY}" if PROXY else None)
+        resp = await client.post(
+            "/mweb/v1/get_history_by_ids",
+            headers=headers,
+            params=params,
+            json=data,
+            timeout=30,
+        )
+        
+        if resp.status_code == 200:
+            result = resp.json()
+            history_data = result.get("data", {}).get(history_id, {})
             
-            if resp.status_code == 200:
-                result = resp.json()
-                history_data = result.get("data", {}).get(history_id, {})
-                
-                # 提取图片列表
-                images = []
-                item_list = history_data.get("item_list", [])
-                for item in item_list:
-                    common_attr = item.get("common_attr", {})
-                    image_info = item.get("image_info", {})
-                    images.append({
-                        "id": common_attr.get("id", ""),
-                        "description": common_attr.get("description", ""),
-                        "cover_url": common_attr.get("cover_url", ""),
-                        "url": image_info.get("large_images", [{}])[0].get("image_url", "") if image_info.get("large_images") else "",
-                    })
-                
-                task_info = history_data.get("task", {})
-                
-                return {
-                    "success": True,
-                    "history_id": history_id,
-                    "status": task_info.get("status", 0),
-                    "finish_time": task_info.get("finish_time", 0),
-                    "images": images,
-                    "raw_data": history_data,
-                }
-            else:
-                raise HTTPException(status_code=resp.status_code, detail=f"API 请求失败: {resp.text}")
+            # 提取图片列表
+            images = []
+            item_list = history_data.get("item_list", [])
+            for item in item_list:
+                common_attr = item.get("common_attr", {})
+                image_info = item.get("image_info", {})
+                images.append({
+                    "id": common_attr.get("id", ""),
+                    "description": common_attr.get("description", ""),
+                    "cover_url": common_attr.get("cover_url", ""),
+                    "url": image_info.get("large_images", [{}])[0].get("image_url", "") if image_info.get("large_images") else "",
+                })
+            
+            task_info = history_data.get("task", {})
+            
+            return {
+                "success": True,
+                "history_id": history_id,
+                "status": task_info.get("status", 0),
+                "finish_time": task_info.get("finish_time", 0),
+                "images": images,
+                "raw_data": history_data,
+            }
+        else:
+            raise HTTPException(status_code=resp.status_code, detail=f"API 请求失败: {resp.text}")
                 
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="请求超时")
@@ -811,6 +974,59 @@ async def get_history_detail(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============ 事件推送 API ============
+
+@app.get("/api/events", tags=["事件推送"])
+async def events(topics: Optional[str] = None):
+    """
+    Server-Sent Events 推送
+
+    - **topics**: 逗号分隔的主题（job / credits / stats），默认全部
+      - job: 生成任务状态变化，data 与 GET /api/jobs/{job_id} 相同
+      - credits: 账户积分变化 {id, credits, reason, change}
+      - stats: /api/tasks/stats 的增量（只含变化的字段）
+    - 客户端处理不过来时旧事件会被丢弃，随后收到 resync 事件 {dropped}，应重新拉取完整数据
+    """
+    selected = None
+    if topics:
+        selected = {topic.strip() for topic in topics.split(",") if topic.strip()}
+        unknown = selected - set(EVENT_TOPICS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知主题: {', '.join(sorted(unknown))}")
+
+    sub = event_bus.subscribe(selected)
+
+    async def stream():
+        try:
+            async for chunk in iter_sse(sub):
+                yield chunk
+        finally:
+            event_bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ============ 系统监控 API ============
+
+@app.get("/api/metrics", tags=["系统监控"])
+async def get_metrics():
+    """获取运行指标（事件循环延迟、HTTP 连接池等）"""
+    return {
+        "event_loop_lag": loop_lag_monitor.snapshot(),
+        "write_queue_pending": write_queue.pending(),
+        "http_clients": http_clients.snapshot(),
+        "scheduler": scheduler.snapshot(),
+        "credits_cache": credits_cache.snapshot(),
+        "jobs": job_queue.snapshot(),
+        "concurrency": concurrency_limiter.snapshot(),
+        "events": event_bus.snapshot(),
+    }
+
+
 # ============ 静态文件 ============
 
 # 挂载静态文件目录
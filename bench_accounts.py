@@ -0,0 +1,165 @@
+"""
+账户选择基准测试
+对比旧版「读取整个 accounts.json 后线性查找」与 accounts 表部分索引上各选择策略的吞吐，
+并统计连续选择时负载在账户间的分布；--burst 模式用多线程并发预留积分直到耗尽，检查是否超额分配
+
+用法: python bench_accounts.py --accounts 10000 --picks 5000
+      python bench_accounts.py --accounts 200 --burst 32
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+
+def seed_accounts(conn, count: int, drained_ratio: float) -> dict:
+    """生成测试账户，drained_ratio 比例的账户积分耗尽；返回 accounts.json 结构的数据"""
+    rng = random.Random(42)
+    data = {"accounts": {}, "last_reset_date": ""}
+    rows = []
+    for account_id in range(1, count + 1):
+        credits = rng.randint(0, 3) if rng.random() < drained_ratio else rng.randint(4, 300)
+        data["accounts"][str(account_id)] = {"credits": credits, "region": "us"}
+        rows.append((account_id, credits, "us"))
+    conn.executemany("INSERT INTO accounts (id, credits, region) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    return data
+
+
+def legacy_pick(path: str, min_credits: int):
+    """旧版 get_available_account：每次读取并解析整个文件，按顺序返回第一个满足条件的账户"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for account_id, info in data.get("accounts", {}).items():
+        if info.get("credits", 0) >= min_credits:
+            return int(account_id)
+    return None
+
+
+def run(fn, picks: int) -> tuple:
+    """执行 picks 次选择，返回 (picks/s, 被选中的不同账户数, 单个账户最多被选中次数)"""
+    counts = Counter()
+    start = time.perf_counter()
+    for _ in range(picks):
+        counts[fn()] += 1
+    elapsed = time.perf_counter() - start
+    return picks / elapsed, len(counts), max(counts.values())
+
+
+def run_burst(account_manager, get_db, threads: int, cost: int = 20) -> dict:
+    """多线程并发预留积分直到全部账户的可用积分不足，统计超额分配"""
+    with get_db() as conn:
+        credits = dict(conn.execute("SELECT id, credits FROM accounts").fetchall())
+    # 理论上可分配的次数: 每个账户 credits // cost 次
+    capacity = sum(c // cost for c in credits.values())
+
+    granted = Counter()
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            lease = account_manager.reserve_credits(cost, policy="most_credits")
+            if lease is None:
+                return
+            with lock:
+                granted[lease["account_id"]] += 1
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    total = sum(granted.values())
+    oversubscribed = sum(1 for acc_id, n in granted.items() if n * cost > credits[acc_id])
+    return {
+        "reserved": total,
+        "elapsed": elapsed,
+        "utilization": total / capacity if capacity else 0.0,
+        "oversubscribed": oversubscribed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="账户选择基准测试")
+    parser.add_argument("--accounts", type=int, default=10000, help="账户数")
+    parser.add_argument("--picks", type=int, default=5000, help="每种策略的选择次数")
+    parser.add_argument("--drained", type=float, default=0.5, help="积分耗尽账户的比例")
+    parser.add_argument("--burst", type=int, default=0, help="并发预留的线程数（0 表示不测试）")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_accounts_")
+    os.environ["ADMIN_DB_FILE"] = os.path.join(workdir, "data.db")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+
+    try:
+        import account_manager
+        from db_manager import get_db, close_pool
+        from db_migrations import run_migrations
+
+        with get_db() as conn:
+            run_migrations(conn)
+            data = seed_accounts(conn, args.accounts, args.drained)
+
+        json_path = os.path.join(workdir, "accounts_legacy.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+        # 旧版每次都要读文件，只跑少量次数
+        legacy_picks = max(1, min(args.picks, 200))
+        results = [("legacy json", *run(lambda: legacy_pick(json_path, 20), legacy_picks))]
+
+        for policy in account_manager.SELECTION_POLICIES:
+            results.append((policy, *run(
+                lambda: account_manager.get_available_account(min_credits=20, policy=policy),
+                args.picks,
+            )))
+
+        # least_loaded 在有进行中请求时的表现：每次预留后保持占用，每 8 次撤销最早的一个
+        leases = []
+
+        def reserve_release():
+            lease = account_manager.reserve_credits(20, policy="least_loaded")
+            leases.append(lease)
+            if len(leases) > 8:
+                account_manager.release_lease(leases.pop(0))
+            return lease["account_id"] if lease else None
+
+        results.append(("reserve/release", *run(reserve_release, args.picks)))
+        for lease in leases:
+            account_manager.release_lease(lease)
+
+        burst = run_burst(account_manager, get_db, args.burst) if args.burst else None
+        close_pool()
+
+        print("\n" + "=" * 72)
+        print(f"{args.accounts} 个账户（{args.drained:.0%} 积分耗尽），min_credits=20")
+        print("-" * 72)
+        print(f"{'策略':<20}{'picks/s':>12}{'选中账户数':>14}{'单账户最多选中':>16}")
+        print("-" * 72)
+        for name, rate, distinct, hottest in results:
+            print(f"{name:<20}{rate:>12.0f}{distinct:>14}{hottest:>16}")
+        print("=" * 72)
+
+        if burst:
+            print(f"并发预留（{args.burst} 线程，每次 20 积分，直到没有可用账户）")
+            print(f"  预留次数: {burst['reserved']}  用时: {burst['elapsed']:.2f}s")
+            print(f"  可分配积分利用率: {burst['utilization']:.1%}")
+            print(f"  超额分配的账户数: {burst['oversubscribed']}")
+            print("=" * 72)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
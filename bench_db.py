@@ -0,0 +1,154 @@
+"""
+管理后台数据库基准测试
+对比 /api/tasks 与 /api/tasks/stats 在「每次新建连接」与「长连接池 + WAL」两种模式下的吞吐，
+同时记录压测期间的事件循环延迟
+
+用法: python bench_db.py --rows 50000 --requests 500 --concurrency 8
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+from contextlib import contextmanager
+
+ENDPOINTS = ["/api/tasks", "/api/tasks/stats"]
+
+
+class UnpooledConnections:
+    """旧版行为：每次使用都新建连接、默认 rollback journal、用完即关"""
+
+    def __init__(self, db_file: str, size: int = 4):
+        self.db_file = db_file
+        self.size = size
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def close_all(self):
+        pass
+
+
+def seed_tasks(db_file: str, rows: int):
+    """生成测试任务数据"""
+    conn = sqlite3.connect(db_file)
+    statuses = ["completed", "completed", "completed", "failed", "timeout", "pending"]
+    task_types = ["image", "image", "image", "video"]
+    batch = []
+    for i in range(rows):
+        day = random.randint(0, 89)
+        batch.append((
+            f"bench_{i}",
+            random.randint(1, 50),
+            random.choice(task_types),
+            f"benchmark prompt {i}",
+            random.choice(statuses),
+            random.choice([0, 4, 20]),
+            f"2026-{1 + day // 30:02d}-{1 + day % 28:02d} {random.randint(0, 23):02d}:{random.randint(0, 59):02d}:00",
+        ))
+        if len(batch) >= 10000:
+            conn.executemany("""
+                INSERT INTO tasks (task_id, account_id, task_type, prompt, status, credits_used, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, batch)
+            batch.clear()
+    if batch:
+        conn.executemany("""
+            INSERT INTO tasks (task_id, account_id, task_type, prompt, status, credits_used, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, batch)
+    conn.commit()
+    conn.close()
+
+
+async def run_requests(app, path: str, total: int, concurrency: int) -> tuple:
+    """并发请求指定接口，返回 (req/s, 事件循环最大延迟 ms)"""
+    import httpx
+    from metrics import LoopLagMonitor
+
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                resp = await client.get(path)
+                resp.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    await monitor.stop()
+    return total / elapsed, monitor.snapshot()["max_all_time_ms"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="管理后台数据库基准测试")
+    parser.add_argument("--rows", type=int, default=50000, help="任务表行数")
+    parser.add_argument("--requests", type=int, default=500, help="每个接口的请求数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_db_")
+    db_file = os.path.join(workdir, "data.db")
+    os.environ["ADMIN_DB_FILE"] = db_file
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    try:
+        import db_manager
+        import admin_server
+
+        print(f"生成 {args.rows} 条任务数据...")
+        seed_tasks(db_file, args.rows)
+
+        results = {}
+        for mode in ["unpooled", "pooled"]:
+            db_manager.close_pool()
+            if mode == "unpooled":
+                # 恢复默认的 rollback journal，模拟旧版 get_db()
+                conn = sqlite3.connect(db_file)
+                conn.execute("PRAGMA journal_mode=DELETE")
+                conn.close()
+                db_manager._pool = UnpooledConnections(db_file)
+            else:
+                db_manager.init_pool(db_file)
+
+            for path in ENDPOINTS:
+                results[(mode, path)] = asyncio.run(
+                    run_requests(admin_server.app, path, args.requests, args.concurrency)
+                )
+
+        db_manager.close_pool()
+
+        print("\n" + "=" * 72)
+        print(f"{'接口':<20}{'模式':<12}{'req/s':>10}{'循环最大延迟 ms':>18}")
+        print("-" * 72)
+        for path in ENDPOINTS:
+            for mode in ["unpooled", "pooled"]:
+                rps, lag = results[(mode, path)]
+                print(f"{path:<20}{mode:<12}{rps:>10.1f}{lag:>18.1f}")
+        print("=" * 72)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+生成请求并发限制
+对 jimeng-api 的生成调用按任务类型分道（lane）限制并发，各道合计受全局上限约束，
+并对账户、地区再做一级上限，超出的请求排队而不是同时打到上游。
+
+图片和视频各有独立的执行道和名额：一批耗时数分钟的视频任务只会占满视频道，不影响图片任务；
+图片道默认比全局上限少一个名额，图片任务排满时视频任务仍能执行。
+全局名额空出时在各道（未达到道上限的）排在最前的请求中按老化后的优先级、到达顺序选择。
+道内排队顺序:
+    1. 优先级: interactive > normal > bulk；等待每满 ADMIN_PRIORITY_AGING 秒提升一级，低优先级不会饿死
+    2. 同优先级按调用方（caller）加权公平排队（start-time fair queueing）：
+       每个请求到达时按调用方的权重分配虚拟完成时间，小的先执行；一个调用方一次提交大量请求，
+       其他调用方的请求仍能按权重比例插队执行
+    3. 仍相同时按到达顺序
+拿到道内名额后再选择账户，选择时跳过已达到账户 / 地区上限的账户（账户和地区上限各道共享）。
+
+配置:
+    ADMIN_LIMIT_GLOBAL       各道合计同时执行的请求数（默认沿用 ADMIN_JOB_WORKERS，4；0 表示不限制）
+    ADMIN_LANE_IMAGE_WORKERS 图片道同时执行的请求数（默认为全局上限减 1，至少 1）
+    ADMIN_LANE_VIDEO_WORKERS 视频道同时执行的请求数（默认 2）
+    ADMIN_LIMIT_PER_ACCOUNT  每个账户同时执行的请求数（默认 2，0 表示不限制）
+    ADMIN_LIMIT_PER_REGION   每个地区同时执行的请求数（默认 0，不限制）
+    ADMIN_LIMIT_WEIGHTS      调用方权重，如 "dashboard:4,batch:1"（未列出的为 1）
+    ADMIN_PRIORITY_AGING     排队等待多少秒提升一级优先级（默认 30）
+"""
+
+import os
+import time
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from metrics import DurationStats
+
+GLOBAL_LIMIT = int(os.getenv("ADMIN_LIMIT_GLOBAL", os.getenv("ADMIN_JOB_WORKERS", "4")))
+# 执行道 -> 同时执行的请求数
+LANE_LIMITS = {
+    "image": int(os.getenv("ADMIN_LANE_IMAGE_WORKERS", str(max(1, GLOBAL_LIMIT - 1)))),
+    "video": int(os.getenv("ADMIN_LANE_VIDEO_WORKERS", "2")),
+}
+ACCOUNT_LIMIT = int(os.getenv("ADMIN_LIMIT_PER_ACCOUNT", "2"))
+REGION_LIMIT = int(os.getenv("ADMIN_LIMIT_PER_REGION", "0"))
+
+# 优先级 -> 级别（小的先执行）
+PRIORITIES = {"interactive": 0, "normal": 1, "bulk": 2}
+DEFAULT_PRIORITY = "normal"
+PRIORITY_AGING = float(os.getenv("ADMIN_PRIORITY_AGING", "30"))
+
+DEFAULT_CALLER = "default"
+
+# 等待账户空出时，最多等这么久重新尝试选择（积分刷新等也可能让账户重新可用）
+RELEASE_POLL_INTERVAL = 5
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """解析 "caller:weight,..." 格式的权重配置"""
+    weights = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        caller, _, weight = item.partition(":")
+        try:
+            weights[caller.strip()] = max(float(weight), 0.01)
+        except ValueError:
+            raise ValueError(f"无效的调用方权重: {item}")
+    return weights
+
+
+CALLER_WEIGHTS = parse_weights(os.getenv("ADMIN_LIMIT_WEIGHTS", ""))
+
+
+class Slot:
+    """一个已获得（或正在等待）执行道名额的请求"""
+
+    def __init__(self, lane: str, caller: str, priority: str):
+        self.lane = lane
+        self.caller = caller
+        self.priority = priority
+        self.account_id: Optional[int] = None
+        self.region: Optional[str] = None
+        self.enqueued = time.perf_counter()
+        self.granted: Optional[float] = None
+        self.released = False
+
+
+class _Waiter:
+    def __init__(self, slot: Slot, level: int, start: float, finish: float, seq: int, future: asyncio.Future):
+        self.slot = slot
+        self.level = level
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+        self.future = future
+
+    def rank(self, now: float, aging: float) -> tuple:
+        """排队顺序：老化后的优先级级别、公平排队虚拟完成时间、到达顺序"""
+        level = self.level
+        if aging > 0:
+            level = max(0, level - int((now - self.slot.enqueued) / aging))
+        return (level, self.finish, self.seq)
+
+
+class _Lane:
+    """单个执行道：名额、等待队列和调用方公平排队的虚拟时间"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.waiters: list = []
+        self.active = 0
+        self.granted = 0
+        self.vtime = 0.0
+        self.finish: Dict[str, float] = {}
+        # 调用方在本道中排队 + 执行中的请求数，归零时删除其虚拟完成时间（调用方由请求提供，不能无限累积）
+        self.pending: Dict[str, int] = {}
+        self.wait_stats = DurationStats()
+        self.run_stats = DurationStats()
+
+    def snapshot(self) -> dict:
+        queued: Dict[str, int] = {}
+        for waiter in self.waiters:
+            queued[waiter.slot.priority] = queued.get(waiter.slot.priority, 0) + 1
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": len(self.waiters),
+            "queued_by_priority": queued,
+            "granted": self.granted,
+            "wait": self.wait_stats.snapshot(),
+            "run": self.run_stats.snapshot(),
+        }
+
+
+class ConcurrencyLimiter:
+    """
+    执行道并发上限 + 全局上限 + 账户 / 地区上限 + 优先级和调用方加权公平排队
+
+    用法:
+        async with concurrency_limiter.slot("image", caller, priority) as slot:
+            async with concurrency_limiter.pick_lock:
+                exclude = concurrency_limiter.saturated(env_accounts)
+                ... 选择账户 ...
+                concurrency_limiter.try_bind(slot, account_id, region)
+            ... 调用上游 ...
+    """
+
+    def __init__(
+        self,
+        lane_limits: Dict[str, int] = None,
+        global_limit: int = GLOBAL_LIMIT,
+        account_limit: int = ACCOUNT_LIMIT,
+        region_limit: int = REGION_LIMIT,
+        weights: Dict[str, float] = None,
+        aging: float = PRIORITY_AGING,
+    ):
+        self.lane_limits = dict(LANE_LIMITS if lane_limits is None else lane_limits)
+        self.global_limit = global_limit
+        self.account_limit = account_limit
+        self.region_limit = region_limit
+        self.weights = CALLER_WEIGHTS if weights is None else weights
+        self.aging = aging
+        self.reset()
+
+    def reset(self):
+        """清空排队和计数（在新的事件循环中启动时调用）"""
+        self._lanes = {name: _Lane(name, limit) for name, limit in self.lane_limits.items()}
+        self._seq = itertools.count()
+        self._active = 0
+        self._release_waiters: list = []
+        self.pick_lock = asyncio.Lock()
+        self._accounts: Dict[int, int] = {}
+        self._regions: Dict[str, int] = {}
+        self._caller_active: Dict[str, int] = {}
+
+    def weight(self, caller: str) -> float:
+        return self.weights.get(caller, 1.0)
+
+    # ---------- 执行道名额 ----------
+
+    async def acquire(self, lane: str, caller: str = DEFAULT_CALLER, priority: str = DEFAULT_PRIORITY) -> Slot:
+        """在执行道内按优先级和公平顺序等待一个名额"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知优先级: {priority}")
+        state = self._lanes[lane]
+        slot = Slot(lane, caller, priority)
+        start = max(state.vtime, state.finish.get(caller, 0.0))
+        finish = start + 1.0 / self.weight(caller)
+        state.finish[caller] = finish
+        state.pending[caller] = state.pending.get(caller, 0) + 1
+
+        if state.active < state.limit and not state.waiters and not self._global_full():
+            state.vtime = start
+            self._grant(state, slot)
+            return slot
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(slot, PRIORITIES[priority], start, finish, next(self._seq), future)
+        state.waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已经分配但请求被取消
+                self.release(slot)
+            else:
+                state.waiters.remove(waiter)
+                self._forget(state, caller)
+            raise
+        return slot
+
+    def _grant(self, state: _Lane, slot: Slot):
+        slot.granted = time.perf_counter()
+        state.wait_stats.record(slot.granted - slot.enqueued)
+        state.active += 1
+        state.granted += 1
+        self._active += 1
+        self._caller_active[slot.caller] = self._caller_active.get(slot.caller, 0) + 1
+
+    def _global_full(self) -> bool:
+        return bool(self.global_limit) and self._active >= self.global_limit
+
+    def _dispatch(self):
+        # 老化让排序随时间变化，每次按当前时间挑选（等待队列通常不长）
+        now = time.perf_counter()
+        while not self._global_full():
+            # 各道排在最前的请求，跨道按老化后的优先级、到达时间比较（各道的虚拟时间不可比较）
+            best = None
+            for state in self._lanes.values():
+                if state.active >= state.limit or not state.waiters:
+                    continue
+                waiter = min(state.waiters, key=lambda w: w.rank(now, self.aging))
+                key = (waiter.rank(now, self.aging)[0], waiter.slot.enqueued)
+                if best is None or key < best[0]:
+                    best = (key, state, waiter)
+            if best is None:
+                return
+            _, state, waiter = best
+            state.waiters.remove(waiter)
+            state.vtime = max(state.vtime, waiter.start)
+            self._grant(state, waiter.slot)
+            waiter.future.set_result(None)
+
+    def _forget(self, state: _Lane, caller: str):
+        """调用方在本道中没有排队或执行中的请求时删除其公平排队状态（下次到达从当前虚拟时间开始）"""
+        self._decrement(state.pending, caller)
+        if caller not in state.pending:
+            state.finish.pop(caller, None)
+
+    def release(self, slot: Slot):
+        """归还名额（重复调用无效）"""
+        if slot.released or slot.granted is None:
+            return
+        slot.released = True
+        state = self._lanes[slot.lane]
+        state.active -= 1
+        self._active -= 1
+        state.run_stats.record(time.perf_counter() - slot.granted)
+        self._decrement(self._caller_active, slot.caller)
+        self._forget(state, slot.caller)
+        self.unbind(slot)
+        self._dispatch()
+
+    @staticmethod
+    def _decrement(counts: dict, key):
+        counts[key] -= 1
+        if counts[key] <= 0:
+            del counts[key]
+
+    @asynccontextmanager
+    async def slot(self, lane: str, caller: str = DEFAULT_CALLER, priority: str = DEFAULT_PRIORITY):
+        slot = await self.acquire(lane, caller, priority)
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    # ---------- 账户 / 地区上限 ----------
+
+    def _account_full(self, account_id: int, region: Optional[str]) -> bool:
+        if self.account_limit and self._accounts.get(account_id, 0) >= self.account_limit:
+            return True
+        return bool(self.region_limit and region is not None and self._regions.get(region, 0) >= self.region_limit)
+
+    def saturated(self, env_accounts: dict) -> set:
+        """已达到账户或地区上限的账户（选择账户时排除）"""
+        return {
+            account_id for account_id, account in env_accounts.items()
+            if self._account_full(account_id, account.get("region"))
+        }
+
+    def try_bind(self, slot: Slot, account_id: int, region: Optional[str]) -> bool:
+        """把名额计入账户和地区，已达上限时返回 False（应在 pick_lock 内与选择账户一起调用）"""
+        if self._account_full(account_id, region):
+            return False
+        slot.account_id = account_id
+        slot.region = region
+        self._accounts[account_id] = self._accounts.get(account_id, 0) + 1
+        if region is not None:
+            self._regions[region] = self._regions.get(region, 0) + 1
+        return True
+
+    def unbind(self, slot: Slot):
+        """把名额从账户和地区计数中移除（换账户重试前调用），并唤醒等待账户空出的请求"""
+        if slot.account_id is not None:
+            self._decrement(self._accounts, slot.account_id)
+            if slot.region is not None:
+                self._decrement(self._regions, slot.region)
+            slot.account_id = None
+            slot.region = None
+
+        waiters, self._release_waiters = self._release_waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+
+    async def wait_release(self, timeout: float = RELEASE_POLL_INTERVAL):
+        """等待任意名额归还（最多 timeout 秒）"""
+        future = asyncio.get_running_loop().create_future()
+        self._release_waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def snapshot(self) -> dict:
+        queued: Dict[str, int] = {}
+        for state in self._lanes.values():
+            for waiter in state.waiters:
+                queued[waiter.slot.caller] = queued.get(waiter.slot.caller, 0) + 1
+        callers = sorted(set(queued) | set(self._caller_active))
+        return {
+            "limits": {
+                "global": self.global_limit,
+                "per_account": self.account_limit,
+                "per_region": self.region_limit,
+                "priority_aging": self.aging,
+            },
+            "active": self._active,
+            "lanes": {name: state.snapshot() for name, state in self._lanes.items()},
+            "by_account": {str(key): value for key, value in self._accounts.items()},
+            "by_region": dict(self._regions),
+            "by_caller": {
+                caller: {
+                    "weight": self.weight(caller),
+                    "active": self._caller_active.get(caller, 0),
+                    "queued": queued.get(caller, 0),
+                }
+                for caller in callers
+            },
+        }
+
+
+# 全局并发限制
+concurrency_limiter = ConcurrencyLimiter()
@@ -0,0 +1,23 @@
+"""
+测试公共配置
+test_credits.py 是直接请求线上积分接口的手动脚本（导入即执行），不作为自动测试收集
+"""
+
+import pytest
+
+import db_manager
+from db_migrations import run_migrations
+
+collect_ignore = ["test_credits.py"]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """全局连接池指向临时目录中迁移到最新版本的空数据库（不导入仓库中的 accounts.json）"""
+    monkeypatch.chdir(tmp_path)
+    db_manager.close_pool()
+    db_manager.init_pool(str(tmp_path / "data.db"))
+    with db_manager.get_db() as conn:
+        run_migrations(conn)
+    yield
+    db_manager.close_pool()
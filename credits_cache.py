@@ -0,0 +1,170 @@
+"""
+账户积分缓存（stale-while-revalidate）
+accounts 表中的积分即缓存内容：未超过 TTL 直接返回；超过 TTL 时立即返回旧值，同时在后台刷新。
+同一账户同一时间只有一个刷新在进行（single-flight），多个账户一起过期时合并为一次批量刷新，
+对 jimeng-api 的请求量只与账户数和 TTL 有关，与页面访问量无关
+"""
+
+import os
+import time
+import asyncio
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from account_manager import get_account, get_env_accounts, iter_refresh_all_credits
+
+# 积分缓存有效期（秒）
+CREDITS_TTL = float(os.getenv("ADMIN_CREDITS_TTL", "300"))
+
+
+def _parse_last_update(value: str) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value).timestamp() if value else None
+    except ValueError:
+        return None
+
+
+class CreditsCache:
+    """
+    按账户的积分缓存
+
+    缓存时间取进程内记录的最近一次刷新与 accounts.last_update（其他进程刷新、扣费时更新）中较新的一个；
+    刷新失败的账户也记录刷新时间，TTL 内不会反复请求；
+    token 失效记录在 refresh_error，jimeng-api 无法连接记为 unreachable（不改变上次的有效性判断）；
+    .env 中没有 token 的账户（如从 accounts.json 导入）无法刷新，标记为 managed=false，不算过期
+    """
+
+    def __init__(self, ttl: float = CREDITS_TTL):
+        self.ttl = ttl
+        self._fetched_at: Dict[int, float] = {}
+        self._errors: Dict[int, str] = {}
+        self._unreachable: set = set()
+        self._inflight: Dict[int, asyncio.Task] = {}
+        self.refreshes = 0
+        self.refreshed_accounts = 0
+
+    def age(self, account_id: int, last_update: str = None) -> Optional[float]:
+        """距上次从 jimeng-api 刷新的秒数，未知时为 None"""
+        candidates = [t for t in (self._fetched_at.get(account_id), _parse_last_update(last_update)) if t is not None]
+        return max(0.0, time.time() - max(candidates)) if candidates else None
+
+    def is_stale(self, age: Optional[float], max_age: float = None) -> bool:
+        return age is None or age > (self.ttl if max_age is None else max_age)
+
+    async def _run_refresh(self, account_ids: List[int]):
+        self.refreshes += 1
+        try:
+            async for event in iter_refresh_all_credits(account_ids=account_ids):
+                if event["event"] != "progress":
+                    continue
+                if event["valid"]:
+                    self._errors.pop(event["id"], None)
+                    self._unreachable.discard(event["id"])
+                elif event.get("unreachable"):
+                    self._unreachable.add(event["id"])
+                else:
+                    self._errors[event["id"]] = event["error"] or "token 无效"
+                    self._unreachable.discard(event["id"])
+            now = time.time()
+            for account_id in account_ids:
+                self._fetched_at[account_id] = now
+            self.refreshed_accounts += len(account_ids)
+        finally:
+            for account_id in account_ids:
+                self._inflight.pop(account_id, None)
+
+    def revalidate(self, account_ids: Iterable[int]) -> Optional[asyncio.Task]:
+        """
+        在后台刷新一组账户（已在刷新中或 .env 中没有 token 的跳过），其余账户合并为一次批量刷新
+
+        Returns:
+            新建的刷新任务，全部已在刷新中时为 None
+        """
+        env_accounts = get_env_accounts()
+        pending = [
+            account_id for account_id in account_ids
+            if account_id in env_accounts and account_id not in self._inflight
+        ]
+        if not pending:
+            return None
+        task = asyncio.get_running_loop().create_task(self._run_refresh(pending))
+        for account_id in pending:
+            self._inflight[account_id] = task
+        return task
+
+    async def wait(self, account_id: int):
+        """等待账户当前的刷新完成（没有则发起一次）"""
+        task = self._inflight.get(account_id) or self.revalidate([account_id])
+        if task is not None:
+            # shield: 一个请求断开不会取消其他请求共享的刷新
+            await asyncio.shield(task)
+
+    def refresh_error(self, account_id: int) -> Optional[str]:
+        """上次刷新确认 token 失效时的错误信息"""
+        return self._errors.get(account_id)
+
+    def is_unreachable(self, account_id: int) -> bool:
+        """上次刷新时 jimeng-api 是否无法连接"""
+        return account_id in self._unreachable
+
+    def annotate(self, accounts: List[dict], max_age: float = None) -> List[dict]:
+        """给账户列表加上 age / stale / refreshing / managed，并在后台刷新过期的账户"""
+        env_accounts = get_env_accounts()
+        stale_ids = []
+        for account in accounts:
+            age = self.age(account["id"], account.get("last_update"))
+            managed = account["id"] in env_accounts
+            stale = managed and self.is_stale(age, max_age)
+            account["age"] = None if age is None else round(age, 1)
+            account["stale"] = stale
+            account["managed"] = managed
+            if stale:
+                stale_ids.append(account["id"])
+        self.revalidate(stale_ids)
+        for account in accounts:
+            account["refreshing"] = account["id"] in self._inflight
+            if account["id"] in self._errors:
+                account["refresh_error"] = self._errors[account["id"]]
+            if account["id"] in self._unreachable:
+                account["unreachable"] = True
+        return accounts
+
+    async def get(self, account_id: int, max_age: float = None) -> Optional[dict]:
+        """
+        获取单个账户的积分
+
+        已有缓存时立即返回（过期则后台刷新）；从未刷新过的账户等待第一次刷新完成。
+        账户表中没有该账户（如 token 失效、从未成功刷新）时返回 None
+
+        Args:
+            max_age: 可接受的最大缓存时间（秒），0 表示等待实时查询
+        """
+        account = await asyncio.to_thread(get_account, account_id)
+        age = None if account is None else self.age(account_id, account["last_update"])
+        if account is None or age is None or max_age == 0:
+            await self.wait(account_id)
+            account = await asyncio.to_thread(get_account, account_id)
+            if account is None:
+                return None
+            max_age = None
+        return self.annotate([account], max_age)[0]
+
+    async def stop(self):
+        """取消进行中的后台刷新（应用关闭时调用）"""
+        tasks = set(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        return {
+            "ttl": self.ttl,
+            "tracked": len(self._fetched_at),
+            "inflight": len(self._inflight),
+            "refreshes": self.refreshes,
+            "refreshed_accounts": self.refreshed_accounts,
+        }
+
+
+# 全局积分缓存
+credits_cache = CreditsCache()
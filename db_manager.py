@@ -0,0 +1,380 @@
+"""
+Dreamina 管理后台数据库管理器
+长连接池 + WAL 模式；同步代码通过 get_db() 获取连接，
+异步接口通过 db_read()/db_write() 在线程池中执行，不阻塞事件循环，
+插入/更新通过 write_queue 合并成批量提交
+"""
+
+import os
+import queue
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional
+
+# 数据库文件
+DB_FILE = os.getenv("ADMIN_DB_FILE", "data.db")
+
+# 连接池大小
+POOL_SIZE = int(os.getenv("ADMIN_DB_POOL_SIZE", "4"))
+
+# 获取连接的最长等待时间（秒）
+POOL_TIMEOUT = 30
+
+# 批量写入：攒够 N 条或等待 M 毫秒后合并为一次提交
+WRITE_BATCH_SIZE = int(os.getenv("ADMIN_DB_WRITE_BATCH", "100"))
+WRITE_FLUSH_MS = int(os.getenv("ADMIN_DB_WRITE_FLUSH_MS", "10"))
+
+# 每个连接建立时执行的 PRAGMA
+# journal_mode=WAL: 读写互不阻塞
+# synchronous=NORMAL: WAL 模式下安全且只在 checkpoint 时 fsync
+# cache_size: 负数表示 KiB，这里约 64MB
+# mmap_size: 256MB 内存映射读取
+CONNECTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+
+class ConnectionPool:
+    """SQLite 长连接池（线程安全）"""
+
+    def __init__(self, db_file: str = DB_FILE, size: int = POOL_SIZE):
+        self.db_file = db_file
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._all = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        for _ in range(self.size):
+            conn = self._connect()
+            self._all.append(conn)
+            self._idle.put(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        """建立一个新连接并应用 PRAGMA"""
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in CONNECTION_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，正常退出时提交，异常时回滚"""
+        if self._closed:
+            raise RuntimeError("连接池已关闭")
+        try:
+            conn = self._idle.get(timeout=POOL_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError(f"获取数据库连接超时 ({POOL_TIMEOUT}s)")
+
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close_all(self):
+        """关闭所有连接"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for conn in self._all:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._all.clear()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(db_file: str = DB_FILE, size: int = POOL_SIZE) -> ConnectionPool:
+    """初始化全局连接池（重复调用返回已有连接池）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(db_file, size)
+            print(f"[数据库] 连接池已创建: {db_file} (连接数: {_pool.size}, WAL)")
+        return _pool
+
+
+def get_pool() -> ConnectionPool:
+    """获取全局连接池，未初始化时自动创建"""
+    return _pool or init_pool()
+
+
+@contextmanager
+def get_db():
+    """
+    获取数据库连接（唯一入口）
+
+    用法:
+        with get_db() as conn:
+            conn.execute(...)
+    """
+    with get_pool().connection() as conn:
+        yield conn
+
+
+def close_pool():
+    """关闭异步访问层和全局连接池"""
+    global _pool, _async_db
+    with _pool_lock:
+        if _async_db is not None:
+            _async_db.close()
+            _async_db = None
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+            print("[数据库] 连接池已关闭")
+
+
+# ============ 异步访问层 ============
+
+class AsyncDatabase:
+    """
+    基于线程池的异步数据库访问层
+
+    - 读: 多个读线程并发，各自从连接池借用连接
+    - 写: 单独一个写线程持有专用连接，所有写操作串行执行，避免写锁竞争
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=pool.size, thread_name_prefix="db-read"
+        )
+        self._write_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="db-write"
+        )
+        self._writer_conn: Optional[sqlite3.Connection] = None
+
+    def _run_read(self, fn: Callable, args: tuple) -> Any:
+        with self.pool.connection() as conn:
+            return fn(conn, *args)
+
+    def _run_write(self, fn: Callable, args: tuple) -> Any:
+        # 只在写线程中访问，无需加锁
+        if self._writer_conn is None:
+            self._writer_conn = self.pool._connect()
+        conn = self._writer_conn
+        try:
+            result = fn(conn, *args)
+            if conn.in_transaction:
+                conn.commit()
+            return result
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+    async def read(self, fn: Callable, *args) -> Any:
+        """在读线程中执行 fn(conn, *args)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._run_read, fn, args)
+
+    async def write(self, fn: Callable, *args) -> Any:
+        """在写线程中执行 fn(conn, *args)，成功后提交"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, self._run_write, fn, args)
+
+    def close(self):
+        """等待未完成的操作结束并关闭写连接"""
+        self._read_executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
+        if self._writer_conn is not None:
+            self._writer_conn.close()
+            self._writer_conn = None
+
+
+_async_db: Optional[AsyncDatabase] = None
+
+
+def get_async_db() -> AsyncDatabase:
+    """获取全局异步访问层，未初始化时自动创建"""
+    global _async_db
+    if _async_db is None:
+        pool = get_pool()
+        with _pool_lock:
+            if _async_db is None:
+                _async_db = AsyncDatabase(pool)
+    return _async_db
+
+
+async def db_read(fn: Callable, *args) -> Any:
+    """异步读: fn(conn, *args) 在读线程中执行"""
+    return await get_async_db().read(fn, *args)
+
+
+async def db_write(fn: Callable, *args) -> Any:
+    """异步写: fn(conn, *args) 在写线程中执行"""
+    return await get_async_db().write(fn, *args)
+
+
+async def fetch_all(sql: str, params=()) -> List[dict]:
+    """查询多行，返回字典列表"""
+    def _query(conn):
+        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+    return await db_read(_query)
+
+
+async def fetch_one(sql: str, params=()) -> Optional[sqlite3.Row]:
+    """查询单行"""
+    def _query(conn):
+        return conn.execute(sql, params).fetchone()
+    return await db_read(_query)
+
+
+async def execute(sql: str, params=()) -> int:
+    """执行一条写语句，返回受影响行数"""
+    def _execute(conn):
+        return conn.execute(sql, params).rowcount
+    return await db_write(_execute)
+
+
+# ============ 批量写入队列 ============
+
+_STOP = object()
+
+
+def _apply_batch(conn: sqlite3.Connection, items: list) -> list:
+    """
+    在同一个事务中执行一批写语句（写线程中调用）
+
+    每条语句包在 SAVEPOINT 中，单条失败只回滚自己，不影响同批其他语句。
+    返回与 items 对应的结果列表：受影响行数或异常对象
+    """
+    # 显式开启外层事务，否则释放最外层 SAVEPOINT 会直接提交
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    results = []
+    for sql, params in items:
+        if sql is None:
+            results.append(None)
+            continue
+        conn.execute("SAVEPOINT write_item")
+        try:
+            rowcount = conn.execute(sql, params).rowcount
+            conn.execute("RELEASE write_item")
+            results.append(rowcount)
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK TO write_item")
+            conn.execute("RELEASE write_item")
+            results.append(e)
+    return results
+
+
+class WriteBehindQueue:
+    """
+    单写线程的批量写入队列
+
+    - 写请求进入队列，攒够 batch_size 条或等待 flush_ms 毫秒后在写线程中一次提交
+    - submit()/write() 返回的 Future 在所在批次提交后完成，结果为受影响行数；
+      write() 返回时数据已提交，之后的读取一定能读到刚写入的数据
+    - close() 会先把队列中剩余的写入全部提交
+    """
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE, flush_ms: int = WRITE_FLUSH_MS):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """启动后台提交任务（需在事件循环中调用）"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, sql: Optional[str], params=()) -> asyncio.Future:
+        """加入队列，返回在提交后完成的 Future"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((sql, params, future))
+        return future
+
+    async def write(self, sql: str, params=()) -> int:
+        """加入队列并等待提交，返回受影响行数（失败时抛出对应异常）"""
+        return await self.submit(sql, params)
+
+    async def flush(self):
+        """等待此前加入队列的所有写入提交"""
+        if self._task is not None and not self._task.done():
+            await self.submit(None)
+
+    def pending(self) -> int:
+        """队列中待提交的写入数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._commit(batch)
+
+    async def _commit(self, batch: list):
+        try:
+            results = await db_write(_apply_batch, [(sql, params) for sql, params, _ in batch])
+        except Exception as e:
+            print(f"[数据库] 批量提交失败 ({len(batch)} 条): {e}")
+            results = [e] * len(batch)
+
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        """提交剩余写入并停止后台任务"""
+        if self._task is None:
+            return
+        if not self._task.done():
+            self._queue.put_nowait(_STOP)
+            await self._task
+        self._task = None
+
+
+# 全局批量写入队列
+write_queue = WriteBehindQueue()
@@ -0,0 +1,620 @@
+"""
+Dreamina 管理后台数据库迁移
+schema_version 表记录已应用的版本，启动时按顺序执行未应用的前向迁移
+
+用法:
+    python db_migrations.py               # 执行迁移
+    python db_migrations.py --status      # 查看迁移状态
+    python db_migrations.py --check-plans # 检查关键查询是否走索引（有全表扫描/临时排序时返回非 0）
+"""
+
+import sqlite3
+from typing import Callable, List, Tuple
+
+# (版本号, 说明, 迁移函数)
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+
+def migration(version: int, name: str):
+    """注册一个迁移，函数接收 conn，在事务中执行"""
+    def decorator(fn: Callable) -> Callable:
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return decorator
+
+
+# ============ 迁移列表 ============
+
+@migration(1, "初始表结构")
+def _m001_initial_schema(conn: sqlite3.Connection):
+    # 任务记录表
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id TEXT UNIQUE,
+            account_id INTEGER,
+            task_type TEXT,
+            prompt TEXT,
+            status TEXT DEFAULT 'pending',
+            result_url TEXT,
+            credits_used INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # 积分记录表
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS credit_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id INTEGER,
+            change_amount INTEGER,
+            change_type TEXT,
+            balance_after INTEGER,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+@migration(2, "按查询形态建立任务和积分记录索引")
+def _m002_query_indexes(conn: sqlite3.Connection):
+    # /api/tasks 无筛选、按状态、按类型筛选时按 created_at 倒序
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks (status, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_type_created ON tasks (task_type, created_at)")
+    # /api/tasks 按账户筛选
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_account_created ON tasks (account_id, created_at)")
+    # /api/history 按 (account_id, task_type) 取 task_id，覆盖索引无需回表
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tasks_account_type_created
+        ON tasks (account_id, task_type, created_at, task_id)
+    """)
+    # /api/credit-logs
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_credit_logs_created ON credit_logs (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_credit_logs_account_created ON credit_logs (account_id, created_at)")
+
+
+def _task_stats_upserts(row: str, sign: str, day: bool = False) -> str:
+    """生成触发器中按 NEW/OLD 行增减 task_stats 各维度计数的语句（day 时包含按日维度）"""
+    dimensions = [
+        ("total", "''"),
+        ("status", f"COALESCE({row}.status, '')"),
+        ("type", f"COALESCE({row}.task_type, '')"),
+        ("account", f"COALESCE(CAST({row}.account_id AS TEXT), '')"),
+    ]
+    if day:
+        from task_stats import stats_day_sql
+        dimensions.append(("day", stats_day_sql(f"{row}.created_ms")))
+    return "\n".join(f"""
+            INSERT INTO task_stats (dimension, key, count, credits)
+            VALUES ('{dimension}', {key}, {sign}1, {sign}COALESCE({row}.credits_used, 0))
+            ON CONFLICT (dimension, key) DO UPDATE SET
+                count = count + excluded.count,
+                credits = credits + excluded.credits;""" for dimension, key in dimensions)
+
+
+@migration(3, "任务统计计数表及维护触发器")
+def _m003_task_stats(conn: sqlite3.Connection):
+    from task_stats import rebuild_task_stats
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS task_stats (
+            dimension TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            credits INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, key)
+        ) WITHOUT ROWID
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_stats_insert AFTER INSERT ON tasks
+        BEGIN {_task_stats_upserts("NEW", "+")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_stats_delete AFTER DELETE ON tasks
+        BEGIN {_task_stats_upserts("OLD", "-")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_stats_update
+        AFTER UPDATE OF status, task_type, account_id, credits_used, created_at ON tasks
+        BEGIN {_task_stats_upserts("OLD", "-")}
+        {_task_stats_upserts("NEW", "+")}
+        END
+    """)
+    # 按日维度依赖迁移 13 的 task_stats_days
+    rebuild_task_stats(conn, ("total", "status", "type", "account"))
+
+
+@migration(4, "任务和积分记录增加毫秒时间戳列并回填")
+def _m004_created_ms(conn: sqlite3.Connection):
+    for table in ("tasks", "credit_logs"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN created_ms INTEGER")
+        conn.execute(f"""
+            UPDATE {table}
+            SET created_ms = CAST(strftime('%s', created_at) AS INTEGER) * 1000
+            WHERE created_ms IS NULL
+        """)
+        # 未显式写入 created_ms 的插入（旧代码/外部脚本）由触发器补齐
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_created_ms AFTER INSERT ON {table}
+            WHEN NEW.created_ms IS NULL
+            BEGIN
+                UPDATE {table}
+                SET created_ms = CAST(strftime('%s', NEW.created_at) AS INTEGER) * 1000
+                WHERE id = NEW.id;
+            END
+        """)
+
+    # 排序和时间范围统一改用 created_ms，替换基于 created_at 的索引
+    for index in (
+        "idx_tasks_created",
+        "idx_tasks_status_created",
+        "idx_tasks_type_created",
+        "idx_tasks_account_created",
+        "idx_tasks_account_type_created",
+        "idx_credit_logs_created",
+        "idx_credit_logs_account_created",
+    ):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created_ms ON tasks (created_ms)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_created_ms ON tasks (status, created_ms)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_type_created_ms ON tasks (task_type, created_ms)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_account_created_ms ON tasks (account_id, created_ms)")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tasks_account_type_created_ms
+        ON tasks (account_id, task_type, created_ms, task_id)
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_credit_logs_created_ms ON credit_logs (created_ms)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_credit_logs_account_created_ms ON credit_logs (account_id, created_ms)")
+
+
+def _rollup_upserts(row: str, sign: str) -> str:
+    """生成触发器中按 NEW/OLD 行增减小时汇总桶的语句"""
+    return f"""
+            INSERT INTO task_rollups_hourly
+                (bucket_ms, account_id, model, task_type, total, completed, failed, timeouts, credits_used)
+            VALUES (
+                {row}.created_ms - {row}.created_ms % 3600000,
+                COALESCE({row}.account_id, 0), COALESCE({row}.model, ''), COALESCE({row}.task_type, ''),
+                {sign}1,
+                {sign}(COALESCE({row}.status, '') = 'completed'),
+                {sign}(COALESCE({row}.status, '') = 'failed'),
+                {sign}(COALESCE({row}.status, '') = 'timeout'),
+                {sign}COALESCE({row}.credits_used, 0)
+            )
+            ON CONFLICT (bucket_ms, account_id, model, task_type) DO UPDATE SET
+                total = total + excluded.total,
+                completed = completed + excluded.completed,
+                failed = failed + excluded.failed,
+                timeouts = timeouts + excluded.timeouts,
+                credits_used = credits_used + excluded.credits_used;"""
+
+
+@migration(5, "任务增加模型列，建立小时/日汇总表")
+def _m005_rollups(conn: sqlite3.Connection):
+    from task_rollups import rebuild_rollups
+
+    conn.execute("ALTER TABLE tasks ADD COLUMN model TEXT")
+
+    for table in ("task_rollups_hourly", "task_rollups_daily"):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket_ms INTEGER NOT NULL,
+                account_id INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                task_type TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                timeouts INTEGER NOT NULL DEFAULT 0,
+                credits_used INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket_ms, account_id, model, task_type)
+            ) WITHOUT ROWID
+        """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+
+    # created_ms 为空的插入由 trg_tasks_created_ms 补齐后经 UPDATE 触发器计入
+    watched = "status, task_type, account_id, model, credits_used, created_ms"
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_rollup_insert AFTER INSERT ON tasks
+        WHEN NEW.created_ms IS NOT NULL
+        BEGIN {_rollup_upserts("NEW", "+")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_rollup_delete AFTER DELETE ON tasks
+        WHEN OLD.created_ms IS NOT NULL
+        BEGIN {_rollup_upserts("OLD", "-")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_rollup_update_old AFTER UPDATE OF {watched} ON tasks
+        WHEN OLD.created_ms IS NOT NULL
+        BEGIN {_rollup_upserts("OLD", "-")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_rollup_update_new AFTER UPDATE OF {watched} ON tasks
+        WHEN NEW.created_ms IS NOT NULL
+        BEGIN {_rollup_upserts("NEW", "+")}
+        END
+    """)
+
+    rebuild_rollups(conn)
+
+
+@migration(6, "任务提示词全文索引")
+def _m006_tasks_fts(conn: sqlite3.Connection):
+    # 外部内容表，不重复存储 prompt；trigram 分词对中文同样可做子串匹配
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            prompt,
+            content='tasks',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_insert AFTER INSERT ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (rowid, prompt) VALUES (NEW.id, NEW.prompt);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_delete AFTER DELETE ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, prompt) VALUES ('delete', OLD.id, OLD.prompt);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_update AFTER UPDATE OF prompt ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, prompt) VALUES ('delete', OLD.id, OLD.prompt);
+            INSERT INTO tasks_fts (rowid, prompt) VALUES (NEW.id, NEW.prompt);
+        END
+    """)
+    conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+
+@migration(7, "账户积分表，导入 accounts.json")
+def _m007_accounts(conn: sqlite3.Connection):
+    from account_manager import import_accounts_json
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS accounts (
+            id INTEGER PRIMARY KEY,
+            credits INTEGER NOT NULL DEFAULT 0,
+            gift_credit INTEGER NOT NULL DEFAULT 0,
+            purchase_credit INTEGER NOT NULL DEFAULT 0,
+            vip_credit INTEGER NOT NULL DEFAULT 0,
+            email TEXT,
+            region TEXT,
+            token TEXT,
+            last_update TEXT
+        )
+    """)
+    # 账户相关的全局状态（如 last_reset_date）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS account_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    import_accounts_json(conn)
+
+
+@migration(8, "账户选择状态列及按策略排序的部分索引")
+def _m008_account_selection(conn: sqlite3.Connection):
+    # in_flight: 进行中的生成请求数；last_picked_ms: 最近被选中的时间；
+    # disabled_until_ms: token 失效等异常后的冷却截止时间
+    conn.execute("ALTER TABLE accounts ADD COLUMN in_flight INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE accounts ADD COLUMN last_picked_ms INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE accounts ADD COLUMN disabled_until_ms INTEGER NOT NULL DEFAULT 0")
+
+    # 只索引积分 >= MIN_CREDITS(4) 的账户，耗尽的账户不会出现在选择扫描中
+    # 选择查询带上 credits >= 4 条件并用 INDEXED BY 指定索引（见 account_manager.SELECTION_POLICIES）
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_accounts_pick_credits ON accounts (credits DESC, id) WHERE credits >= 4")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_accounts_pick_round_robin ON accounts (last_picked_ms, id) WHERE credits >= 4")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_accounts_pick_least_loaded ON accounts (in_flight, credits DESC, id) WHERE credits >= 4")
+
+
+
+@migration(9, "积分预留租约")
+def _m009_account_leases(conn: sqlite3.Connection):
+    # reserved: 未结束租约预留的积分合计，可用积分为 credits - reserved
+    conn.execute("ALTER TABLE accounts ADD COLUMN reserved INTEGER NOT NULL DEFAULT 0")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS account_leases (
+            lease_id TEXT PRIMARY KEY,
+            account_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            created_ms INTEGER NOT NULL,
+            expires_ms INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_account_leases_expires ON account_leases (expires_ms)")
+
+    # 按积分排序的策略改为按可用积分排序（表达式索引）
+    conn.execute("DROP INDEX IF EXISTS idx_accounts_pick_credits")
+    conn.execute("DROP INDEX IF EXISTS idx_accounts_pick_least_loaded")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_accounts_pick_available
+        ON accounts (credits - reserved DESC, id) WHERE credits >= 4
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_accounts_pick_least_loaded_available
+        ON accounts (in_flight, credits - reserved DESC, id) WHERE credits >= 4
+    """)
+
+
+@migration(10, "生成任务队列列")
+def _m010_generation_jobs(conn: sqlite3.Connection):
+    # 异步生成任务（见 generation_jobs）：job_id 为提交时返回的任务 ID，params / result 为 JSON
+    conn.execute("ALTER TABLE tasks ADD COLUMN job_id TEXT")
+    conn.execute("ALTER TABLE tasks ADD COLUMN params TEXT")
+    conn.execute("ALTER TABLE tasks ADD COLUMN result TEXT")
+    conn.execute("ALTER TABLE tasks ADD COLUMN error TEXT")
+    conn.execute("ALTER TABLE tasks ADD COLUMN started_ms INTEGER")
+    conn.execute("ALTER TABLE tasks ADD COLUMN finished_ms INTEGER")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_job_id ON tasks (job_id) WHERE job_id IS NOT NULL")
+    # 启动恢复按状态查找队列中的任务
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_job_status ON tasks (status, id) WHERE job_id IS NOT NULL")
+
+
+@migration(11, "生成任务尝试记录")
+def _m011_task_attempts(conn: sqlite3.Connection):
+    # 每次调用 jimeng-api 记录一行（失败换账户重试时一个任务有多行），category 为失败分类
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS task_attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT NOT NULL,
+            attempt INTEGER NOT NULL,
+            account_id INTEGER,
+            status TEXT NOT NULL,
+            category TEXT,
+            http_status INTEGER,
+            error TEXT,
+            started_ms INTEGER NOT NULL,
+            finished_ms INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_task_attempts_job ON task_attempts (job_id, attempt)")
+    conn.execute("ALTER TABLE tasks ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+
+@migration(12, "任务统计计数表去掉按日维度")
+def _m012_task_stats_drop_day(conn: sqlite3.Connection):
+    # 按日计数以 UTC 日期为键，与统计时区（ADMIN_TIMEZONE）的"今日"不一致且无人读取，
+    # 今日计数由 task_stats.count_range 按 created_ms 范围计算；重建触发器去掉该维度
+    for trigger in ("trg_tasks_stats_insert", "trg_tasks_stats_delete", "trg_tasks_stats_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute(f"""
+        CREATE TRIGGER trg_tasks_stats_insert AFTER INSERT ON tasks
+        BEGIN {_task_stats_upserts("NEW", "+")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_tasks_stats_delete AFTER DELETE ON tasks
+        BEGIN {_task_stats_upserts("OLD", "-")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_tasks_stats_update
+        AFTER UPDATE OF status, task_type, account_id, credits_used ON tasks
+        BEGIN {_task_stats_upserts("OLD", "-")}
+        {_task_stats_upserts("NEW", "+")}
+        END
+    """)
+    conn.execute("DELETE FROM task_stats WHERE dimension = 'day'")
+
+
+@migration(13, "任务统计计数表按统计时区的自然日计数")
+def _m013_task_stats_day(conn: sqlite3.Connection):
+    from task_stats import extend_stats_days, rebuild_task_stats
+
+    # 统计时区的自然日边界，触发器按 created_ms 查找所在日期
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS task_stats_days (
+            start_ms INTEGER PRIMARY KEY,
+            end_ms INTEGER NOT NULL,
+            day TEXT NOT NULL
+        )
+    """)
+    extend_stats_days(conn)
+
+    for trigger in ("trg_tasks_stats_insert", "trg_tasks_stats_delete", "trg_tasks_stats_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute(f"""
+        CREATE TRIGGER trg_tasks_stats_insert AFTER INSERT ON tasks
+        BEGIN {_task_stats_upserts("NEW", "+", day=True)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_tasks_stats_delete AFTER DELETE ON tasks
+        BEGIN {_task_stats_upserts("OLD", "-", day=True)}
+        END
+    """)
+    # created_ms 为空的插入先计入空 key，由 trg_tasks_created_ms 补齐后经此触发器移到对应日期
+    conn.execute(f"""
+        CREATE TRIGGER trg_tasks_stats_update
+        AFTER UPDATE OF status, task_type, account_id, credits_used, created_ms ON tasks
+        BEGIN {_task_stats_upserts("OLD", "-", day=True)}
+        {_task_stats_upserts("NEW", "+", day=True)}
+        END
+    """)
+    rebuild_task_stats(conn)
+
+
+# ============ 迁移执行 ============
+
+def _ensure_version_table(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    if conn.in_transaction:
+        conn.commit()
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """当前数据库的迁移版本（未迁移为 0）"""
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn: sqlite3.Connection) -> List[int]:
+    """
+    执行所有未应用的迁移
+
+    每个迁移在独立的 BEGIN IMMEDIATE 事务中执行，多进程同时启动时只有一个会真正执行
+
+    Returns:
+        本次应用的版本号列表
+    """
+    _ensure_version_table(conn)
+    if conn.in_transaction:
+        conn.commit()
+
+    applied = []
+    for version, name, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            exists = conn.execute(
+                "SELECT 1 FROM schema_version WHERE version = ?", (version,)
+            ).fetchone()
+            if exists:
+                conn.rollback()
+                continue
+
+            fn(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                (version, name),
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+        applied.append(version)
+        print(f"[数据库] 已应用迁移 {version:03d}: {name}")
+
+    return applied
+
+
+# ============ 查询计划检查 ============
+
+# 需要走索引的查询（名称, SQL, 参数）
+# 与 admin_server 中的查询保持一致，新增查询时同步添加
+_T = 1760000000000
+
+QUERY_PLAN_CHECKS = [
+    ("tasks 列表", "SELECT * FROM tasks WHERE 1=1 ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", (20, 0)),
+    ("tasks 按状态", "SELECT * FROM tasks WHERE status = ? ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", ("completed", 20, 0)),
+    ("tasks 按类型", "SELECT * FROM tasks WHERE task_type = ? ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", ("image", 20, 0)),
+    ("tasks 按账户", "SELECT * FROM tasks WHERE account_id = ? ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", (1, 20, 0)),
+    ("tasks 按状态+类型", "SELECT * FROM tasks WHERE status = ? AND task_type = ? ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", ("completed", "image", 20, 0)),
+    ("tasks 按状态+账户", "SELECT * FROM tasks WHERE status = ? AND account_id = ? ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", ("completed", 1, 20, 0)),
+    ("tasks 按类型+账户", "SELECT * FROM tasks WHERE task_type = ? AND account_id = ? ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", ("image", 1, 20, 0)),
+    ("tasks 按状态+类型+账户", "SELECT * FROM tasks WHERE status = ? AND task_type = ? AND account_id = ? ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", ("completed", "image", 1, 20, 0)),
+    ("tasks 时间范围", "SELECT * FROM tasks WHERE created_ms >= ? AND created_ms < ? ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", (_T, _T + 86400000, 20, 0)),
+    ("tasks 按账户+时间范围", "SELECT * FROM tasks WHERE account_id = ? AND created_ms >= ? AND created_ms < ? ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", (1, _T, _T + 86400000, 20, 0)),
+    ("tasks 计数按状态", "SELECT COUNT(*) FROM tasks WHERE status = ?", ("completed",)),
+    ("tasks 计数按账户", "SELECT COUNT(*) FROM tasks WHERE account_id = ?", (1,)),
+    ("tasks 今日计数", "SELECT COUNT(*) FROM tasks WHERE created_ms >= ? AND created_ms < ?", (_T, _T + 86400000)),
+    ("task_stats 汇总", "SELECT dimension, key, count, credits FROM task_stats WHERE dimension IN ('total', 'status', 'type', 'account')", ()),
+    ("task_stats 今日", "SELECT count FROM task_stats WHERE dimension = 'day' AND key = ?", ("2026-10-17",)),
+    ("task_stats_days 所在日期", "SELECT day FROM task_stats_days WHERE start_ms <= ? ORDER BY start_ms DESC LIMIT 1", (_T,)),
+    ("history 任务ID", "SELECT task_id FROM tasks WHERE account_id = ? AND task_type = ? ORDER BY created_ms DESC LIMIT ? OFFSET ?", (1, "image", 20, 0)),
+    ("credit_logs 列表", "SELECT * FROM credit_logs WHERE 1=1 ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", (50, 0)),
+    ("credit_logs 按账户", "SELECT * FROM credit_logs WHERE account_id = ? ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", (1, 50, 0)),
+    ("credit_logs 按账户+时间范围", "SELECT * FROM credit_logs WHERE account_id = ? AND created_ms >= ? AND created_ms < ? ORDER BY created_ms DESC, id DESC LIMIT ? OFFSET ?", (1, _T, _T + 86400000, 50, 0)),
+    ("credit_logs 计数按账户", "SELECT COUNT(*) FROM credit_logs WHERE account_id = ?", (1,)),
+    ("tasks 游标下一页", "SELECT * FROM tasks WHERE 1=1 AND (created_ms, id) < (?, ?) ORDER BY created_ms DESC, id DESC LIMIT ?", (_T, 1, 21)),
+    ("tasks 游标上一页", "SELECT * FROM tasks WHERE 1=1 AND (created_ms, id) > (?, ?) ORDER BY created_ms ASC, id ASC LIMIT ?", (_T, 1, 21)),
+    ("tasks 按状态游标", "SELECT * FROM tasks WHERE status = ? AND (created_ms, id) < (?, ?) ORDER BY created_ms DESC, id DESC LIMIT ?", ("completed", _T, 1, 21)),
+    ("tasks 按账户游标", "SELECT * FROM tasks WHERE account_id = ? AND (created_ms, id) < (?, ?) ORDER BY created_ms DESC, id DESC LIMIT ?", (1, _T, 1, 21)),
+    ("rollups 小时桶", "SELECT bucket_ms, SUM(total) FROM task_rollups_hourly WHERE bucket_ms >= ? AND bucket_ms < ? GROUP BY 1", (_T, _T + 86400000)),
+    ("rollups 日桶", "SELECT bucket_ms, SUM(total) FROM task_rollups_daily WHERE bucket_ms >= ? AND bucket_ms < ? GROUP BY 1", (_T, _T + 90 * 86400000)),
+    ("tasks 全文搜索候选", "SELECT tasks.id, tasks.prompt FROM tasks_fts JOIN tasks ON tasks.id = tasks_fts.rowid WHERE tasks_fts MATCH ? AND 1=1 ORDER BY tasks_fts.rowid DESC LIMIT ?", ('"cat"', 1000)),
+    ("accounts 选择 most_credits", "SELECT id FROM accounts INDEXED BY idx_accounts_pick_available WHERE credits >= 4 AND credits - reserved >= ? AND disabled_until_ms <= ? ORDER BY credits - reserved DESC, id LIMIT 1", (4, _T)),
+    ("accounts 选择 round_robin", "SELECT id FROM accounts INDEXED BY idx_accounts_pick_round_robin WHERE credits >= 4 AND credits - reserved >= ? AND disabled_until_ms <= ? ORDER BY last_picked_ms, id LIMIT 1", (4, _T)),
+    ("accounts 选择 least_loaded", "SELECT id FROM accounts INDEXED BY idx_accounts_pick_least_loaded_available WHERE credits >= 4 AND credits - reserved >= ? AND disabled_until_ms <= ? ORDER BY in_flight, credits - reserved DESC, id LIMIT 1", (4, _T)),
+    ("account_leases 超时", "SELECT account_id, amount FROM account_leases WHERE expires_ms <= ?", (_T,)),
+    ("credit_logs 按账户游标", "SELECT * FROM credit_logs WHERE account_id = ? AND (created_ms, id) < (?, ?) ORDER BY created_ms DESC, id DESC LIMIT ?", (1, _T, 1, 21)),
+    ("jobs 按 job_id", "SELECT * FROM tasks WHERE job_id = ?", ("0" * 32,)),
+    ("jobs 启动恢复", "SELECT job_id FROM tasks WHERE job_id IS NOT NULL AND status = ? ORDER BY id", ("queued",)),
+    ("task_attempts 按任务", "SELECT * FROM task_attempts WHERE job_id = ? ORDER BY attempt", ("0" * 32,)),
+]
+
+
+def explain(conn: sqlite3.Connection, sql: str, params=()) -> List[str]:
+    """返回 EXPLAIN QUERY PLAN 的每一步描述"""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def is_bad_plan(detail: str) -> bool:
+    """全表扫描（SCAN 表且不走索引）或额外的临时排序视为退化"""
+    if "USE TEMP B-TREE" in detail:
+        return True
+    return detail.startswith("SCAN") and "INDEX" not in detail
+
+
+def check_query_plans(conn: sqlite3.Connection) -> List[dict]:
+    """
+    检查 QUERY_PLAN_CHECKS 中的查询
+
+    Returns:
+        退化的查询列表，为空表示全部走索引
+    """
+    failures = []
+    for name, sql, params in QUERY_PLAN_CHECKS:
+        plan = explain(conn, sql, params)
+        bad = [step for step in plan if is_bad_plan(step)]
+        if bad:
+            failures.append({"name": name, "sql": sql, "plan": plan})
+    return failures
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    from db_manager import get_db, DB_FILE
+
+    parser = argparse.ArgumentParser(description="管理后台数据库迁移")
+    parser.add_argument("--status", action="store_true", help="查看迁移状态")
+    parser.add_argument("--check-plans", action="store_true", help="检查关键查询的执行计划")
+    args = parser.parse_args()
+
+    with get_db() as conn:
+        if args.status:
+            current = get_schema_version(conn)
+            print(f"数据库: {DB_FILE}  当前版本: {current}")
+            for version, name, _ in sorted(MIGRATIONS, key=lambda m: m[0]):
+                mark = "✓" if version <= current else " "
+                print(f"  [{mark}] {version:03d} {name}")
+        else:
+            run_migrations(conn)
+
+        if args.check_plans:
+            failures = check_query_plans(conn)
+            print(f"\n查询计划检查: {len(QUERY_PLAN_CHECKS) - len(failures)}/{len(QUERY_PLAN_CHECKS)} 通过")
+            for failure in failures:
+                print(f"\n✗ {failure['name']}\n  {failure['sql']}")
+                for step in failure["plan"]:
+                    print(f"    {step}")
+            if failures:
+                sys.exit(1)
@@ -0,0 +1,219 @@
+"""
+进程内事件总线
+任务状态变化、积分变化、统计增量发布到总线，/api/events 以 Server-Sent Events 推送给管理页面。
+
+每个订阅者有独立的有界缓冲区：缓冲区满时丢弃最旧的事件而不是阻塞发布方，
+订阅者下次读取时收到丢弃数量（SSE 中为 resync 事件），据此重新拉取完整数据。
+publish 可以在任意线程调用（asyncio.to_thread 中的账户操作也会发布事件）
+
+服务关闭时结束全部订阅：uvicorn 优雅关闭会先等待所有连接结束再执行 lifespan 关闭，
+不主动结束的 SSE 长连接会让关闭一直等下去，因此在收到 SIGINT / SIGTERM 时就结束（见 install_signal_hook）
+"""
+
+import os
+import json
+import signal
+import asyncio
+import itertools
+import threading
+from typing import Iterable, Optional
+
+from timeutil import now_ms
+
+# 每个订阅者最多缓存的事件数
+EVENT_BUFFER_SIZE = int(os.getenv("ADMIN_EVENT_BUFFER_SIZE", "256"))
+# SSE 心跳间隔（秒），防止代理断开空闲连接
+SSE_HEARTBEAT = float(os.getenv("ADMIN_SSE_HEARTBEAT", "15"))
+
+# 可订阅的主题
+EVENT_TOPICS = ("job", "credits", "stats")
+
+# 订阅结束的标记事件
+_CLOSED = {"topic": None}
+
+
+class Subscription:
+    """单个订阅者的事件缓冲区（只在事件循环线程中访问）"""
+
+    def __init__(self, topics: Optional[set], buffer_size: int):
+        self.topics = topics
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self._dropped = 0
+        self.closed = False
+
+    def wants(self, topic: str) -> bool:
+        return self.topics is None or topic in self.topics
+
+    def put(self, event: dict) -> bool:
+        """放入事件，缓冲区满时丢弃最旧的一个，返回是否发生了丢弃"""
+        dropped = False
+        if self._queue.full():
+            self._queue.get_nowait()
+            self._dropped += 1
+            dropped = True
+        self._queue.put_nowait(event)
+        return dropped
+
+    def close(self):
+        """结束订阅：读取方取到结束标记后停止"""
+        if not self.closed:
+            self.closed = True
+            self.put(_CLOSED)
+
+    def take_dropped(self) -> int:
+        """取出并清零上次读取以来丢弃的事件数"""
+        dropped, self._dropped = self._dropped, 0
+        return dropped
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """等待下一个事件，超时返回 None"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+
+class EventBus:
+    """
+    发布 / 订阅
+
+    用法:
+        event_bus.bind()                      # 在 lifespan 中绑定事件循环
+        sub = event_bus.subscribe({"job"})
+        event = await sub.get(timeout)
+        event_bus.unsubscribe(sub)
+
+        event_bus.publish("job", {...})       # 任意线程
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._subscribers: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._seq = itertools.count(1)
+        self.published = 0
+        self.dropped = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop = None):
+        """绑定投递事件的事件循环（需在事件循环中调用）"""
+        self._loop = loop or asyncio.get_running_loop()
+
+    def unbind(self):
+        self.close_all()
+        self._loop = None
+
+    def close_all(self):
+        """结束全部订阅（SSE 连接随之结束），需在事件循环中调用"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for sub in subscribers:
+            sub.close()
+
+    def install_signal_hook(self):
+        """
+        收到 SIGINT / SIGTERM 时结束全部订阅，再交给原来的处理函数
+
+        在 lifespan 启动时调用（此时 uvicorn 已安装自己的信号处理，退出时会恢复原处理函数）；
+        只能在主线程中安装，其他线程中运行时忽略
+        """
+        loop = self._loop
+        if loop is None or threading.current_thread() is not threading.main_thread():
+            return
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                continue
+
+            def handler(signum, frame, previous=previous):
+                try:
+                    loop.call_soon_threadsafe(self.close_all)
+                except RuntimeError:
+                    # 事件循环已关闭
+                    pass
+                previous(signum, frame)
+
+            signal.signal(sig, handler)
+
+    def subscribe(self, topics: Iterable[str] = None, buffer_size: int = None) -> Subscription:
+        """订阅主题（None 表示全部），需在事件循环中调用"""
+        sub = Subscription(set(topics) if topics else None, buffer_size or self.buffer_size)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, topic: str, data: dict):
+        """发布事件；没有订阅者或未绑定事件循环（如命令行）时直接忽略"""
+        loop = self._loop
+        if loop is None or not self._subscribers:
+            return
+        event = {"id": next(self._seq), "topic": topic, "ts": now_ms(), "data": data}
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(event)
+        else:
+            try:
+                loop.call_soon_threadsafe(self._deliver, event)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _deliver(self, event: dict):
+        with self._lock:
+            subscribers = [sub for sub in self._subscribers if sub.wants(event["topic"])]
+        self.published += 1
+        for sub in subscribers:
+            if sub.put(event):
+                self.dropped += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            "subscribers": len(subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+            "buffer_size": self.buffer_size,
+            "max_pending": max((sub.pending() for sub in subscribers), default=0),
+        }
+
+
+def format_sse(event: str, data: dict, event_id: int = None) -> str:
+    """格式化为一条 SSE 消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def iter_sse(sub: Subscription, heartbeat: float = SSE_HEARTBEAT):
+    """把订阅转为 SSE 文本流；有事件被丢弃时先发送 resync，订阅结束时停止"""
+    yield "retry: 3000\n\n"
+    while True:
+        event = await sub.get(heartbeat)
+        if event is _CLOSED:
+            return
+        dropped = sub.take_dropped()
+        if dropped:
+            yield format_sse("resync", {"dropped": dropped})
+        if event is None:
+            yield ": ping\n\n"
+            continue
+        yield format_sse(event["topic"], {**event["data"], "ts": event["ts"]}, event["id"])
+
+
+# 全局事件总线
+event_bus = EventBus()
@@ -0,0 +1,584 @@
+"""
+生成任务队列
+/api/generate/* 提交后立即返回 job_id，后台调用 jimeng-api（最长 20 分钟），
+客户端轮询 GET /api/jobs/{job_id}（支持 wait 长轮询）或订阅 /api/events 获取结果。
+执行顺序和并发由 concurrency_limiter 控制：图片、视频分道执行，道内按优先级（带老化）和调用方公平排队，
+并受账户 / 地区并发上限约束。
+
+任务状态保存在 tasks 表（job_id / params / result / error / attempts / started_ms / finished_ms 列，见 db_migrations），
+状态流转: queued -> running -> completed / failed / timeout
+服务重启时 queued 的任务重新入队；running 的任务上游结果未知，标记为 failed（预留的积分由租约超时释放）
+
+失败按 classify_failure 分类（credits / auth / throttled / content / transient / unknown），
+可重试的失败换账户重试（见 run_generation），每次调用记录在 task_attempts 表。
+配置:
+    ADMIN_RETRY_MAX_ATTEMPTS 每个任务最多调用次数（默认 3）
+    ADMIN_RETRY_BACKOFF      限流 / 临时错误重试的初始退避秒数（默认 1，每次翻倍）
+    ADMIN_RETRY_BACKOFF_MAX  退避上限秒数（默认 30）
+    ADMIN_THROTTLE_COOLDOWN  被限流的账户暂停选择的秒数（默认 60）
+"""
+
+import os
+import json
+import uuid
+import random
+import asyncio
+from typing import Dict, Optional
+
+import httpx
+
+from account_manager import (
+    commit_lease,
+    disable_account,
+    get_env_accounts,
+    release_lease,
+    reserve_credits,
+    update_account_credits,
+)
+from concurrency_limiter import DEFAULT_CALLER, DEFAULT_PRIORITY, Slot, concurrency_limiter
+from db_manager import db_read, db_write, write_queue
+from event_bus import event_bus
+from http_clients import http_clients
+from task_stats import summary_delta
+from timeutil import now_ms
+
+JIMENG_API_URL = "http://127.0.0.1:5100"
+
+# 单次生成请求的超时（秒）
+GENERATE_TIMEOUT = 1200
+
+# 任务类型（即 concurrency_limiter 的执行道）-> jimeng-api 接口、积分消耗、转发的参数
+JOB_KINDS = {
+    "image": {
+        "path": "/v1/images/generations",
+        "cost": 4,
+        "fields": ("model", "prompt", "ratio", "resolution"),
+        # 图片任务需要返回图片地址才算成功
+        "require_urls": True,
+    },
+    "video": {
+        "path": "/v1/videos/generations",
+        "cost": 20,
+        "fields": ("model", "prompt", "ratio", "duration"),
+        "require_urls": False,
+    },
+}
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("completed", "failed", "timeout")
+
+_JOB_COLUMNS = """
+    job_id, task_id, task_type, status, account_id, prompt, model, params, result_url,
+    credits_used, result, error, attempts, created_ms, started_ms, finished_ms
+"""
+
+
+class JobError(Exception):
+    """任务无法执行（如没有可用账户），status_code 与原同步接口返回的 HTTP 状态一致"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _job_from_row(row) -> dict:
+    job = dict(row)
+    job["kind"] = job.pop("task_type")
+    for column in ("params", "result"):
+        job[column] = json.loads(job[column]) if job[column] else None
+    return job
+
+
+def _stats_key(job: dict) -> tuple:
+    return (job["status"], job["kind"], job["account_id"], job["credits_used"])
+
+
+def _publish(job: dict, before: dict = None):
+    """推送任务状态和统计增量"""
+    event_bus.publish("job", job)
+    event_bus.publish("stats", summary_delta(_stats_key(before) if before else None, _stats_key(job)))
+
+
+# 任务状态变化都经 write_queue 写入，与 create_task_record / update_task 合并为批量提交
+
+async def _insert_job(job_id: str, kind: str, params: dict, created_ms: int):
+    await write_queue.write("""
+        INSERT INTO tasks (task_id, job_id, account_id, task_type, prompt, status, model, params, created_ms)
+        VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)
+    """, (
+        job_id, job_id, params.get("account_id"), kind, params.get("prompt"), params.get("model"),
+        json.dumps(params, ensure_ascii=False), created_ms,
+    ))
+
+
+async def _claim_job(job_id: str, started_ms: int) -> Optional[dict]:
+    """把排队中的任务标记为执行中，返回最新的任务信息（已不在排队时返回 None）"""
+    claimed = await write_queue.write("""
+        UPDATE tasks SET status = 'running', started_ms = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE job_id = ? AND status = 'queued'
+    """, (started_ms, job_id))
+    return await db_read(_get_job, job_id) if claimed else None
+
+
+async def _finish_job(job_id: str, outcome: dict):
+    writes = [write_queue.submit("""
+        UPDATE tasks
+        SET status = ?, account_id = COALESCE(?, account_id), result_url = ?, credits_used = ?,
+            result = ?, error = ?, attempts = (SELECT COUNT(*) FROM task_attempts WHERE job_id = ?), finished_ms = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE job_id = ?
+    """, (
+        outcome["status"], outcome.get("account_id"), outcome.get("result_url"), outcome.get("credits_used", 0),
+        json.dumps(outcome["result"], ensure_ascii=False) if outcome.get("result") is not None else None,
+        outcome.get("error"), job_id, now_ms(), job_id,
+    ))]
+    # 与同步接口一致，用上游的 history_id 作为 task_id（历史查询按数字 task_id 查找）；已被占用时保留 job_id
+    history_id = outcome.get("history_id")
+    if history_id:
+        writes.append(write_queue.submit("""
+            UPDATE tasks SET task_id = ?
+            WHERE job_id = ? AND NOT EXISTS (SELECT 1 FROM tasks WHERE task_id = ?)
+        """, (str(history_id), job_id, str(history_id))))
+    await asyncio.gather(*writes)
+
+
+def _recover_jobs(conn) -> list:
+    """启动时处理上次未完成的任务，返回需要重新入队的 job_id（按提交顺序）"""
+    interrupted = conn.execute("""
+        UPDATE tasks SET status = 'failed', error = '服务重启时任务仍在执行，结果未知',
+            finished_ms = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE job_id IS NOT NULL AND status = 'running'
+    """, (now_ms(),)).rowcount
+    if interrupted:
+        print(f"[任务队列] {interrupted} 个执行中的任务因服务重启标记为失败")
+    rows = conn.execute("""
+        SELECT job_id FROM tasks
+        WHERE job_id IS NOT NULL AND status = 'queued'
+        ORDER BY id
+    """).fetchall()
+    return [row[0] for row in rows]
+
+
+def _get_job(conn, job_id: str) -> Optional[dict]:
+    row = conn.execute(f"SELECT {_JOB_COLUMNS} FROM tasks WHERE job_id = ?", (job_id,)).fetchone()
+    if not row:
+        return None
+    job = _job_from_row(row)
+    rows = conn.execute("""
+        SELECT attempt, account_id, status, category, http_status, error, started_ms, finished_ms
+        FROM task_attempts WHERE job_id = ? ORDER BY attempt
+    """, (job_id,)).fetchall()
+    job["attempt_log"] = [dict(r) for r in rows]
+    return job
+
+
+def _parse_generation(result) -> tuple:
+    """从 jimeng-api 响应中提取 (结果地址列表, history_id)"""
+    urls = []
+    history_id = None
+    if isinstance(result, dict):
+        if isinstance(result.get("data"), list):
+            for item in result["data"]:
+                if "url" in item:
+                    urls.append(item["url"])
+                if "history_id" in item:
+                    history_id = item["history_id"]
+        if not history_id and "history_id" in result:
+            history_id = result["history_id"]
+    return urls, history_id
+
+
+# ============ 失败分类与重试 ============
+
+# 一个任务最多调用 jimeng-api 的次数（含第一次）
+RETRY_MAX_ATTEMPTS = max(1, int(os.getenv("ADMIN_RETRY_MAX_ATTEMPTS", "3")))
+# 限流 / 临时错误重试前的退避: min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2^(n-1))，再乘以 0.5~1 的随机系数
+RETRY_BACKOFF = float(os.getenv("ADMIN_RETRY_BACKOFF", "1"))
+RETRY_BACKOFF_MAX = float(os.getenv("ADMIN_RETRY_BACKOFF_MAX", "30"))
+# 被限流的账户暂停选择的时间（秒）
+THROTTLE_COOLDOWN = int(os.getenv("ADMIN_THROTTLE_COOLDOWN", "60"))
+# 一个任务开始执行后最长的执行时间：每次调用都用满超时再加上重试退避（wait=true 的同步调用按此等待）
+JOB_MAX_DURATION = RETRY_MAX_ATTEMPTS * GENERATE_TIMEOUT + (RETRY_MAX_ATTEMPTS - 1) * RETRY_BACKOFF_MAX
+
+FAILURE_CATEGORIES = ("credits", "auth", "throttled", "content", "transient", "unknown")
+# 换一个账户可能成功的失败（未指定账户的任务重试）
+FAILOVER_CATEGORIES = ("credits", "auth", "throttled", "transient")
+# 指定账户的任务只重试与账户无关的失败
+PINNED_RETRY_CATEGORIES = ("throttled", "transient")
+# 需要等待后再重试的失败（积分 / 登录失效换账户后立即重试）
+BACKOFF_CATEGORIES = ("throttled", "transient")
+
+# jimeng-api 错误码（src/api/consts/exceptions.ts）-> 失败分类
+_CODE_CATEGORIES = {
+    -2009: "credits",    # 积分不足
+    -2002: "auth",       # Token 已失效
+    -2000: "content",    # 请求参数非法
+    -2003: "content",    # 远程文件 URL 非法
+    -2004: "content",    # 远程文件超出大小
+    -2006: "content",    # 内容违规
+    -2001: "transient",  # 请求失败（网络 / 即梦服务器异常）
+    -2005: "transient",
+    -2007: "transient",  # 图像生成失败
+    -2008: "transient",  # 视频生成失败
+    -9999: "transient",
+    -1: "transient",     # 未处理的异常
+}
+_THROTTLE_KEYWORDS = ("频率限制", "过于频繁")
+_CONTENT_KEYWORDS = ("违规", "检测未通过")
+
+
+def classify_failure(http_status: Optional[int], body) -> str:
+    """
+    根据 jimeng-api 的响应对失败分类
+
+    jimeng-api 的失败响应一般为 HTTP 200 + {"code", "message"}，先看限流和内容违规的提示，
+    再按错误码，最后按 HTTP 状态码（网关 / 连接错误）
+
+    Returns:
+        FAILURE_CATEGORIES 之一
+    """
+    code = body.get("code") if isinstance(body, dict) else None
+    message = str(body.get("message") or "") if isinstance(body, dict) else ""
+    if http_status == 429 or any(keyword in message for keyword in _THROTTLE_KEYWORDS):
+        return "throttled"
+    if any(keyword in message for keyword in _CONTENT_KEYWORDS):
+        return "content"
+    if isinstance(code, int) and code in _CODE_CATEGORIES:
+        return _CODE_CATEGORIES[code]
+    if http_status in (401, 403):
+        return "auth"
+    if http_status is None or http_status >= 500:
+        return "transient"
+    return "unknown"
+
+
+def retry_delay(retry: int) -> float:
+    """第 retry 次重试前的退避时间（秒），指数增长、有上限并加随机抖动"""
+    delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** (retry - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def _record_attempt(job_id: str, attempt: dict):
+    await write_queue.write("""
+        INSERT INTO task_attempts
+            (job_id, attempt, account_id, status, category, http_status, error, started_ms, finished_ms)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        job_id, attempt["attempt"], attempt["account_id"], attempt["status"], attempt["category"],
+        attempt["http_status"], attempt["error"], attempt["started_ms"], attempt["finished_ms"],
+    ))
+
+
+async def _reserve_account(cost: int, requested: Optional[int], slot: Slot, failed: set = frozenset()) -> dict:
+    """
+    在并发上限内选择账户并预留积分
+
+    未指定账户时跳过已达到账户 / 地区上限的账户以及本任务已失败过的账户（failed）；
+    其余账户全部达到上限时等待有请求结束后重新选择。指定的账户达到上限时同样等待
+    """
+    while True:
+        env_accounts = get_env_accounts()
+        if requested is not None and requested not in env_accounts:
+            raise JobError(404, f"账户 {requested} 不存在")
+        async with concurrency_limiter.pick_lock:
+            saturated = concurrency_limiter.saturated(env_accounts) if requested is None else set()
+            exclude = saturated | failed if requested is None else set()
+            lease = await asyncio.to_thread(
+                reserve_credits, cost, exclude=exclude, account_id=requested,
+                env_account=env_accounts.get(requested) if requested is not None else None,
+            )
+            if lease is not None:
+                region = env_accounts.get(lease["account_id"], {}).get("region")
+                if concurrency_limiter.try_bind(slot, lease["account_id"], region):
+                    return lease
+                await asyncio.to_thread(release_lease, lease)
+            elif not saturated:
+                raise JobError(400, "没有可用账户（积分不足）")
+        await concurrency_limiter.wait_release()
+
+
+async def _attempt(kind: str, params: dict, lease: dict) -> dict:
+    """
+    用预留的账户调用一次 jimeng-api 并提交积分
+
+    Returns:
+        任务结果（同 run_generation），失败时另有 "category" 和 "http_status"
+    """
+    spec = JOB_KINDS[kind]
+    account_id = lease["account_id"]
+
+    env_accounts = get_env_accounts()
+    if account_id not in env_accounts:
+        # 数据库中有记录但 .env 中已没有 token
+        return {"status": "failed", "account_id": account_id, "category": "auth", "http_status": None,
+                "error": f"账户 {account_id} 不存在"}
+    token = env_accounts[account_id]["token"]
+
+    client = http_clients.get(JIMENG_API_URL)
+    try:
+        resp = await client.post(
+            spec["path"],
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+            },
+            json={field: params[field] for field in spec["fields"]},
+            timeout=GENERATE_TIMEOUT,
+        )
+    except httpx.TimeoutException:
+        # 超时时上游可能仍在生成并已扣费，按预计消耗记录，不重试
+        await asyncio.to_thread(commit_lease, lease, spec["cost"])
+        return {
+            "status": "timeout",
+            "account_id": account_id,
+            "credits_used": spec["cost"],
+            "error": "生成超时，请稍后查询结果",
+        }
+    except httpx.TransportError as e:
+        return {"status": "failed", "account_id": account_id, "category": "transient", "http_status": None,
+                "error": f"连接 jimeng-api 失败: {e}"}
+
+    try:
+        result = resp.json()
+    except ValueError:
+        result = None
+    urls, history_id = _parse_generation(result)
+    code = result.get("code") if isinstance(result, dict) else None
+    succeeded = resp.status_code == 200 and not code and (bool(urls) or not spec["require_urls"])
+    credits_used = spec["cost"] if succeeded else 0
+
+    await asyncio.to_thread(commit_lease, lease, credits_used)
+    if resp.status_code == 200:
+        # 刷新积分（积分不足的失败也以此更新为实际积分）
+        await asyncio.to_thread(update_account_credits, account_id, token)
+
+    response = {"success": succeeded, "account_id": account_id, "data": result}
+    if kind == "image":
+        response["images"] = urls
+    outcome = {
+        "status": "completed" if succeeded else "failed",
+        "account_id": account_id,
+        "result_url": urls[0] if urls else None,
+        "credits_used": credits_used,
+        "history_id": history_id,
+        "result": response,
+        "error": None if succeeded else (result.get("message") if isinstance(result, dict) else None) or f"HTTP {resp.status_code}",
+    }
+    if not succeeded:
+        # 返回成功但没有图片时按内容问题处理（通常是被过滤），不重试
+        outcome["category"] = classify_failure(resp.status_code, result) if code or resp.status_code != 200 else "content"
+        outcome["http_status"] = resp.status_code
+    return outcome
+
+
+async def _handle_failure(account_id: int, category: str, http_status: Optional[int]):
+    """按失败分类更新账户状态，让后续选择避开该账户"""
+    if category == "credits" and http_status != 200:
+        # HTTP 200 的响应在 _attempt 中已刷新积分
+        token = get_env_accounts().get(account_id, {}).get("token")
+        if token:
+            await asyncio.to_thread(update_account_credits, account_id, token)
+    elif category == "auth":
+        await asyncio.to_thread(disable_account, account_id)
+    elif category == "throttled":
+        await asyncio.to_thread(disable_account, account_id, THROTTLE_COOLDOWN)
+
+
+async def run_generation(kind: str, params: dict, slot: Slot, job_id: str = None) -> dict:
+    """
+    执行生成：选择账户并预留积分、调用 jimeng-api、按结果提交积分，可重试的失败换账户重试
+
+    未指定账户时，积分不足 / 登录失效 / 限流 / 临时错误换一个本任务未失败过的账户重试；
+    指定账户时只重试限流和临时错误。限流和临时错误重试前按 retry_delay 退避。
+    最多调用 RETRY_MAX_ATTEMPTS 次，没有其他可用账户时返回最后一次失败
+
+    Args:
+        slot: concurrency_limiter 分配的执行道名额，当前使用的账户计入其账户 / 地区上限
+        job_id: 任务 ID，每次调用记录到 task_attempts
+
+    Returns:
+        {"status", "account_id", "result_url", "credits_used", "history_id", "result", "error",
+         "attempts", "failures"}，failures 为各次失败的分类
+
+    Raises:
+        JobError: 第一次选择时没有可用账户，或指定的账户不存在
+    """
+    spec = JOB_KINDS[kind]
+    requested = params.get("account_id") or None
+    retryable = PINNED_RETRY_CATEGORIES if requested else FAILOVER_CATEGORIES
+    failed_accounts = set()
+    failures = []
+    backoffs = 0
+    outcome = None
+
+    for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+        try:
+            lease = await _reserve_account(spec["cost"], requested, slot, failed_accounts)
+        except JobError:
+            if outcome is None:
+                raise
+            # 没有其他可用账户，返回最后一次失败
+            break
+
+        started_ms = now_ms()
+        try:
+            outcome = await _attempt(kind, params, lease)
+        finally:
+            await asyncio.to_thread(release_lease, lease)
+            concurrency_limiter.unbind(slot)
+        outcome["attempts"] = attempt
+
+        category = outcome.pop("category", None)
+        http_status = outcome.pop("http_status", None)
+        if job_id is not None:
+            await _record_attempt(job_id, {
+                "attempt": attempt, "account_id": outcome["account_id"], "status": outcome["status"],
+                "category": category, "http_status": http_status, "error": outcome.get("error"),
+                "started_ms": started_ms, "finished_ms": now_ms(),
+            })
+        if category is None:
+            break
+
+        failures.append(category)
+        account_id = outcome["account_id"]
+        if requested and account_id not in get_env_accounts():
+            raise JobError(404, f"账户 {account_id} 不存在")
+        await _handle_failure(account_id, category, http_status)
+        if category not in retryable or attempt == RETRY_MAX_ATTEMPTS:
+            break
+
+        failed_accounts.add(account_id)
+        print(f"[任务队列] 任务 {job_id} 第 {attempt} 次调用失败（账户 {account_id}，{category}）: {outcome['error']}，重试")
+        if job_id is not None:
+            job = await db_read(_get_job, job_id)
+            if job is not None:
+                event_bus.publish("job", job)
+        if category in BACKOFF_CATEGORIES:
+            backoffs += 1
+            await asyncio.sleep(retry_delay(backoffs))
+
+    outcome["failures"] = failures
+    return outcome
+
+
+class JobQueue:
+    """进程内的生成任务队列（任务状态以 tasks 表为准，执行顺序和并发由 concurrency_limiter 决定）"""
+
+    def __init__(self):
+        self._started = False
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._done: Dict[str, asyncio.Event] = {}
+        self.running = 0
+        self.finished = {status: 0 for status in FINAL_STATUSES}
+        # 调用失败按分类计数；retries 为重试次数，recovered 为重试后成功的任务数
+        self.failures = {category: 0 for category in FAILURE_CATEGORIES}
+        self.retries = 0
+        self.recovered = 0
+
+    async def start(self):
+        """恢复上次未完成的任务（需在事件循环中调用）"""
+        if self._started:
+            return
+        self._started = True
+        concurrency_limiter.reset()
+        for job_id in await db_write(_recover_jobs):
+            self._enqueue(job_id)
+        print(f"[任务队列] 已启动，待执行 {len(self._tasks)} 个任务")
+
+    async def stop(self):
+        """取消全部任务；排队中的任务下次启动时重新入队，执行中的标记为失败"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._started = False
+
+    def _enqueue(self, job_id: str):
+        self._done[job_id] = asyncio.Event()
+        self._tasks[job_id] = asyncio.get_running_loop().create_task(self._process(job_id))
+
+    async def submit(self, kind: str, params: dict) -> dict:
+        """保存任务并入队，返回任务信息"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"不支持的任务类型: {kind}")
+        job_id = uuid.uuid4().hex
+        await _insert_job(job_id, kind, params, now_ms())
+        self._enqueue(job_id)
+        job = await self.get(job_id)
+        _publish(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await db_read(_get_job, job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """等待任务结束（最多 timeout 秒），返回最新的任务信息"""
+        event = self._done.get(job_id)
+        if event is not None and timeout > 0:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return await self.get(job_id)
+
+    async def _process(self, job_id: str):
+        try:
+            await self._run(job_id)
+        except Exception as e:
+            print(f"[任务队列] 任务 {job_id} 处理异常: {e}")
+        finally:
+            self._tasks.pop(job_id, None)
+            event = self._done.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    async def _run(self, job_id: str):
+        job = await self.get(job_id)
+        if job is None or job["status"] != "queued":
+            return
+
+        params = job["params"]
+        async with concurrency_limiter.slot(
+            job["kind"],
+            params.get("caller") or DEFAULT_CALLER,
+            params.get("priority") or DEFAULT_PRIORITY,
+        ) as slot:
+            job = await _claim_job(job_id, now_ms())
+            if job is None:
+                return
+            _publish(job, {**job, "status": "queued"})
+
+            self.running += 1
+            try:
+                outcome = await run_generation(job["kind"], job["params"], slot, job_id)
+            except JobError as e:
+                outcome = {"status": "failed", "error": e.detail, "result": {"status_code": e.status_code}}
+            except Exception as e:
+                outcome = {"status": "failed", "error": str(e) or type(e).__name__, "result": {"status_code": 500}}
+            finally:
+                self.running -= 1
+
+        await _finish_job(job_id, outcome)
+        self.finished[outcome["status"]] += 1
+        for category in outcome.get("failures", ()):
+            self.failures[category] += 1
+        if outcome.get("attempts", 0) > 1:
+            self.retries += outcome["attempts"] - 1
+            if outcome["status"] == "completed":
+                self.recovered += 1
+        _publish(await self.get(job_id), job)
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": len(self._tasks) - self.running,
+            "running": self.running,
+            "finished": dict(self.finished),
+            "failures": dict(self.failures),
+            "retries": self.retries,
+            "recovered": self.recovered,
+        }
+
+
+# 全局任务队列
+job_queue = JobQueue()
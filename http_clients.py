@@ -0,0 +1,250 @@
+"""
+共享 HTTP 客户端
+按 (base_url, proxy) 复用带连接池的 httpx 客户端，避免每个请求都重新建立 TCP / TLS 连接；
+管理后台在 lifespan 中打开、关闭时统一释放。每个客户端记录请求数、进行中的请求和连接池占用
+"""
+
+import os
+import time
+import asyncio
+import threading
+from typing import Dict, Optional
+
+import httpx
+
+# 每个客户端的连接池上限
+HTTP_MAX_CONNECTIONS = int(os.getenv("ADMIN_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("ADMIN_HTTP_MAX_KEEPALIVE", "20"))
+# 空闲连接保留时间（秒）
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("ADMIN_HTTP_KEEPALIVE_EXPIRY", "30"))
+# 默认超时（秒），生成等长请求在调用时单独指定
+HTTP_TIMEOUT = float(os.getenv("ADMIN_HTTP_TIMEOUT", "30"))
+
+# HTTP/2 只用于 https 上游，需要安装 h2（httpx[http2]）
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+HTTP2_ENABLED = os.getenv("ADMIN_HTTP2", "1") == "1" and HTTP2_AVAILABLE
+
+
+class _ClientStats:
+    """单个客户端的请求计数（异步和同步客户端共用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.active = 0
+        self.peak_active = 0
+        self.created = time.time()
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+
+    def end(self, error: bool = False):
+        with self._lock:
+            self.active -= 1
+            if error:
+                self.errors += 1
+
+
+class _MeteredAsyncStream(httpx.AsyncByteStream):
+    """响应体读完或关闭时结束计数"""
+
+    def __init__(self, stream, stats: _ClientStats):
+        self._stream = stream
+        self._stats = stats
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._stats.end()
+
+
+class _MeteredSyncStream(httpx.SyncByteStream):
+    def __init__(self, stream, stats: _ClientStats):
+        self._stream = stream
+        self._stats = stats
+        self._closed = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._stats.end()
+
+
+class _MeteredAsyncTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncHTTPTransport, stats: _ClientStats):
+        self.transport = transport
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.begin()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.stats.end(error=True)
+            raise
+        response.stream = _MeteredAsyncStream(response.stream, self.stats)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class _MeteredSyncTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.HTTPTransport, stats: _ClientStats):
+        self.transport = transport
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.begin()
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException:
+            self.stats.end(error=True)
+            raise
+        response.stream = _MeteredSyncStream(response.stream, self.stats)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+def _pool_snapshot(transport) -> dict:
+    """读取 httpcore 连接池中的连接状态"""
+    pool = getattr(transport.transport, "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for conn in connections if conn.is_idle())
+    http2 = sum(1 for conn in connections if "HTTP/2" in conn.info())
+    return {
+        "connections": len(connections),
+        "idle": idle,
+        "busy": len(connections) - idle,
+        "http2": http2,
+    }
+
+
+class ClientRegistry:
+    """
+    按 (base_url, proxy) 复用的 httpx 客户端
+
+    异步客户端与创建时的事件循环绑定；在另一个事件循环中使用（如命令行多次 asyncio.run）时重新创建
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._async: Dict[tuple, tuple] = {}
+        self._sync: Dict[tuple, tuple] = {}
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+
+    def get(self, base_url: str, proxy: Optional[str] = None) -> httpx.AsyncClient:
+        """获取 base_url 对应的异步客户端（请求路径写相对路径）"""
+        loop = asyncio.get_running_loop()
+        key = (base_url, proxy)
+        with self._lock:
+            entry = self._async.get(key)
+            if entry is not None and entry[1] is loop:
+                return entry[0]
+
+            stats = _ClientStats()
+            transport = _MeteredAsyncTransport(
+                httpx.AsyncHTTPTransport(
+                    limits=self._limits(),
+                    http2=HTTP2_ENABLED and base_url.startswith("https://"),
+                    proxy=proxy,
+                ),
+                stats,
+            )
+            client = httpx.AsyncClient(base_url=base_url, transport=transport, timeout=HTTP_TIMEOUT)
+            self._async[key] = (client, loop, transport)
+            return client
+
+    def get_sync(self, base_url: str, proxy: Optional[str] = None) -> httpx.Client:
+        """获取 base_url 对应的同步客户端（线程安全，供 asyncio.to_thread 中的调用使用）"""
+        key = (base_url, proxy)
+        with self._lock:
+            entry = self._sync.get(key)
+            if entry is not None:
+                return entry[0]
+
+            stats = _ClientStats()
+            transport = _MeteredSyncTransport(
+                httpx.HTTPTransport(
+                    limits=self._limits(),
+                    http2=HTTP2_ENABLED and base_url.startswith("https://"),
+                    proxy=proxy,
+                ),
+                stats,
+            )
+            client = httpx.Client(base_url=base_url, transport=transport, timeout=HTTP_TIMEOUT)
+            self._sync[key] = (client, transport)
+            return client
+
+    async def close(self):
+        """关闭全部客户端"""
+        with self._lock:
+            async_entries = list(self._async.values())
+            sync_entries = list(self._sync.values())
+            self._async.clear()
+            self._sync.clear()
+
+        loop = asyncio.get_running_loop()
+        for client, client_loop, _ in async_entries:
+            if client_loop is loop:
+                await client.aclose()
+        for client, _ in sync_entries:
+            client.close()
+        if async_entries or sync_entries:
+            print(f"[HTTP] 已关闭 {len(async_entries) + len(sync_entries)} 个客户端")
+
+    def snapshot(self) -> list:
+        """各客户端的请求计数和连接池占用"""
+        with self._lock:
+            entries = [(key, "async", entry[-1]) for key, entry in self._async.items()]
+            entries += [(key, "sync", entry[-1]) for key, entry in self._sync.items()]
+
+        result = []
+        for (base_url, proxy), kind, transport in entries:
+            stats = transport.stats
+            result.append({
+                "base_url": base_url,
+                "proxy": bool(proxy),
+                "kind": kind,
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "active": stats.active,
+                "peak_active": stats.peak_active,
+                "max_connections": HTTP_MAX_CONNECTIONS,
+                "pool": _pool_snapshot(transport),
+            })
+        return result
+
+
+# 全局客户端注册表
+http_clients = ClientRegistry()
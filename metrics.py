@@ -0,0 +1,94 @@
+"""
+Dreamina 管理后台运行指标
+事件循环延迟监控等
+"""
+
+import time
+import asyncio
+from collections import deque
+from typing import Optional
+
+
+class LoopLagMonitor:
+    """
+    事件循环延迟监控
+
+    定时 sleep 固定间隔，实际唤醒时间与预期的差值即为事件循环被阻塞的时长
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 120):
+        self.interval = interval
+        self._samples = deque(maxlen=window)
+        self._max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self._samples.append(lag)
+            self._max_lag = max(self._max_lag, lag)
+
+    def start(self):
+        """启动监控任务（需在事件循环中调用）"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """停止监控任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        """返回最近窗口内的延迟统计（毫秒）"""
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0, "last_ms": 0, "avg_ms": 0, "p99_ms": 0, "max_ms": 0, "max_all_time_ms": 0}
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        return {
+            "samples": len(samples),
+            "last_ms": round(self._samples[-1] * 1000, 2),
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p99_ms": round(p99 * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2),
+            "max_all_time_ms": round(self._max_lag * 1000, 2),
+        }
+
+
+class DurationStats:
+    """最近 window 次耗时的统计（如排队等待时间）"""
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        """返回最近窗口内的耗时统计（毫秒）"""
+        samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count, "avg_ms": 0, "p50_ms": 0, "p95_ms": 0, "max_ms": 0}
+
+        def pct(q):
+            return round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 2)
+
+        return {
+            "count": self.count,
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p50_ms": pct(0.5),
+            "p95_ms": pct(0.95),
+            "max_ms": round(samples[-1] * 1000, 2),
+        }
+
+
+# 全局事件循环延迟监控
+loop_lag_monitor = LoopLagMonitor()
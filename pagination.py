@@ -0,0 +1,121 @@
+"""
+列表接口分页工具
+基于 (created_ms, id) 的游标分页，翻页代价与页码无关
+"""
+
+import json
+import time
+import base64
+import sqlite3
+import threading
+from typing import Optional, Tuple
+
+# 总数估算缓存有效期（秒）和最大条目数
+COUNT_CACHE_TTL = 30
+COUNT_CACHE_MAX_ENTRIES = 1024
+
+
+def encode_cursor(row: dict, direction: str) -> str:
+    """把一行的 (created_ms, id) 编码为不透明游标"""
+    payload = json.dumps({"k": [row["created_ms"], row["id"]], "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, list]:
+    """
+    解析游标
+
+    Returns:
+        (direction, [created_ms, id])
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction = payload["d"]
+        key = payload["k"]
+        if direction not in ("next", "prev") or not isinstance(key, list) or len(key) != 2:
+            raise ValueError
+        return direction, key
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+
+def keyset_page(
+    conn: sqlite3.Connection,
+    table: str,
+    where_sql: str,
+    params: list,
+    cursor: Optional[str],
+    page_size: int,
+) -> dict:
+    """
+    游标分页查询
+
+    按 created_ms DESC, id DESC 排序；cursor 为空时返回第一页。
+    多取一行用于判断是否还有下一页/上一页。
+
+    Returns:
+        {"items": [...], "next_cursor": str|None, "prev_cursor": str|None}
+    """
+    direction, key = decode_cursor(cursor) if cursor else ("next", None)
+
+    query_where = where_sql
+    query_params = list(params)
+    if key is not None:
+        op = "<" if direction == "next" else ">"
+        query_where += f" AND (created_ms, id) {op} (?, ?)"
+        query_params += key
+
+    order = "DESC" if direction == "next" else "ASC"
+    rows = conn.execute(f"""
+        SELECT * FROM {table}
+        WHERE {query_where}
+        ORDER BY created_ms {order}, id {order}
+        LIMIT ?
+    """, query_params + [page_size + 1]).fetchall()
+
+    has_more = len(rows) > page_size
+    items = [dict(row) for row in rows[:page_size]]
+
+    if direction == "next":
+        next_cursor = encode_cursor(items[-1], "next") if has_more else None
+        prev_cursor = encode_cursor(items[0], "prev") if key is not None and items else None
+    else:
+        # 向前翻页时结果是正序，翻转回倒序
+        items.reverse()
+        next_cursor = encode_cursor(items[-1], "next") if items else None
+        prev_cursor = encode_cursor(items[0], "prev") if has_more else None
+
+    return {"items": items, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+
+class CountCache:
+    """COUNT(*) 结果缓存，游标分页不要求精确总数时返回缓存的估算值"""
+
+    def __init__(self, ttl: float = COUNT_CACHE_TTL):
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn: sqlite3.Connection, table: str, where_sql: str, params: list, exact: bool = False) -> int:
+        key = (table, where_sql, tuple(params))
+        now = time.monotonic()
+        if not exact:
+            with self._lock:
+                cached = self._cache.get(key)
+            if cached and now - cached[1] < self.ttl:
+                return cached[0]
+
+        count = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {where_sql}", params).fetchone()[0]
+        with self._lock:
+            if len(self._cache) >= COUNT_CACHE_MAX_ENTRIES and key not in self._cache:
+                self._cache.clear()
+            self._cache[key] = (count, now)
+        return count
+
+
+# 全局总数缓存
+count_cache = CountCache()
@@ -0,0 +1,163 @@
+"""
+管理后台定时任务
+在事件循环中运行固定间隔和每日定点的后台任务，记录每个任务的运行状态供 /api/metrics 查看
+"""
+
+import time
+import asyncio
+from datetime import datetime, time as dtime, timedelta, tzinfo
+from typing import Awaitable, Callable, Dict, Optional
+
+# 每日任务等待期间最多 sleep 这么久就重新计算一次剩余时间（系统休眠、校时后仍能准点触发）
+DAILY_POLL_INTERVAL = 60
+
+
+def seconds_until(at: dtime, tz: tzinfo, now: Optional[datetime] = None) -> float:
+    """距离 tz 时区下一个 at 时刻的秒数"""
+    now = now or datetime.now(tz)
+    target = datetime.combine(now.date(), at, tzinfo=tz)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+class _Job:
+    def __init__(self, name: str, kind: str, func: Callable[[], Awaitable]):
+        self.name = name
+        self.kind = kind
+        self.func = func
+        self.task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.running = False
+        self.last_run: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.next_run: Optional[float] = None
+
+    async def run_once(self):
+        """执行一次，异常只记录不向外抛出（任务循环继续）"""
+        self.running = True
+        self.last_run = time.time()
+        start = time.perf_counter()
+        try:
+            await self.func()
+            self.last_error = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e) or type(e).__name__
+            print(f"[定时任务] {self.name} 执行失败: {self.last_error}")
+        finally:
+            self.runs += 1
+            self.running = False
+            self.last_duration = time.perf_counter() - start
+
+
+class Scheduler:
+    """
+    后台定时任务
+
+    用法:
+        scheduler.every("compact", 300, compact)
+        scheduler.daily("rollover", rollover, tz=UTC_PLUS_8)
+        scheduler.start()  # 在事件循环中
+        ...
+        await scheduler.stop()
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, tuple] = {}
+        self._started = False
+
+    def every(self, name: str, interval: float, func: Callable[[], Awaitable], run_at_start: bool = True):
+        """每 interval 秒执行一次（上一次结束后开始计时）"""
+        self._add(_Job(name, "interval", func), self._interval_loop, interval, run_at_start)
+
+    def daily(
+        self,
+        name: str,
+        func: Callable[[], Awaitable],
+        tz: tzinfo,
+        at: dtime = dtime(0, 0),
+        run_at_start: bool = False,
+    ):
+        """每天 tz 时区的 at 时刻执行；run_at_start 用于补上停机期间错过的一次（任务需自行判断是否已执行过）"""
+        self._add(_Job(name, "daily", func), self._daily_loop, (at, tz), run_at_start)
+
+    def _add(self, job: _Job, loop, arg, run_at_start: bool):
+        if job.name in self._jobs:
+            raise ValueError(f"定时任务已存在: {job.name}")
+        self._jobs[job.name] = (job, loop, arg, run_at_start)
+        if self._started:
+            job.task = asyncio.get_running_loop().create_task(loop(job, arg, run_at_start))
+
+    async def _interval_loop(self, job: _Job, interval: float, run_at_start: bool):
+        if not run_at_start:
+            job.next_run = time.time() + interval
+            await asyncio.sleep(interval)
+        while True:
+            await job.run_once()
+            job.next_run = time.time() + interval
+            await asyncio.sleep(interval)
+
+    async def _daily_loop(self, job: _Job, schedule: tuple, run_at_start: bool):
+        at, tz = schedule
+        if run_at_start:
+            await job.run_once()
+        while True:
+            remaining = seconds_until(at, tz)
+            target = time.time() + remaining
+            job.next_run = target
+            while remaining > 0:
+                await asyncio.sleep(min(remaining, DAILY_POLL_INTERVAL))
+                remaining = target - time.time()
+            await job.run_once()
+
+    def start(self):
+        """启动全部任务（需在事件循环中调用）"""
+        if self._started:
+            return
+        self._started = True
+        loop = asyncio.get_running_loop()
+        for job, job_loop, arg, run_at_start in self._jobs.values():
+            job.task = loop.create_task(job_loop(job, arg, run_at_start))
+
+    async def stop(self):
+        """取消全部任务并等待退出"""
+        tasks = [job.task for job, *_ in self._jobs.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job, *_ in self._jobs.values():
+            job.task = None
+        self._started = False
+
+    async def run_now(self, name: str):
+        """立即执行一次指定任务（不影响原有计划）"""
+        await self._jobs[name][0].run_once()
+
+    def snapshot(self) -> list:
+        """各任务的运行状态"""
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+        return [
+            {
+                "name": job.name,
+                "kind": job.kind,
+                "running": job.running,
+                "runs": job.runs,
+                "failures": job.failures,
+                "last_run": iso(job.last_run),
+                "last_duration_ms": round(job.last_duration * 1000, 1) if job.last_duration is not None else None,
+                "last_error": job.last_error,
+                "next_run": iso(job.next_run),
+            }
+            for job, *_ in self._jobs.values()
+        ]
+
+
+# 全局定时任务
+scheduler = Scheduler()
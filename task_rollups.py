@@ -0,0 +1,264 @@
+"""
+任务时间分桶汇总（仪表盘趋势图）
+
+- task_rollups_hourly: 按小时分桶，由 tasks 上的触发器实时增量维护（见 db_migrations）
+- task_rollups_daily: 按统计时区自然日分桶，由 compact_rollups() 在一天结束后从小时桶压缩生成
+
+不变式:
+    retention_cutoff 之后的日期，小时桶是完整数据，日桶由小时桶推导；
+    retention_cutoff 之前的日期，日桶是权威数据，残留的小时桶是迟到的增量（旧任务被更新），
+    下次压缩时累加进日桶后删除
+
+每个桶按 (account_id, model, task_type) 记录 total/completed/failed/timeouts/credits_used
+
+用法:
+    python task_rollups.py --compact  # 立即执行一次压缩
+    python task_rollups.py --rebuild  # 从 tasks 全量重建小时桶和日桶
+"""
+
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from timeutil import STATS_TZ, day_range_ms, now_ms
+
+HOUR_MS = 3600 * 1000
+
+# 小时桶保留天数，超过后只保留日桶
+HOURLY_RETENTION_DAYS = int(os.getenv("ADMIN_ROLLUP_HOURLY_DAYS", "14"))
+
+# 后台压缩间隔（秒）
+COMPACT_INTERVAL = int(os.getenv("ADMIN_ROLLUP_COMPACT_INTERVAL", "600"))
+
+METRICS = ("total", "completed", "failed", "timeouts", "credits_used")
+DIMENSIONS = ("account_id", "model", "task_type")
+
+# 从 tasks 全量计算小时桶（与触发器中的分桶表达式保持一致）
+HOURLY_FROM_TASKS_SQL = f"""
+    SELECT created_ms - created_ms % {HOUR_MS},
+           COALESCE(account_id, 0), COALESCE(model, ''), COALESCE(task_type, ''),
+           COUNT(*),
+           SUM(COALESCE(status, '') = 'completed'),
+           SUM(COALESCE(status, '') = 'failed'),
+           SUM(COALESCE(status, '') = 'timeout'),
+           COALESCE(SUM(credits_used), 0)
+    FROM tasks
+    WHERE created_ms IS NOT NULL
+    GROUP BY 1, 2, 3, 4
+"""
+
+
+def _get_state(conn: sqlite3.Connection, key: str) -> int:
+    row = conn.execute("SELECT value FROM rollup_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def _set_state(conn: sqlite3.Connection, key: str, value: int):
+    conn.execute("""
+        INSERT INTO rollup_state (key, value) VALUES (?, ?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value
+    """, (key, value))
+
+
+def _day_start(bucket_ms: int) -> int:
+    """小时桶所在的统计时区自然日零点"""
+    return day_range_ms(datetime.fromtimestamp(bucket_ms / 1000, STATS_TZ))[0]
+
+
+def _fold_by_day(rows) -> Dict[tuple, list]:
+    """把小时桶行按自然日聚合: {(day_ms, account_id, model, task_type): [metrics...]}"""
+    days = {}
+    day_cache = {}
+    for bucket_ms, account_id, model, task_type, *values in rows:
+        day = day_cache.get(bucket_ms)
+        if day is None:
+            day = day_cache[bucket_ms] = _day_start(bucket_ms)
+        acc = days.setdefault((day, account_id, model, task_type), [0] * len(METRICS))
+        for i, value in enumerate(values):
+            acc[i] += value
+    return days
+
+
+def compact_rollups(conn: sqlite3.Connection) -> dict:
+    """
+    压缩小时桶（需在事务外调用，内部使用 BEGIN IMMEDIATE）
+
+    1. 旧保留边界之前的小时桶视为迟到增量，累加进日桶后删除
+    2. 从旧保留边界到今天零点的已结束日期，用小时桶重新计算日桶
+    3. 删除新保留边界之前的小时桶，更新边界
+    """
+    today_start = day_range_ms()[0]
+    retention_start = day_range_ms(datetime.now(STATS_TZ) - timedelta(days=HOURLY_RETENTION_DAYS))[0]
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        old_cutoff = _get_state(conn, "retention_cutoff")
+        metric_columns = ", ".join(METRICS)
+
+        # 1. 迟到增量
+        late_rows = conn.execute(f"""
+            SELECT bucket_ms, account_id, model, task_type, {metric_columns}
+            FROM task_rollups_hourly WHERE bucket_ms < ?
+        """, (old_cutoff,)).fetchall()
+        late = _fold_by_day(late_rows)
+        conn.executemany(f"""
+            INSERT INTO task_rollups_daily (bucket_ms, account_id, model, task_type, {metric_columns})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (bucket_ms, account_id, model, task_type) DO UPDATE SET
+                {", ".join(f"{m} = {m} + excluded.{m}" for m in METRICS)}
+        """, [key + tuple(values) for key, values in late.items()])
+        conn.execute("DELETE FROM task_rollups_hourly WHERE bucket_ms < ?", (old_cutoff,))
+
+        # 2. 重新计算已结束日期的日桶
+        lower = old_cutoff
+        if lower == 0:
+            row = conn.execute("SELECT MIN(bucket_ms) FROM task_rollups_hourly").fetchone()
+            lower = _day_start(row[0]) if row[0] is not None else today_start
+        closed_rows = conn.execute(f"""
+            SELECT bucket_ms, account_id, model, task_type, {metric_columns}
+            FROM task_rollups_hourly WHERE bucket_ms >= ? AND bucket_ms < ?
+        """, (lower, today_start)).fetchall()
+        closed = _fold_by_day(closed_rows)
+        conn.execute(
+            "DELETE FROM task_rollups_daily WHERE bucket_ms >= ? AND bucket_ms < ?",
+            (lower, today_start),
+        )
+        conn.executemany(f"""
+            INSERT INTO task_rollups_daily (bucket_ms, account_id, model, task_type, {metric_columns})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [key + tuple(values) for key, values in closed.items() if values[0] or values[-1]])
+
+        # 3. 清理超出保留期的小时桶
+        new_cutoff = max(old_cutoff, retention_start)
+        deleted = conn.execute(
+            "DELETE FROM task_rollups_hourly WHERE bucket_ms < ?", (new_cutoff,)
+        ).rowcount
+        _set_state(conn, "retention_cutoff", new_cutoff)
+        _set_state(conn, "daily_until", today_start)
+        _set_state(conn, "compacted_at", now_ms())
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    return {
+        "late_deltas": len(late_rows),
+        "days_recomputed": len({key[0] for key in closed}),
+        "hourly_deleted": deleted,
+        "retention_cutoff": new_cutoff,
+    }
+
+
+def align_range(granularity: str, start_ms: int, end_ms: int) -> Tuple[int, int]:
+    """把 [start, end) 对齐到整小时 / 统计时区自然日边界"""
+    if granularity == "hour":
+        return start_ms - start_ms % HOUR_MS, end_ms + (-end_ms % HOUR_MS)
+    end = day_range_ms(datetime.fromtimestamp((end_ms - 1) / 1000, STATS_TZ))[1]
+    return _day_start(start_ms), end
+
+
+def rebuild_rollups(conn: sqlite3.Connection):
+    """从 tasks 全量重建小时桶，清空日桶和压缩状态（在调用方事务中执行）"""
+    conn.execute("DELETE FROM task_rollups_hourly")
+    conn.execute("DELETE FROM task_rollups_daily")
+    conn.execute("DELETE FROM rollup_state")
+    conn.execute(f"""
+        INSERT INTO task_rollups_hourly (bucket_ms, account_id, model, task_type, {", ".join(METRICS)})
+        {HOURLY_FROM_TASKS_SQL}
+    """)
+
+
+def query_timeseries(
+    conn: sqlite3.Connection,
+    granularity: str,
+    start_ms: int,
+    end_ms: int,
+    filters: Dict[str, object],
+    group_by: Optional[str] = None,
+) -> List[dict]:
+    """
+    查询时间序列
+
+    Args:
+        granularity: hour / day
+        start_ms, end_ms: [start, end) 范围
+        filters: 维度筛选 {account_id/model/task_type: 值}
+        group_by: 按维度拆分序列，None 为合计
+
+    Returns:
+        [{"key": 维度值或 "all", "points": [{"bucket": ms, total, completed, ...}]}]
+    """
+    where = ["bucket_ms >= ?", "bucket_ms < ?"]
+    params: list = [start_ms, end_ms]
+    for column, value in filters.items():
+        if column in DIMENSIONS and value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    group_column = group_by if group_by in DIMENSIONS else "'all'"
+    sums = ", ".join(f"SUM({m})" for m in METRICS)
+
+    def _select(table: str, extra_where: str = "", extra_params: tuple = ()) -> list:
+        return conn.execute(f"""
+            SELECT bucket_ms, {group_column}, {sums}
+            FROM {table}
+            WHERE {" AND ".join(where)}{extra_where}
+            GROUP BY 1, 2
+        """, params + list(extra_params)).fetchall()
+
+    points: Dict[Tuple[object, int], list] = {}
+
+    def _add(key, bucket, values):
+        acc = points.setdefault((key, bucket), [0] * len(METRICS))
+        for i, value in enumerate(values):
+            acc[i] += value or 0
+
+    if granularity == "hour":
+        # 保留期之前残留的只是迟到增量，不是完整的小时数据
+        retention_cutoff = _get_state(conn, "retention_cutoff")
+        for bucket, key, *values in _select("task_rollups_hourly", " AND bucket_ms >= ?", (retention_cutoff,)):
+            _add(key, bucket, values)
+    else:
+        # 日桶 + 尚未压缩的小时桶（今天，以及压缩任务还没跑到的已结束日期）
+        daily_until = _get_state(conn, "daily_until")
+        for bucket, key, *values in _select("task_rollups_daily", " AND bucket_ms < ?", (daily_until,)):
+            _add(key, bucket, values)
+        open_rows = _select("task_rollups_hourly", " AND bucket_ms >= ?", (daily_until,))
+        for bucket, key, *values in open_rows:
+            _add(key, _day_start(bucket), values)
+
+    series: Dict[object, list] = {}
+    for (key, bucket), values in sorted(points.items(), key=lambda item: item[0][1]):
+        if not (values[0] or values[-1]):
+            continue
+        point = {"bucket": bucket}
+        point.update(zip(METRICS, values))
+        series.setdefault(key, []).append(point)
+
+    return [{"key": key, "points": pts} for key, pts in series.items()]
+
+
+if __name__ == "__main__":
+    import argparse
+    from db_manager import get_db
+    from db_migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="任务时间分桶汇总")
+    parser.add_argument("--compact", action="store_true", help="执行一次压缩")
+    parser.add_argument("--rebuild", action="store_true", help="从 tasks 全量重建")
+    args = parser.parse_args()
+
+    with get_db() as conn:
+        run_migrations(conn)
+
+        if args.rebuild:
+            conn.execute("BEGIN IMMEDIATE")
+            rebuild_rollups(conn)
+            conn.commit()
+            print("[汇总] 小时桶已重建")
+
+        if args.compact or args.rebuild:
+            result = compact_rollups(conn)
+            print(f"[汇总] 压缩完成: {result}")
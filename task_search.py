@@ -0,0 +1,261 @@
+"""
+任务提示词全文搜索
+tasks_fts 为 tasks.prompt 的 FTS5 外部内容索引（trigram 分词，中英文都支持子串匹配），
+由触发器与 tasks 保持同步（见 db_migrations）
+
+trigram 索引要求每个词至少 3 个字符；更短的词退化为按时间倒序的 LIKE 扫描
+相关度排序只在最新的 SEARCH_CANDIDATES 条命中内进行，保证常见词的搜索延迟有上限
+（百万行下对全部命中调用 bm25() 排序，常见词要 100ms 以上）；更早的命中不可分页访问，
+返回结果中的 truncated 表示有命中落在窗口之外
+"""
+
+import os
+import html
+import sqlite3
+from typing import List
+
+# FTS5 snippet 参数
+SNIPPET_OPEN = "<mark>"
+SNIPPET_CLOSE = "</mark>"
+SNIPPET_ELLIPSIS = "…"
+SNIPPET_TOKENS = 48
+
+MIN_TERM_LENGTH = 3
+
+# 参与相关度排序的最大命中数（取最新的命中），更早的命中不返回
+SEARCH_CANDIDATES = int(os.getenv("ADMIN_SEARCH_CANDIDATES", "1000"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def split_terms(q: str) -> List[str]:
+    """按空白拆分搜索词"""
+    return [term for term in q.split() if term]
+
+
+def build_match_query(terms: List[str]) -> str:
+    """把搜索词转为 FTS5 查询：每个词作为短语（转义双引号），词之间为 AND"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _like_clauses(terms: List[str]) -> tuple:
+    """短词回退用的 LIKE 条件（转义通配符）"""
+    clauses = " AND ".join("prompt LIKE ? ESCAPE '\\'" for _ in terms)
+    params = [
+        "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        for term in terms
+    ]
+    return clauses, params
+
+
+def match_filter(q: str) -> tuple:
+    """
+    把搜索文本转为可拼进 tasks 查询的筛选条件（不排序、不打分，供导出等按时间遍历的场景使用）
+
+    Returns:
+        (where 子句, 参数列表)
+
+    Raises:
+        ValueError: 搜索内容为空
+    """
+    terms = split_terms(q)
+    if not terms:
+        raise ValueError("搜索内容不能为空")
+    if all(len(term) >= MIN_TERM_LENGTH for term in terms):
+        return "id IN (SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ?)", [build_match_query(terms)]
+    return _like_clauses(terms)
+
+
+def _highlight(text: str, terms: List[str]) -> str:
+    """LIKE 回退路径的简单高亮（与 snippet 输出格式一致）"""
+    if not text:
+        return ""
+    lower = text.lower()
+    for term in terms:
+        pos = lower.find(term.lower())
+        if pos >= 0:
+            start = max(0, pos - 40)
+            end = min(len(text), pos + len(term) + 40)
+            return (
+                (SNIPPET_ELLIPSIS if start > 0 else "")
+                + html.escape(text[start:pos])
+                + SNIPPET_OPEN + html.escape(text[pos:pos + len(term)]) + SNIPPET_CLOSE
+                + html.escape(text[pos + len(term):end])
+                + (SNIPPET_ELLIPSIS if end < len(text) else "")
+            )
+    return html.escape(text[:80])
+
+
+def score_candidates(candidates, terms: List[str]) -> List[tuple]:
+    """
+    对候选集按 BM25 的词频饱和与长度归一化打分，返回按分数降序（同分时新任务在前）的 [(id, score)]
+
+    FTS5 自带的 bm25() 需要每个短语在全表的文档频率，trigram 短语每次都要完整遍历倒排表，
+    百万行下单个常见词就要几十毫秒；候选集内每条都包含全部搜索词，省略 IDF 对排序影响很小
+    """
+    if not candidates:
+        return []
+    lowered = [(task_id, (prompt or "").lower()) for task_id, prompt in candidates]
+    avg_len = sum(len(prompt) for _, prompt in lowered) / len(lowered) or 1
+    terms = [term.lower() for term in terms]
+
+    scored = []
+    for task_id, prompt in lowered:
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(prompt) / avg_len)
+        score = 0.0
+        for term in terms:
+            tf = prompt.count(term)
+            score += tf * (BM25_K1 + 1) / (tf + norm)
+        scored.append((task_id, score))
+    scored.sort(key=lambda item: (-item[1], -item[0]))
+    return scored
+
+
+def search_tasks(
+    conn: sqlite3.Connection,
+    q: str,
+    where_sql: str,
+    params: list,
+    page: int,
+    page_size: int,
+    with_total: bool = False,
+) -> dict:
+    """
+    搜索任务提示词
+
+    Args:
+        q: 搜索文本，空白分隔的多个词为 AND
+        where_sql, params: 其他筛选条件（tasks 列，不带表前缀）
+
+    Returns:
+        {"items": [...每项带 snippet/score], "has_more": bool, "total": int|None, "matches": int|None,
+         "truncated": bool, "mode": "fts"|"like"}
+        fts 模式下分页只覆盖候选窗口：total 为可分页访问的条数（不超过 SEARCH_CANDIDATES），
+        matches 为全部命中数，truncated 表示有更早的命中在窗口之外；total / matches 只在 with_total 时计算
+    """
+    terms = split_terms(q)
+    if not terms:
+        raise ValueError("搜索内容不能为空")
+    offset = (page - 1) * page_size
+
+    if all(len(term) >= MIN_TERM_LENGTH for term in terms):
+        match = build_match_query(terms)
+        # 候选集: 最新的 SEARCH_CANDIDATES 条命中。FTS5 按 rowid 倒序遍历倒排表，到达上限即停止
+        candidates = conn.execute(f"""
+            SELECT tasks.id, tasks.prompt
+            FROM tasks_fts
+            JOIN tasks ON tasks.id = tasks_fts.rowid
+            WHERE tasks_fts MATCH ? AND {where_sql}
+            ORDER BY tasks_fts.rowid DESC
+            LIMIT ?
+        """, [match] + list(params) + [SEARCH_CANDIDATES + 1]).fetchall()
+        # 多取一条判断窗口外是否还有命中
+        truncated = len(candidates) > SEARCH_CANDIDATES
+        candidates = candidates[:SEARCH_CANDIDATES]
+
+        scored = score_candidates(candidates, terms)
+        page_ids = [task_id for task_id, _ in scored[offset:offset + page_size]]
+        has_more = len(scored) > offset + page_size
+
+        items = []
+        if page_ids:
+            placeholders = ", ".join("?" * len(page_ids))
+            rows = {
+                row["id"]: dict(row)
+                for row in conn.execute(f"SELECT * FROM tasks WHERE id IN ({placeholders})", page_ids)
+            }
+            # 只为当前页生成高亮片段
+            snippets = dict(conn.execute(f"""
+                SELECT rowid, snippet(tasks_fts, 0, ?, ?, ?, ?)
+                FROM tasks_fts
+                WHERE tasks_fts MATCH ? AND rowid IN ({placeholders})
+            """, [SNIPPET_OPEN, SNIPPET_CLOSE, SNIPPET_ELLIPSIS, SNIPPET_TOKENS, match] + page_ids).fetchall())
+            for task_id, score in scored[offset:offset + page_size]:
+                item = rows.get(task_id)
+                if item is None:
+                    continue
+                item["snippet"] = snippets.get(task_id, "")
+                item["score"] = round(score, 4)
+                items.append(item)
+
+        total = None
+        matches = None
+        if with_total:
+            total = len(scored)
+            if not truncated:
+                matches = total
+            elif where_sql == "1=1":
+                matches = conn.execute(
+                    "SELECT COUNT(*) FROM tasks_fts WHERE tasks_fts MATCH ?", (match,)
+                ).fetchone()[0]
+            else:
+                matches = conn.execute(f"""
+                    SELECT COUNT(*) FROM tasks_fts
+                    JOIN tasks ON tasks.id = tasks_fts.rowid
+                    WHERE tasks_fts MATCH ? AND {where_sql}
+                """, [match] + list(params)).fetchone()[0]
+        mode = "fts"
+    else:
+        like_clauses, like_params = _like_clauses(terms)
+        rows = conn.execute(f"""
+            SELECT * FROM tasks
+            WHERE {like_clauses} AND {where_sql}
+            ORDER BY created_ms DESC, id DESC
+            LIMIT ? OFFSET ?
+        """, like_params + list(params) + [page_size + 1, offset]).fetchall()
+        total = None
+        if with_total:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM tasks WHERE {like_clauses} AND {where_sql}",
+                like_params + list(params),
+            ).fetchone()[0]
+        matches = total
+        truncated = False
+        mode = "like"
+        has_more = len(rows) > page_size
+        items = []
+        for row in rows[:page_size]:
+            item = dict(row)
+            item["snippet"] = _highlight(item.get("prompt") or "", terms)
+            item["score"] = None
+            items.append(item)
+
+    return {
+        "items": items,
+        "has_more": has_more,
+        "total": total,
+        "matches": matches,
+        "truncated": truncated,
+        "mode": mode,
+    }
+
+
+def rebuild_index(conn: sqlite3.Connection):
+    """从 tasks 重建全文索引"""
+    conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+
+if __name__ == "__main__":
+    import argparse
+    from db_manager import get_db
+    from db_migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="任务提示词全文搜索")
+    parser.add_argument("query", nargs="?", help="搜索内容")
+    parser.add_argument("--rebuild", action="store_true", help="重建全文索引")
+    parser.add_argument("--limit", type=int, default=20, help="返回条数")
+    args = parser.parse_args()
+
+    with get_db() as conn:
+        run_migrations(conn)
+
+        if args.rebuild:
+            rebuild_index(conn)
+            conn.commit()
+            print("[搜索] 全文索引已重建")
+
+        if args.query:
+            result = search_tasks(conn, args.query, "1=1", [], 1, args.limit)
+            for item in result["items"]:
+                print(f"{item['task_id']:<30} {item['snippet']}")
@@ -0,0 +1,296 @@
+"""
+任务统计计数表
+task_stats 表由 tasks 上的触发器实时维护（见 db_migrations），/api/tasks/stats 直接读取计数，
+与任务总量无关；本模块负责读取、校验与重建
+
+维度:
+    total    -> key 为空字符串
+    status   -> key 为任务状态
+    type     -> key 为任务类型
+    account  -> key 为账户 ID，credits 为该账户累计消耗积分
+    day      -> key 为统计时区（ADMIN_TIMEZONE）的日期 YYYY-MM-DD，/api/tasks/stats 的今日计数直接读取
+按日计数的日期由 task_stats_days 中预先生成的自然日边界确定（触发器中无法做时区换算），
+边界由定时任务每天向后补齐（extend_stats_days），统计时区变更时重新生成并重建计数表
+
+用法:
+    python task_stats.py --verify   # 从 tasks 重新计算并与计数表比对，有偏差时返回非 0
+    python task_stats.py --rebuild  # 从 tasks 重新计算并覆盖计数表
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from timeutil import STATS_TZ, day_range_ms
+
+# task_stats_days 预先生成到今天之后的天数
+STATS_DAYS_AHEAD = 400
+
+
+def stats_day_sql(created_ms: str) -> str:
+    """
+    created_ms 所在统计时区日期的 SQL 表达式（不在 task_stats_days 范围内时为空字符串）
+
+    按 start_ms 主键倒序取一行，与表的大小无关
+    """
+    return f"""COALESCE((
+                SELECT CASE WHEN d.end_ms > {created_ms} THEN d.day END
+                FROM task_stats_days d WHERE d.start_ms <= {created_ms}
+                ORDER BY d.start_ms DESC LIMIT 1
+            ), '')"""
+
+
+# 维度 -> 从 tasks 全量计算该维度的 SQL（返回 key, count, credits）
+# 必须与 db_migrations 中触发器的分组表达式保持一致
+DIMENSION_QUERIES = {
+    "total": "SELECT '', COUNT(*), COALESCE(SUM(credits_used), 0) FROM tasks",
+    "status": "SELECT COALESCE(status, ''), COUNT(*), COALESCE(SUM(credits_used), 0) FROM tasks GROUP BY 1",
+    "type": "SELECT COALESCE(task_type, ''), COUNT(*), COALESCE(SUM(credits_used), 0) FROM tasks GROUP BY 1",
+    "account": "SELECT COALESCE(CAST(account_id AS TEXT), ''), COUNT(*), COALESCE(SUM(credits_used), 0) FROM tasks GROUP BY 1",
+    "day": f"SELECT {stats_day_sql('t.created_ms')}, COUNT(*), COALESCE(SUM(t.credits_used), 0) FROM tasks t GROUP BY 1",
+}
+
+StatsMap = Dict[Tuple[str, str], Tuple[int, int]]
+
+
+def today_key() -> str:
+    """统计时区的今天（按日维度的 key）"""
+    return datetime.now(STATS_TZ).date().isoformat()
+
+
+def extend_stats_days(conn: sqlite3.Connection, ahead: int = STATS_DAYS_AHEAD) -> bool:
+    """
+    补齐 task_stats_days 的自然日边界：从最早的任务所在日到今天之后 ahead 天
+
+    表中覆盖今天的边界与当前统计时区不一致（ADMIN_TIMEZONE 已变更）时清空重新生成；
+    重新生成或补入了更早的日期时重建计数表，否则已计入空 key 的任务不会归到正确的日期
+
+    Returns:
+        是否重建了计数表
+    """
+    today_start, today_end = day_range_ms()
+    row = conn.execute(
+        "SELECT start_ms, end_ms FROM task_stats_days WHERE start_ms <= ? ORDER BY start_ms DESC LIMIT 1",
+        (today_start,),
+    ).fetchone()
+    reset = row is not None and row[1] > today_start and tuple(row) != (today_start, today_end)
+    if reset:
+        conn.execute("DELETE FROM task_stats_days")
+    first_day = conn.execute("SELECT MIN(start_ms) FROM task_stats_days").fetchone()[0]
+
+    first_task = conn.execute("SELECT MIN(created_ms) FROM tasks").fetchone()[0]
+    day = datetime.fromtimestamp(min(first_task or today_start, today_start) / 1000, STATS_TZ)
+    last = datetime.now(STATS_TZ) + timedelta(days=ahead)
+    rows = []
+    while day <= last:
+        start, end = day_range_ms(day)
+        rows.append((start, end, day.date().isoformat()))
+        day = datetime.fromtimestamp(end / 1000, STATS_TZ)
+    conn.executemany("INSERT OR IGNORE INTO task_stats_days (start_ms, end_ms, day) VALUES (?, ?, ?)", rows)
+
+    rebuild = reset or (first_day is not None and rows[0][0] < first_day)
+    if rebuild:
+        rebuild_task_stats(conn)
+    return rebuild
+
+
+def compute_task_stats(conn: sqlite3.Connection, dimensions: Iterable[str] = DIMENSION_QUERIES) -> StatsMap:
+    """从 tasks 全量计算指定维度（默认全部）的计数"""
+    stats = {}
+    for dimension in dimensions:
+        sql = DIMENSION_QUERIES[dimension]
+        for key, count, credits in conn.execute(sql).fetchall():
+            if count:
+                stats[(dimension, key)] = (count, credits)
+    return stats
+
+
+def read_task_stats(conn: sqlite3.Connection, exclude_days: bool = False) -> StatsMap:
+    """读取计数表（忽略计数为 0 的行），exclude_days 时不读取随天数增长的按日维度"""
+    sql = "SELECT dimension, key, count, credits FROM task_stats"
+    if exclude_days:
+        # 用 IN 按主键前缀查找，不扫描按日维度的行
+        sql += " WHERE dimension IN ('total', 'status', 'type', 'account')"
+    rows = conn.execute(sql).fetchall()
+    return {
+        (dimension, key): (count, credits)
+        for dimension, key, count, credits in rows
+        if count or credits
+    }
+
+
+def verify_task_stats(conn: sqlite3.Connection) -> List[dict]:
+    """
+    比对计数表与全量计算结果
+
+    Returns:
+        偏差列表，为空表示计数准确
+    """
+    expected = compute_task_stats(conn)
+    actual = read_task_stats(conn)
+
+    drift = []
+    for dimension_key in sorted(set(expected) | set(actual)):
+        exp = expected.get(dimension_key, (0, 0))
+        act = actual.get(dimension_key, (0, 0))
+        if exp != act:
+            drift.append({
+                "dimension": dimension_key[0],
+                "key": dimension_key[1],
+                "expected": {"count": exp[0], "credits": exp[1]},
+                "actual": {"count": act[0], "credits": act[1]},
+            })
+    return drift
+
+
+def rebuild_task_stats(conn: sqlite3.Connection, dimensions: Iterable[str] = DIMENSION_QUERIES) -> int:
+    """从 tasks 重新计算并覆盖计数表，返回写入的行数"""
+    stats = compute_task_stats(conn, dimensions)
+    conn.execute("DELETE FROM task_stats")
+    conn.executemany(
+        "INSERT INTO task_stats (dimension, key, count, credits) VALUES (?, ?, ?, ?)",
+        [(dimension, key, count, credits) for (dimension, key), (count, credits) in stats.items()],
+    )
+    return len(stats)
+
+
+def load_summary(conn: sqlite3.Connection) -> dict:
+    """读取 /api/tasks/stats 所需的汇总数据（按日维度只读取今天一行）"""
+    stats = read_task_stats(conn, exclude_days=True)
+    row = conn.execute(
+        "SELECT count FROM task_stats WHERE dimension = 'day' AND key = ?", (today_key(),)
+    ).fetchone()
+    today_count = row[0] if row else 0
+
+    by_status = {}
+    by_type = {}
+    by_account = {}
+    for (dimension, key), (count, credits) in stats.items():
+        if dimension == "status":
+            by_status[key] = count
+        elif dimension == "type":
+            by_type[key] = count
+        elif dimension == "account" and key:
+            by_account[key] = {"count": count, "credits_used": credits}
+
+    total, total_credits = stats.get(("total", ""), (0, 0))
+
+    return {
+        "total": total,
+        "today": today_count,
+        "by_status": by_status,
+        "by_type": by_type,
+        "by_account": by_account,
+        "total_credits_used": total_credits,
+    }
+
+
+def summary_delta(before: Optional[tuple], after: tuple) -> dict:
+    """
+    单个任务变化对 load_summary 结果的增量（只包含变化的字段），供事件推送
+
+    Args:
+        before: 变化前的 (status, task_type, account_id, credits_used)，新建任务为 None
+        after: 变化后的 (status, task_type, account_id, credits_used)
+    """
+    delta = {"total": 0, "today": 0, "by_status": {}, "by_type": {}, "by_account": {}, "total_credits_used": 0}
+
+    def apply(row: tuple, sign: int):
+        status, task_type, account_id, credits = row
+        credits = credits or 0
+        delta["total_credits_used"] += sign * credits
+        delta["by_status"][status or ""] = delta["by_status"].get(status or "", 0) + sign
+        delta["by_type"][task_type or ""] = delta["by_type"].get(task_type or "", 0) + sign
+        if account_id is not None:
+            entry = delta["by_account"].setdefault(str(account_id), {"count": 0, "credits_used": 0})
+            entry["count"] += sign
+            entry["credits_used"] += sign * credits
+
+    if before is None:
+        delta["total"] = delta["today"] = 1
+    else:
+        apply(before, -1)
+    apply(after, 1)
+
+    delta["by_status"] = {key: value for key, value in delta["by_status"].items() if value}
+    delta["by_type"] = {key: value for key, value in delta["by_type"].items() if value}
+    delta["by_account"] = {key: value for key, value in delta["by_account"].items() if value["count"] or value["credits_used"]}
+    return {key: value for key, value in delta.items() if value}
+
+
+def count_range(conn: sqlite3.Connection, start_ms: int, end_ms: int) -> int:
+    """[start_ms, end_ms) 内的任务数（走 created_ms 索引范围扫描）"""
+    return conn.execute(
+        "SELECT COUNT(*) FROM tasks WHERE created_ms >= ? AND created_ms < ?",
+        (start_ms, end_ms),
+    ).fetchone()[0]
+
+
+def load_range_summary(conn: sqlite3.Connection, start_ms: Optional[int], end_ms: Optional[int]) -> dict:
+    """按时间范围 [start_ms, end_ms) 聚合统计，字段与 load_summary 相同"""
+    start_ms = start_ms if start_ms is not None else 0
+    end_ms = end_ms if end_ms is not None else 2 ** 62
+    rows = conn.execute("""
+        SELECT status, task_type, account_id, COUNT(*), COALESCE(SUM(credits_used), 0)
+        FROM tasks
+        WHERE created_ms >= ? AND created_ms < ?
+        GROUP BY status, task_type, account_id
+    """, (start_ms, end_ms)).fetchall()
+
+    total = 0
+    total_credits = 0
+    by_status = {}
+    by_type = {}
+    by_account = {}
+    for status, task_type, account_id, count, credits in rows:
+        total += count
+        total_credits += credits
+        by_status[status or ""] = by_status.get(status or "", 0) + count
+        by_type[task_type or ""] = by_type.get(task_type or "", 0) + count
+        if account_id is not None:
+            entry = by_account.setdefault(str(account_id), {"count": 0, "credits_used": 0})
+            entry["count"] += count
+            entry["credits_used"] += credits
+
+    today_start, today_end = day_range_ms()
+    return {
+        "total": total,
+        "today": count_range(conn, max(start_ms, today_start), min(end_ms, today_end)),
+        "by_status": by_status,
+        "by_type": by_type,
+        "by_account": by_account,
+        "total_credits_used": total_credits,
+        "from": start_ms,
+        "to": end_ms,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    from db_manager import get_db
+    from db_migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="任务统计计数表校验/重建")
+    parser.add_argument("--verify", action="store_true", help="校验计数表，有偏差时返回非 0")
+    parser.add_argument("--rebuild", action="store_true", help="重建计数表")
+    args = parser.parse_args()
+
+    with get_db() as conn:
+        run_migrations(conn)
+
+        if args.rebuild:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = rebuild_task_stats(conn)
+            conn.commit()
+            print(f"[统计] 计数表已重建，共 {rows} 行")
+
+        drift = verify_task_stats(conn)
+        if not drift:
+            print("[统计] 计数表与 tasks 一致")
+        else:
+            print(f"[统计] 发现 {len(drift)} 处偏差:")
+            for item in drift:
+                print(f"  {item['dimension']}:{item['key'] or '-'}  期望 {item['expected']}  实际 {item['actual']}")
+            if args.verify:
+                sys.exit(1)
@@ -0,0 +1,101 @@
+"""积分预留租约测试（reserve_credits / commit_lease / release_lease / expire_leases）"""
+
+from account_manager import commit_lease, expire_leases, release_lease, reserve_credits
+from db_manager import get_db
+
+
+def _add_account(account_id: int, credits: int):
+    with get_db() as conn:
+        conn.execute(
+            "INSERT INTO accounts (id, credits, gift_credit, region) VALUES (?, ?, ?, 'us')",
+            (account_id, credits, credits),
+        )
+
+
+def _account(account_id: int) -> dict:
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT credits, reserved, in_flight FROM accounts WHERE id = ?", (account_id,)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def _lease_count() -> int:
+    with get_db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM account_leases").fetchone()[0]
+
+
+def test_reserve_and_commit(db):
+    """预留计入 reserved / in_flight，提交时撤销预留并按实际消耗扣积分"""
+    _add_account(1, 100)
+
+    lease = reserve_credits(4)
+    assert lease["account_id"] == 1
+    assert _account(1) == {"credits": 100, "reserved": 4, "in_flight": 1}
+    assert _lease_count() == 1
+
+    assert commit_lease(lease, 4) is True
+    assert _account(1) == {"credits": 96, "reserved": 0, "in_flight": 0}
+    assert _lease_count() == 0
+
+
+def test_reservations_never_exceed_credits(db):
+    """可用积分按 credits - reserved 计算，同一份积分不会分给两个请求"""
+    _add_account(1, 8)
+
+    first = reserve_credits(4)
+    second = reserve_credits(4)
+    assert first["account_id"] == second["account_id"] == 1
+    assert reserve_credits(4) is None
+
+    assert release_lease(first) is True
+    assert release_lease(first) is False
+    third = reserve_credits(4)
+    assert third is not None
+    assert _account(1)["reserved"] == 8
+
+
+def test_failed_generation_releases_without_charge(db):
+    """生成失败时提交 0 积分，只撤销预留"""
+    _add_account(1, 20)
+
+    lease = reserve_credits(4)
+    assert commit_lease(lease, 0) is True
+    assert _account(1) == {"credits": 20, "reserved": 0, "in_flight": 0}
+
+
+def test_expired_lease_is_released(db):
+    """超时的租约由 expire_leases 释放；之后提交仍扣除实际消耗，但不会重复撤销预留"""
+    _add_account(1, 100)
+
+    lease = reserve_credits(4, ttl=0)
+    assert expire_leases() == 1
+    assert _account(1) == {"credits": 100, "reserved": 0, "in_flight": 0}
+
+    assert commit_lease(lease, 4) is False
+    assert _account(1) == {"credits": 96, "reserved": 0, "in_flight": 0}
+
+
+def test_expired_leases_freed_by_next_reservation(db):
+    """下一次预留先释放超时的租约，崩溃进程留下的预留不会永久占用积分"""
+    _add_account(1, 4)
+
+    reserve_credits(4, ttl=0)
+    lease = reserve_credits(4)
+    assert lease is not None
+    assert _account(1)["reserved"] == 4
+    assert _lease_count() == 1
+
+
+def test_pinned_account(db):
+    """指定账户时不检查可用积分；.env 中有但账户表中没有的账户先写入账户表，都没有时返回 None"""
+    _add_account(1, 0)
+
+    lease = reserve_credits(4, account_id=1)
+    assert lease["account_id"] == 1
+    assert _account(1)["reserved"] == 4
+
+    assert reserve_credits(4, account_id=6) is None
+    lease = reserve_credits(4, account_id=6, env_account={"region": "us", "token": "us-" + "0" * 32})
+    assert lease["account_id"] == 6
+    assert _account(6) == {"credits": 0, "reserved": 4, "in_flight": 1}
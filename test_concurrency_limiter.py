@@ -0,0 +1,166 @@
+"""生成请求并发限制测试（执行道排队顺序、调用方公平排队、优先级老化、全局上限）"""
+
+import asyncio
+
+from concurrency_limiter import ConcurrencyLimiter
+
+
+async def _enqueue(limiter: ConcurrencyLimiter, requests) -> list:
+    """依次发起 (lane, caller, priority) 请求，每个进入排队后再发下一个"""
+    tasks = []
+    for lane, caller, priority in requests:
+        tasks.append(asyncio.create_task(limiter.acquire(lane, caller, priority)))
+        await asyncio.sleep(0)
+    return tasks
+
+
+async def _drain(limiter: ConcurrencyLimiter, tasks: list) -> list:
+    """每次归还一个已获得名额的请求，返回获得名额的调用方顺序（执行道上限为 1）"""
+    order = []
+    pending = list(tasks)
+    while pending:
+        done = [task for task in pending if task.done()]
+        assert len(done) == 1
+        slot = done[0].result()
+        pending.remove(done[0])
+        order.append(slot.caller)
+        limiter.release(slot)
+        await asyncio.sleep(0)
+    return order
+
+
+def _limiter(**kwargs) -> ConcurrencyLimiter:
+    options = {"lane_limits": {"image": 1}, "global_limit": 0, "weights": {}, "aging": 0}
+    options.update(kwargs)
+    return ConcurrencyLimiter(**options)
+
+
+def test_callers_interleave():
+    """一个调用方排了大量请求时，后到的调用方不用等它全部执行完"""
+    async def main():
+        limiter = _limiter()
+        hold = await limiter.acquire("image", "batch")
+        tasks = await _enqueue(limiter, [("image", "batch", "normal")] * 4 + [("image", "dashboard", "normal")])
+        limiter.release(hold)
+        await asyncio.sleep(0)
+        return await _drain(limiter, tasks)
+
+    assert asyncio.run(main()) == ["dashboard", "batch", "batch", "batch", "batch"]
+
+
+def test_caller_weights():
+    """权重 2 的调用方获得名额的次数约为权重 1 的两倍"""
+    async def main():
+        limiter = _limiter(weights={"a": 2})
+        hold = await limiter.acquire("image", "hold")
+        tasks = await _enqueue(limiter, [("image", "a", "normal")] * 4 + [("image", "b", "normal")] * 2)
+        limiter.release(hold)
+        await asyncio.sleep(0)
+        return await _drain(limiter, tasks)
+
+    assert asyncio.run(main()) == ["a", "a", "b", "a", "a", "b"]
+
+
+def test_priority_order():
+    """高优先级先执行，同优先级按到达顺序"""
+    async def main():
+        limiter = _limiter()
+        hold = await limiter.acquire("image", "hold")
+        tasks = await _enqueue(limiter, [
+            ("image", "bulk", "bulk"),
+            ("image", "normal", "normal"),
+            ("image", "interactive", "interactive"),
+        ])
+        limiter.release(hold)
+        await asyncio.sleep(0)
+        return await _drain(limiter, tasks)
+
+    assert asyncio.run(main()) == ["interactive", "normal", "bulk"]
+
+
+def test_priority_aging():
+    """排队足够久的低优先级请求提升到最高级，不会被后到的高优先级请求饿死"""
+    async def main():
+        limiter = _limiter(aging=0.05)
+        hold = await limiter.acquire("image", "hold")
+        tasks = await _enqueue(limiter, [("image", "bulk", "bulk")])
+        await asyncio.sleep(0.12)
+        tasks += await _enqueue(limiter, [("image", "interactive", "interactive")])
+        limiter.release(hold)
+        await asyncio.sleep(0)
+        return await _drain(limiter, tasks)
+
+    assert asyncio.run(main()) == ["bulk", "interactive"]
+
+
+def test_caller_state_pruned():
+    """调用方没有排队或执行中的请求后，其公平排队状态被删除（包括取消的排队请求）"""
+    async def main():
+        limiter = _limiter()
+        lane = limiter._lanes["image"]
+        hold = await limiter.acquire("image", "hold")
+        tasks = await _enqueue(limiter, [("image", f"caller-{i}", "normal") for i in range(5)])
+        tasks[0].cancel()
+        await asyncio.gather(tasks[0], return_exceptions=True)
+        assert "caller-0" not in lane.finish
+
+        limiter.release(hold)
+        await asyncio.sleep(0)
+        await _drain(limiter, tasks[1:])
+        return lane.finish, lane.pending, limiter.snapshot()
+
+    finish, pending, snapshot = asyncio.run(main())
+    assert finish == {}
+    assert pending == {}
+    assert snapshot["active"] == 0
+    assert snapshot["by_caller"] == {}
+
+
+def test_global_limit_across_lanes():
+    """各道名额之和超过全局上限时，合计执行数不超过全局上限；名额空出后给其他道排队的请求"""
+    async def main():
+        limiter = _limiter(lane_limits={"image": 3, "video": 2}, global_limit=4)
+        images = await _enqueue(limiter, [("image", "a", "normal")] * 3)
+        videos = await _enqueue(limiter, [("video", "b", "normal")] * 2)
+        granted = [task.done() for task in images + videos]
+        active = limiter.snapshot()["active"]
+
+        limiter.release(images[0].result())
+        await asyncio.sleep(0)
+        return granted, active, videos[1].done(), limiter.snapshot()["active"]
+
+    granted, active, last_video_granted, active_after = asyncio.run(main())
+    assert granted == [True, True, True, True, False]
+    assert active == 4
+    assert last_video_granted
+    assert active_after == 4
+
+
+def test_lanes_isolated():
+    """图片道排满时视频请求仍能立即执行"""
+    async def main():
+        limiter = _limiter(lane_limits={"image": 1, "video": 1}, global_limit=4)
+        await limiter.acquire("image", "a")
+        queued = await _enqueue(limiter, [("image", "a", "normal")] * 3)
+        video = await asyncio.wait_for(limiter.acquire("video", "b"), 1)
+        return [task.done() for task in queued], video.lane
+
+    queued, lane = asyncio.run(main())
+    assert queued == [False, False, False]
+    assert lane == "video"
+
+
+def test_global_slot_by_priority_across_lanes():
+    """全局名额空出时，在各道排在最前的请求中按优先级选择"""
+    async def main():
+        limiter = _limiter(lane_limits={"image": 2, "video": 2}, global_limit=2)
+        hold = await limiter.acquire("image", "a")
+        await limiter.acquire("video", "b")
+        image = await _enqueue(limiter, [("image", "a", "normal")])
+        video = await _enqueue(limiter, [("video", "b", "interactive")])
+
+        limiter.release(hold)
+        await asyncio.sleep(0)
+        return image[0].done(), video[0].done()
+
+    assert asyncio.run(main()) == (False, True)
@@ -0,0 +1,45 @@
+"""数据库迁移与关键查询执行计划测试"""
+
+import shutil
+import sqlite3
+from pathlib import Path
+
+from db_manager import get_db
+from db_migrations import MIGRATIONS, check_query_plans, get_schema_version, run_migrations
+from task_stats import verify_task_stats
+
+# 仓库自带的旧版数据库（迁移框架之前的表结构）
+REPO_DB = Path(__file__).parent / "data.db"
+LATEST_VERSION = max(version for version, _, _ in MIGRATIONS)
+
+
+def test_query_plans_use_indexes(db):
+    """QUERY_PLAN_CHECKS 中的查询都走索引，没有全表扫描或额外排序"""
+    with get_db() as conn:
+        assert check_query_plans(conn) == []
+
+
+def test_migrate_existing_data_db(tmp_path, monkeypatch):
+    """已有数据的 data.db 升级到最新版本后数据不变，派生的计数表与 tasks 一致"""
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "data.db"
+    shutil.copy(REPO_DB, path)
+
+    conn = sqlite3.connect(path)
+    try:
+        tasks_sql = "SELECT task_id, account_id, task_type, prompt, status, credits_used FROM tasks ORDER BY id"
+        tasks = conn.execute(tasks_sql).fetchall()
+        credit_logs = conn.execute("SELECT COUNT(*) FROM credit_logs").fetchone()[0]
+
+        run_migrations(conn)
+
+        assert get_schema_version(conn) == LATEST_VERSION
+        assert conn.execute(tasks_sql).fetchall() == tasks
+        assert conn.execute("SELECT COUNT(*) FROM credit_logs").fetchone()[0] == credit_logs
+        assert conn.execute("SELECT COUNT(*) FROM tasks WHERE created_ms IS NULL").fetchone()[0] == 0
+        assert verify_task_stats(conn) == []
+        assert check_query_plans(conn) == []
+        # 再次执行不会重复应用
+        assert run_migrations(conn) == []
+    finally:
+        conn.close()
@@ -0,0 +1,95 @@
+"""
+时间工具
+毫秒时间戳、可配置时区的自然日边界、查询参数解析
+"""
+
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Optional, Tuple
+
+# 统计使用的时区，支持 IANA 名称（Asia/Shanghai）或固定偏移（+08:00 / UTC+8）
+# 默认与 account_manager 的每日重置一致，使用 UTC+8
+DEFAULT_TIMEZONE = "+08:00"
+
+_OFFSET_RE = re.compile(r"^(?:UTC|GMT)?([+-])(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+
+
+def parse_timezone(name: str) -> tzinfo:
+    """解析时区配置"""
+    name = (name or "").strip()
+    if name.upper() in ("UTC", "GMT", "Z"):
+        return timezone.utc
+
+    match = _OFFSET_RE.match(name)
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        return timezone(-offset if sign == "-" else offset)
+
+    from zoneinfo import ZoneInfo
+    return ZoneInfo(name)
+
+
+def _load_timezone() -> tzinfo:
+    name = os.getenv("ADMIN_TIMEZONE", DEFAULT_TIMEZONE)
+    try:
+        return parse_timezone(name)
+    except Exception as e:
+        print(f"[时间] 无法解析时区 {name!r} ({e})，使用 {DEFAULT_TIMEZONE}")
+        return parse_timezone(DEFAULT_TIMEZONE)
+
+
+# 统计时区
+STATS_TZ = _load_timezone()
+
+
+def now_ms() -> int:
+    """当前毫秒时间戳"""
+    return int(time.time() * 1000)
+
+
+def to_ms(dt: datetime) -> int:
+    """datetime 转毫秒时间戳（无时区的 datetime 视为统计时区）"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=STATS_TZ)
+    return int(dt.timestamp() * 1000)
+
+
+def day_range_ms(day: Optional[datetime] = None) -> Tuple[int, int]:
+    """
+    统计时区下某一天的 [开始, 结束) 毫秒时间戳
+
+    Args:
+        day: 该天内任意时刻，默认今天
+    """
+    day = (day or datetime.now(STATS_TZ)).astimezone(STATS_TZ)
+    start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+    # 带时区 datetime 的加法按墙上时间计算，夏令时切换日也是次日零点
+    next_day = start + timedelta(days=1)
+    return to_ms(start), to_ms(next_day)
+
+
+def parse_time_param(value: Optional[str]) -> Optional[int]:
+    """
+    解析 from/to 查询参数为毫秒时间戳
+
+    支持:
+        1760000000000            毫秒时间戳
+        2026-10-17               统计时区当天零点
+        2026-10-17T08:30:00      统计时区时间
+        2026-10-17T08:30:00+00:00 带时区时间
+
+    Raises:
+        ValueError: 格式无效
+    """
+    if value is None or value == "":
+        return None
+    value = value.strip()
+    if value.lstrip("-").isdigit():
+        return int(value)
+    try:
+        return to_ms(datetime.fromisoformat(value.replace("Z", "+00:00")))
+    except ValueError:
+        raise ValueError(f"无效的时间参数: {value}")